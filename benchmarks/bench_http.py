@@ -0,0 +1,146 @@
+"""
+Connection reuse benchmark for the shared OpenAI HTTP pool.
+
+Starts a local stand-in for the OpenAI API (an HTTP/1.1 keep-alive
+    server answering every POST with a small embeddings response,
+    behind TLS with a throwaway self-signed certificate unless --no-tls)
+    and sends --calls embeddings requests through the real openai
+    client, as each consumer of trtl.models.http would:
+
+    separate   every call builds its own client, the old behaviour of a
+               consumer that did not share (a handshake per call)
+    shared     every call goes through one pooled client from
+               trtl.models.http.new_client
+
+Reports latency per call, the first call separately (it pays for the
+    connection either way), and the pool's connection counters.
+    Prints a JSON report.
+
+    python benchmarks/bench_http.py --calls 200
+"""
+
+import argparse
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+
+from trtl.models.http import ConnectionCounters, new_client
+
+RESPONSE = json.dumps(
+    {
+        "object": "list",
+        "data": [{"object": "embedding", "index": 0, "embedding": [0.0] * 8}],
+        "model": "text-embedding-3-small",
+        "usage": {"prompt_tokens": 1, "total_tokens": 1},
+    }
+).encode()
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, without this each
+    # response waits out the client's delayed ack
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def certificate(directory: str):
+    """a self-signed certificate for 127.0.0.1, made with the openssl cli"""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", key, "-out", cert, "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )  # fmt: skip
+    return cert, key
+
+
+def serve(tls_files):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    if tls_files:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*tls_files)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheme = "https" if tls_files else "http"
+    return server, f"{scheme}://127.0.0.1:{server.server_port}/v1"
+
+
+def run(mode: str, base_url: str, calls: int, verify) -> dict:
+    counters = ConnectionCounters()
+    shared = new_client(counters, verify=verify)
+    latencies = []
+    for _ in range(calls):
+        http = shared if mode == "shared" else new_client(counters, verify=verify)
+        client = openai.OpenAI(
+            api_key="sk-bench", base_url=base_url, http_client=http, max_retries=0
+        )
+        started = time.perf_counter()
+        client.embeddings.create(model="text-embedding-3-small", input="hello")
+        latencies.append((time.perf_counter() - started) * 1000)
+        if http is not shared:
+            http.close()
+    shared.close()
+    rest = sorted(latencies[1:])
+    return {
+        "first_ms": round(latencies[0], 3),
+        "mean_ms": round(statistics.fmean(rest), 3),
+        "p50_ms": round(rest[len(rest) // 2], 3),
+        "p95_ms": round(rest[int(len(rest) * 0.95)], 3),
+        **counters.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--no-tls", action="store_true", help="plain http")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        tls_files = None if args.no_tls else certificate(directory)
+        server, base_url = serve(tls_files)
+        verify = tls_files[0] if tls_files else True
+        report = {
+            "calls": args.calls,
+            "tls": tls_files is not None,
+            "separate": run("separate", base_url, args.calls, verify),
+            "shared": run("shared", base_url, args.calls, verify),
+        }
+        server.shutdown()
+    report["mean_speedup"] = round(
+        report["separate"]["mean_ms"] / report["shared"]["mean_ms"], 2
+    )
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Streaming render benchmark for the CLI response box.
+
+Streams a synthetic markdown answer (prose, lists and fenced code)
+    token by token and times the work the CLI does for it: appending
+    the token and, at the display's refresh rate, building and laying
+    out the panel for a --height line terminal, plus the full final
+    print. The naive path is what the box used to do, a full
+    Markdown of the whole text per token. It stops after --naive-budget
+    seconds and reports how far it got. Prints a JSON report.
+
+    python benchmarks/bench_render.py --tokens 50000
+"""
+
+import argparse
+import io
+import json
+import random
+import time
+
+from rich.console import Console
+from rich.markdown import Markdown
+from rich.panel import Panel
+
+from trtl.cli.render import IncrementalMarkdown
+
+WORDS = (
+    "the agent streams tokens into a box while the model explains how "
+    "to resize every image in a folder with convert and then check "
+    "the output sizes before moving them somewhere safe"
+).split()
+
+CODE = [
+    "for f in *.png; do",
+    '  convert "$f" -resize 50% "small/$f"',
+    "done",
+    "ls -la small | sort -k5 -n",
+]
+
+
+def document(tokens: int, seed: int = 0) -> list:
+    """a markdown answer cut into roughly `tokens` token sized chunks"""
+    rng = random.Random(seed)
+    chunks: list = []
+    while len(chunks) < tokens:
+        kind = rng.random()
+        if kind < 0.15:
+            chunks += ["## ", "Step ", f"{len(chunks)}", "\n\n"]
+        elif kind < 0.35:
+            chunks += ["```", "bash", "\n"]
+            for line in rng.sample(CODE, 3):
+                chunks += [word + " " for word in line.split()] + ["\n"]
+            chunks += ["```", "\n\n"]
+        elif kind < 0.5:
+            for _ in range(rng.randint(2, 5)):
+                chunks += ["- "] + [" " + rng.choice(WORDS) for _ in range(8)]
+                chunks += ["\n"]
+            chunks += ["\n"]
+        else:
+            chunks += [" " + rng.choice(WORDS) for _ in range(rng.randint(20, 60))]
+            chunks += [".", "\n\n"]
+    return chunks[:tokens]
+
+
+def stream(chunks, render_every: int, height: int, budget: float, naive: bool) -> dict:
+    console = Console(file=io.StringIO(), width=100, force_terminal=True)
+    response = IncrementalMarkdown()
+    text = ""
+    started = time.perf_counter()
+    done = 0
+    for i, chunk in enumerate(chunks, 1):
+        if naive:
+            text += chunk
+            content = Markdown(text)
+        else:
+            response.append(chunk)
+        if i % render_every == 0 or i == len(chunks):
+            if not naive:
+                # the final print lays out all of it
+                content = response.renderable(None if i == len(chunks) else height)
+            console.render_lines(Panel(content), console.options)
+        done = i
+        if time.perf_counter() - started > budget:
+            break
+    seconds = time.perf_counter() - started
+    return {
+        "tokens": done,
+        "completed": done == len(chunks),
+        "seconds": round(seconds, 3),
+        "us_per_token": round(seconds / done * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=50000)
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=100,
+        help="stream rate, sets how many tokens arrive between refreshes",
+    )
+    parser.add_argument("--refresh-per-second", type=float, default=10)
+    parser.add_argument("--height", type=int, default=50, help="terminal lines")
+    parser.add_argument("--naive-budget", type=float, default=30)
+    parser.add_argument("--skip-naive", action="store_true")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    chunks = document(args.tokens)
+    render_every = max(1, round(args.tokens_per_second / args.refresh_per_second))
+    report = {
+        "tokens": len(chunks),
+        "chars": sum(len(chunk) for chunk in chunks),
+        "render_every": render_every,
+        "incremental": stream(
+            chunks, render_every, args.height, float("inf"), naive=False
+        ),
+    }
+    if not args.skip_naive:
+        report["naive"] = stream(
+            chunks, render_every, args.height, args.naive_budget, naive=True
+        )
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
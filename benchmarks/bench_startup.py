@@ -0,0 +1,92 @@
+"""
+Cold start benchmark for trtl.
+
+Every sample runs in a fresh interpreter so nothing is already
+    imported or cached in-process. Prints a JSON report with the
+    median / min / max seconds per stage, so cold start can be
+    tracked as a number across changes.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# each stage is timed inside the child and printed as a single float
+STAGES = {
+    # the registry itself, names + descriptions + schemas only
+    "import_tools": "import trtl.tools",
+    # everything main() imports before the splash is printed
+    "import_main": "import trtl.main",
+    # the full agent, model client bound to the tools and graph compiled
+    "build_agent": "from trtl.agent import Agent; Agent()",
+    # first invocation of a lazy tool, pays for building its backing object
+    "first_tool_call": (
+        "from trtl.tools import terminal; terminal.invoke({'commands': ['true']})"
+    ),
+}
+
+CHILD = """
+import time
+t = time.perf_counter()
+{code}
+print(time.perf_counter() - t)
+"""
+
+
+def time_stage(code: str) -> float:
+    env = {**os.environ}
+    # constructing the clients only needs a key to be present
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env.setdefault("TAVILY_API_KEY", "tvly-benchmark")
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD.format(code=code)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def run(runs: int, stages) -> dict:
+    report = {}
+    for stage in stages:
+        try:
+            samples = [time_stage(STAGES[stage]) for _ in range(runs)]
+        except RuntimeError as e:
+            report[stage] = {"error": str(e)}
+            continue
+        report[stage] = {
+            "median_s": round(statistics.median(samples), 4),
+            "min_s": round(min(samples), 4),
+            "max_s": round(max(samples), 4),
+            "runs": runs,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--stage", action="append", choices=sorted(STAGES), help="repeatable"
+    )
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    report = run(args.runs, args.stage or list(STAGES))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
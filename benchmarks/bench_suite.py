@@ -0,0 +1,368 @@
+"""
+Offline benchmark suite, trtl's own overhead without OpenAI's latency.
+
+Runs the real Agent graph, the memory tools, EnhancedTerminal, the
+    persistent shell and stream_into_box against the stand-ins in
+    fakes.py (a scripted chat model, hashed local embeddings, canned
+    web tools), in a scratch directory, without network:
+
+    cold_start   import of trtl.main and a built Agent, fresh
+                 interpreters (bench_startup.py)
+    ingest       a synthetic tldr checkout through trtl-ingest's
+                 pipeline, and the no-op refresh after it
+    turns        one turn per kind (plain answer, web search,
+                 wikipedia, enhanced_terminal, memory save), the
+                 model answering instantly, so all of it is trtl
+    recall       memory search latency, cold and cached
+    checkpoint   bytes the history grows by per turn
+    render       CPU per token for drawing the streamed answer, over
+                 just consuming the events
+
+The results go out as JSON. --baseline compares them against a stored
+    run and exits 1 when a tracked number got worse by more than
+    --tolerance, --save-baseline stores this run as the new one.
+
+    python benchmarks/bench_suite.py --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRATCH = Path(tempfile.mkdtemp(prefix="trtl-bench-"))
+# before trtl is imported: caches go to the scratch dir, the scripted
+# model is never held back by the rate limits of the real one
+os.environ["TRTL_CACHE_DIR"] = str(SCRATCH / "cache")
+os.environ["TRTL_RATE_LIMITS"] = "gpt-4o=1000000000/1000000000000"
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "tvly-benchmark")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import bench_startup  # noqa: E402
+from fakes import (  # noqa: E402
+    HashEmbeddings,
+    ScriptedChatModel,
+    StubSearch,
+    StubWikipedia,
+    WordTokenizer,
+    tldr_tree,
+)
+
+import trtl.memory  # noqa: E402
+from trtl.models import use_embeddings  # noqa: E402
+
+SECTIONS = ["cold_start", "ingest", "turns", "recall", "checkpoint", "render"]
+
+LOWER, HIGHER = "lower", "higher"
+# the numbers --baseline watches, and which way is better
+TRACKED = {
+    "cold_start.import_main_s": LOWER,
+    "cold_start.build_agent_s": LOWER,
+    "ingest.pages_per_s": HIGHER,
+    "ingest.refresh_s": LOWER,
+    "turns.text_ms": LOWER,
+    "turns.search_ms": LOWER,
+    "turns.wiki_ms": LOWER,
+    "turns.run_ms": LOWER,
+    "turns.remember_ms": LOWER,
+    "recall.p50_ms": LOWER,
+    "recall.p95_ms": LOWER,
+    "recall.cached_us": LOWER,
+    "checkpoint.bytes_per_turn": LOWER,
+    "render.cpu_us_per_token": LOWER,
+}
+
+TURNS = {
+    "text": "explain how the shell keeps its directory",
+    "search": "search: latest tldr release",
+    "wiki": "wiki: sea turtle",
+    "run": "run: echo print a greeting",
+    "remember": "remember: the user prefers short answers",
+}
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+# ─── sections ─────────────────────────────────────────────────────────────────
+def bench_cold_start(runs: int) -> dict:
+    report = bench_startup.run(runs, ["import_main", "build_agent"])
+    return {
+        f"{stage}_s": stats.get("median_s", stats.get("error"))
+        for stage, stats in report.items()
+    }
+
+
+def bench_ingest(pages: int) -> dict:
+    from trtl.data.tldr_to_rag import ingest
+
+    tree = tldr_tree(SCRATCH / "tldr", pages)
+    paths = {
+        "persist_dir": SCRATCH / "tldr_db",
+        "manifest_path": SCRATCH / "tldr_manifest.sqlite3",
+        "index_path": SCRATCH / "tldr_index.sqlite3",
+        "vectors_path": SCRATCH / "tldr_vectors",
+    }
+    first = ingest(tree, workers=2, **paths)
+    refresh = ingest(tree, workers=2, **paths)
+    return {
+        "pages": first.added,
+        "chunks": first.chunks,
+        "seconds": round(first.seconds, 3),
+        "pages_per_s": round(first.added / first.seconds, 1),
+        "chunks_per_s": round(first.chunks / first.seconds, 1),
+        "refresh_s": round(refresh.seconds, 3),
+    }
+
+
+def build_agent(model: ScriptedChatModel):
+    from langchain_chroma import Chroma
+
+    from trtl.agent import Agent
+    from trtl.data.tldr_index import TldrIndex
+    from trtl.memory import save_persistent_memory, search_persistent_memories
+    from trtl.memory.checkpoint import DeltaSqliteSaver
+    from trtl.models import get_embeddings
+    from trtl.tools import terminal
+    from trtl.tools.enhanced_terminal import EnhancedTerminal
+
+    enhanced = EnhancedTerminal(
+        index=TldrIndex.open(SCRATCH / "tldr_index.sqlite3"),
+        retriever_factory=lambda: Chroma(
+            persist_directory=str(SCRATCH / "tldr_db"),
+            collection_name="tldr_manuals",
+            embedding_function=get_embeddings(),
+        ).as_retriever(search_kwargs={"k": 4}),
+    )
+    tools = [
+        save_persistent_memory,
+        search_persistent_memories,
+        StubSearch(),
+        terminal,
+        enhanced,
+        StubWikipedia(),
+    ]
+    checkpointer = DeltaSqliteSaver(SCRATCH / "checkpoints.sqlite3")
+    return Agent(
+        model=model, tools=tools, checkpointer=checkpointer, tokenizer=WordTokenizer()
+    )
+
+
+def _turn(agent, prompt: str, thread_id: str) -> float:
+    started = time.perf_counter()
+    for event in agent.events(prompt, thread_id=thread_id, user_id="bench"):
+        if event.kind == "done" and event.error:
+            raise RuntimeError(event.error)
+    return time.perf_counter() - started
+
+
+def bench_turns(agent, turns: int) -> dict:
+    report = {}
+    for kind, prompt in TURNS.items():
+        # the first turn of a kind opens stores and builds tools
+        report[f"{kind}_first_ms"] = _ms(_turn(agent, prompt, f"turns-{kind}"))
+        samples = [_turn(agent, prompt, f"turns-{kind}") for _ in range(turns)]
+        report[f"{kind}_ms"] = _ms(statistics.median(samples))
+    return report
+
+
+def bench_recall(memories: int, queries: int) -> dict:
+    from trtl.memory.recall import Recall
+    from trtl.memory.writer import get_memory_writer
+
+    writer = get_memory_writer()
+    for i in range(memories):
+        writer.submit("recall", f"note {i}: the user keeps project{i} under src{i}")
+    writer.flush()
+    recall = Recall(budget_ms=10_000)
+    cold = []
+    for i in range(queries):
+        started = time.perf_counter()
+        recall.search("recall", f"where is project{i * 7 % memories} kept")
+        cold.append(time.perf_counter() - started)
+    query = "where is project1 kept"
+    recall.collect("recall", query, recall.start("recall", query), float("inf"))
+    cached = []
+    for _ in range(queries):
+        started = time.perf_counter()
+        recall.collect("recall", query, recall.start("recall", query), float("inf"))
+        cached.append(time.perf_counter() - started)
+    return {
+        "memories": memories,
+        "p50_ms": _ms(statistics.median(cold)),
+        "p95_ms": _ms(_percentile(cold, 0.95)),
+        "cached_us": round(statistics.median(cached) * 1e6, 1),
+    }
+
+
+def _history_bytes(path: Path) -> int:
+    db = sqlite3.connect(str(path))
+    try:
+        pages = db.execute("PRAGMA page_count").fetchone()[0]
+        free = db.execute("PRAGMA freelist_count").fetchone()[0]
+        size = db.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        db.close()
+    return (pages - free) * size
+
+
+def bench_checkpoint(agent, turns: int) -> dict:
+    path = SCRATCH / "checkpoints.sqlite3"
+    agent.chat_history.flush()
+    before = _history_bytes(path)
+    for i in range(turns):
+        prompt = TURNS["search"] if i % 3 == 2 else f"{TURNS['text']} {i}"
+        _turn(agent, prompt, "checkpoint")
+    agent.chat_history.flush()
+    grown = _history_bytes(path) - before
+    return {"turns": turns, "bytes": grown, "bytes_per_turn": round(grown / turns)}
+
+
+def bench_render(agent, tokens: int, tokens_per_second: float) -> dict:
+    from rich.console import Console
+
+    from trtl.cli import stream_into_box
+
+    model = agent.model
+    model.answer_tokens, model.tokens_per_second = tokens, tokens_per_second
+    console = Console(file=io.StringIO(), force_terminal=True, width=100, height=50)
+    try:
+        started = time.process_time()
+        _turn(agent, TURNS["text"], "render-base")
+        consume = time.process_time() - started
+        started = time.process_time()
+        agent.chat_config["configurable"]["thread_id"] = "render-box"
+        stream_into_box(agent, TURNS["text"], console)
+        rendered = time.process_time() - started
+    finally:
+        agent.chat_config["configurable"]["thread_id"] = "1"
+        model.tokens_per_second = 0.0
+    return {
+        "tokens": tokens,
+        "consume_cpu_s": round(consume, 4),
+        "render_cpu_s": round(rendered, 4),
+        "cpu_us_per_token": round(max(0.0, rendered - consume) / tokens * 1e6, 1),
+    }
+
+
+# ─── baseline ─────────────────────────────────────────────────────────────────
+def flatten(results: dict) -> dict:
+    return {
+        f"{section}.{key}": value
+        for section, values in results.items()
+        for key, value in values.items()
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> dict:
+    current, previous = flatten(results), flatten(baseline)
+    comparison = {}
+    for key, better in TRACKED.items():
+        now, then = current.get(key), previous.get(key)
+        if not isinstance(now, (int, float)) or not isinstance(then, (int, float)):
+            continue
+        if then == 0:
+            continue
+        ratio = now / then
+        worse = (
+            ratio > 1 + tolerance if better == LOWER else ratio < 1 / (1 + tolerance)
+        )
+        comparison[key] = {
+            "baseline": then,
+            "current": now,
+            "ratio": round(ratio, 3),
+            "regressed": worse,
+        }
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--section", action="append", choices=SECTIONS)
+    parser.add_argument("--turns", type=int, default=10, help="samples per turn kind")
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=300, help="tldr pages to ingest")
+    parser.add_argument("--memories", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--history-turns", type=int, default=30)
+    parser.add_argument("--render-tokens", type=int, default=400)
+    parser.add_argument("--tokens-per-second", type=float, default=400)
+    parser.add_argument("--startup-runs", type=int, default=3)
+    parser.add_argument("--baseline", help="compare against this stored report")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", help="store this run as the baseline")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+    sections = args.section or SECTIONS
+
+    # chroma warns on every search of a collection smaller than k
+    logging.getLogger("chromadb").setLevel(logging.ERROR)
+    use_embeddings(HashEmbeddings())
+    trtl.memory.PERSIST_DIR = SCRATCH / "memories"
+    results = {}
+    try:
+        if "cold_start" in sections:
+            results["cold_start"] = bench_cold_start(args.startup_runs)
+        # the enhanced_terminal turns search what this ingested
+        if "ingest" in sections or "turns" in sections:
+            results["ingest"] = bench_ingest(args.pages)
+        agent = build_agent(ScriptedChatModel(answer_tokens=args.answer_tokens))
+        if "turns" in sections:
+            results["turns"] = bench_turns(agent, args.turns)
+        if "recall" in sections:
+            results["recall"] = bench_recall(args.memories, args.queries)
+        if "checkpoint" in sections:
+            results["checkpoint"] = bench_checkpoint(agent, args.history_turns)
+        if "render" in sections:
+            results["render"] = bench_render(
+                agent, args.render_tokens, args.tokens_per_second
+            )
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    regressed = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["comparison"] = compare(
+            results, baseline.get("results", baseline), args.tolerance
+        )
+        regressed = [k for k, v in report["comparison"].items() if v["regressed"]]
+        report["regressed"] = regressed
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                f.write(text + "\n")
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Chroma against the in process numpy backend for the tldr vectors.
+
+Builds a synthetic tldr corpus (see fakes.tldr_tree), ingests it with
+    trtl-ingest's pipeline and local hashed embeddings of --dim
+    dimensions (1536 is text-embedding-3-small's), so it needs no
+    network, then asks the same --queries questions of
+
+    chroma   the tldr_manuals collection, HNSW
+    float32  trtl.data.tldr_vectors, the export trtl-ingest wrote
+    int8     the same export, quantized
+
+with the query vectors computed up front, so only the search is timed:
+    one query at a time, and --batch queries per call. recall@k is
+    measured against an exact search (a hit that ties the k-th best
+    score counts), open_ms is opening the store and answering a first
+    query in a fresh process. The retrievers are also timed end to end,
+    embedding and building the Documents included. Prints a JSON report.
+
+The synthetic pages are near copies of each other, which is about the
+    worst case for HNSW: chroma's recall here is lower than on the real
+    tldr pages, the latencies are representative.
+
+    python benchmarks/bench_tldr_vectors.py --pages 1500 --dim 1536
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRATCH = Path(tempfile.mkdtemp(prefix="trtl-bench-vectors-"))
+# before trtl is imported, nothing is written next to the real data
+os.environ["TRTL_CACHE_DIR"] = str(SCRATCH / "cache")
+os.environ["TRTL_TRACE"] = "0"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import numpy as np  # noqa: E402
+from fakes import WORDS, HashEmbeddings, tldr_tree  # noqa: E402
+
+from trtl.models import use_embeddings  # noqa: E402
+
+COLLECTION = "tldr_manuals"
+
+# opens a store and answers one query, in a process of its own
+COLD = """
+import json, sys, time
+import numpy as np
+backend, path, dim = sys.argv[1], sys.argv[2], int(sys.argv[3])
+query = np.random.default_rng(0).standard_normal(dim).astype(np.float32)
+if backend == "chroma":
+    import chromadb
+    started = time.perf_counter()
+    client = chromadb.PersistentClient(path=path)
+    client.get_collection("tldr_manuals").query(query_embeddings=[query], n_results=4)
+else:
+    from trtl.data.tldr_vectors import TldrVectors
+    started = time.perf_counter()
+    TldrVectors.open(path).search([query], 4)
+print(json.dumps((time.perf_counter() - started) * 1000))
+"""
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _latencies(samples) -> dict:
+    ordered = sorted(samples)
+    return {
+        "p50_ms": _ms(ordered[len(ordered) // 2]),
+        "p95_ms": _ms(ordered[int(len(ordered) * 0.95)]),
+        "mean_ms": _ms(statistics.fmean(ordered)),
+    }
+
+
+def _timed(search, queries, batch: int) -> dict:
+    single = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query[None, :])
+        single.append(time.perf_counter() - started)
+    batched = []
+    for start in range(0, len(queries), batch):
+        started = time.perf_counter()
+        search(queries[start : start + batch])
+        batched.append(time.perf_counter() - started)
+    return {
+        **_latencies(single),
+        "batched_ms_per_query": _ms(sum(batched) / len(queries)),
+    }
+
+
+def _recall(found, exact_scores, k: int) -> float:
+    """share of found rows scoring at least the k-th best exact score"""
+    hits = 0
+    for rows, scores in zip(found, exact_scores):
+        kth = np.partition(scores, -k)[-k]
+        hits += sum(1 for row in rows[:k] if scores[row] >= kth - 1e-6)
+    return round(hits / (k * len(found)), 4)
+
+
+def _cold_open_ms(backend: str, path: Path, dim: int, runs: int = 3) -> float:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", COLD, backend, str(path), str(dim)],
+            check=True,
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return round(statistics.median(samples), 3)
+
+
+def _size(path: Path) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=1500)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma
+
+    from trtl.data.tldr_to_rag import ingest
+    from trtl.data.tldr_vectors import TldrVectorRetriever, TldrVectors, export
+
+    embeddings = HashEmbeddings(size=args.dim)
+    use_embeddings(embeddings)
+    try:
+        tree = tldr_tree(SCRATCH / "tldr", args.pages)
+        chroma_dir = SCRATCH / "tldr_db"
+        report = ingest(
+            tree,
+            persist_dir=chroma_dir,
+            manifest_path=SCRATCH / "manifest.sqlite3",
+            index_path=SCRATCH / "index.sqlite3",
+            vectors_path=SCRATCH / "float32",
+            workers=2,
+        )
+        store = Chroma(
+            persist_directory=str(chroma_dir),
+            collection_name=COLLECTION,
+            embedding_function=embeddings,
+        )
+        collection = store._collection
+        export(collection, SCRATCH / "int8", int8=True)
+        backends = {
+            "float32": TldrVectors.open(SCRATCH / "float32"),
+            "int8": TldrVectors.open(SCRATCH / "int8"),
+        }
+        row_of = {
+            backends["float32"].record(row)["id"]: row
+            for row in range(len(backends["float32"]))
+        }
+
+        rng = np.random.default_rng(0)
+        texts = [
+            " ".join(rng.choice(WORDS, 6)) + f" using tool{rng.integers(args.pages)}"
+            for _ in range(args.queries)
+        ]
+        queries = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        exact = np.asarray(backends["float32"].vectors) @ queries.T
+
+        def chroma_search(batch):
+            result = collection.query(query_embeddings=batch, n_results=args.k)
+            return [[row_of[i] for i in ids] for ids in result["ids"]]
+
+        def numpy_search(vectors):
+            return lambda batch: [
+                [row for row, _ in hits] for hits in vectors.search(batch, args.k)
+            ]
+
+        searches = {"chroma": chroma_search}
+        searches.update((name, numpy_search(v)) for name, v in backends.items())
+        results = {}
+        for name, search in searches.items():
+            results[name] = _timed(search, queries, args.batch)
+            found = search(queries)
+            results[name]["recall_at_k"] = _recall(found, exact.T, args.k)
+
+        results["chroma"]["open_ms"] = _cold_open_ms("chroma", chroma_dir, args.dim)
+        results["chroma"]["bytes"] = _size(chroma_dir)
+        for name in backends:
+            results[name]["open_ms"] = _cold_open_ms(name, SCRATCH / name, args.dim)
+            results[name]["bytes"] = _size(SCRATCH / name)
+
+        retrievers = {
+            "chroma": store.as_retriever(search_kwargs={"k": args.k}),
+            "float32": TldrVectorRetriever(
+                vectors=backends["float32"], embeddings=embeddings, k=args.k
+            ),
+        }
+        for name, retriever in retrievers.items():
+            samples = []
+            for text in texts:
+                started = time.perf_counter()
+                retriever.invoke(text)
+                samples.append(time.perf_counter() - started)
+            results[name]["retriever"] = _latencies(samples)
+
+        summary = {
+            "pages": args.pages,
+            "chunks": report.chunks,
+            "dim": args.dim,
+            "queries": args.queries,
+            "k": args.k,
+            **results,
+            "speedup_p50": round(
+                results["chroma"]["p50_ms"] / results["float32"]["p50_ms"], 1
+            ),
+        }
+    finally:
+        use_embeddings(None)
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
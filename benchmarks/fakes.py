@@ -0,0 +1,216 @@
+"""
+Offline stand-ins for the benchmark suite.
+
+    ScriptedChatModel   a chat model that decides from the last human
+                        message what to do: "search: ..." calls the web
+                        search tool, "wiki: ..." wikipedia, "run: <tool>
+                        <task>" enhanced_terminal, "remember: ..." saves
+                        a memory, anything else is answered with
+                        --answer-tokens words. After a tool result it
+                        answers. Streams word by word, with usage
+    HashEmbeddings      deterministic local embeddings, hashed words, so
+                        texts sharing words end up close together
+    WordTokenizer       one token per word, for the Agent's context
+                        window; tiktoken downloads its encodings
+    StubSearch /        the web tools' names and schemas, canned results
+    StubWikipedia
+
+    tldr_tree() writes a synthetic tldr checkout for ingestion.
+
+Nothing here touches the network or sleeps unless asked to.
+"""
+
+import hashlib
+import json
+import math
+import random
+import time
+from pathlib import Path
+from typing import Any, Iterator, List, Type
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel
+
+from trtl.tools import WebSearchInput
+from trtl.tools.wikipedia import WikipediaInput
+
+WORDS = (
+    "the shell keeps its working directory between commands so a cd holds "
+    "and the agent can resize every image in a folder before checking sizes"
+).split()
+
+
+# ─── tokenizer ────────────────────────────────────────────────────────────────
+class WordTokenizer:
+    """the encode / decode the Agent's ContextWindow uses, split on spaces"""
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return text.split(" ")
+
+    def decode(self, tokens: List[str]) -> str:
+        return " ".join(tokens)
+
+
+# ─── chat model ───────────────────────────────────────────────────────────────
+class ScriptedChatModel(BaseChatModel):
+    answer_tokens: int = 200
+    # 0 streams as fast as the graph takes tokens
+    tokens_per_second: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _plan(self, messages) -> AIMessage:
+        self.calls += 1
+        last = messages[-1]
+        usage = {
+            "input_tokens": sum(len(str(m.content).split()) for m in messages),
+            "output_tokens": self.answer_tokens,
+            "total_tokens": 0,
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        if isinstance(last, HumanMessage):
+            verb, _, rest = str(last.content).partition(": ")
+            call = {
+                "search": ("tavily_search_results_json", {"query": rest}),
+                "wiki": ("wikipedia", {"query": rest}),
+                "remember": ("save_persistent_memory", {"memory": rest}),
+                "run": (
+                    "enhanced_terminal",
+                    {
+                        "tool_name": rest.split(" ", 1)[0],
+                        "task_description": rest.split(" ", 1)[-1],
+                    },
+                ),
+            }.get(verb)
+            if call is not None:
+                name, args = call
+                return AIMessage(
+                    content="",
+                    tool_calls=[
+                        {"name": name, "args": args, "id": f"call_{self.calls}"}
+                    ],
+                    usage_metadata=usage,
+                )
+        rng = random.Random(self.calls)
+        words = [rng.choice(WORDS) for _ in range(self.answer_tokens)]
+        return AIMessage(content=" ".join(words), usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self._plan(messages))])
+
+    def _stream(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> Iterator[ChatGenerationChunk]:
+        message = self._plan(messages)
+        words = message.content.split(" ") if message.content else []
+        pause = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for i, word in enumerate(words):
+            if pause:
+                time.sleep(pause)
+            chunk = ChatGenerationChunk(
+                message=AIMessageChunk(content=word if i == 0 else " " + word)
+            )
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                usage_metadata=message.usage_metadata,
+                tool_call_chunks=[
+                    {
+                        "name": call["name"],
+                        "args": json.dumps(call["args"]),
+                        "id": call["id"],
+                        "index": i,
+                    }
+                    for i, call in enumerate(message.tool_calls)
+                ],
+            )
+        )
+
+
+# ─── embeddings ───────────────────────────────────────────────────────────────
+class HashEmbeddings(Embeddings):
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            slot = int.from_bytes(digest[:4], "little") % self.size
+            vector[slot] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+# ─── web tools ────────────────────────────────────────────────────────────────
+class StubSearch(BaseTool):
+    name: str = "tavily_search_results_json"
+    description: str = "web search, canned results"
+    args_schema: Type[BaseModel] = WebSearchInput
+    response_format: str = "content_and_artifact"
+
+    def _run(self, query: str, **kwargs) -> Any:
+        results = [
+            {"url": f"https://example.com/{i}", "content": f"{query} result {i}"}
+            for i in range(5)
+        ]
+        return results, {"query": query, "results": results}
+
+
+class StubWikipedia(BaseTool):
+    name: str = "wikipedia"
+    description: str = "wikipedia, canned pages"
+    args_schema: Type[BaseModel] = WikipediaInput
+
+    def _run(self, query: str, **kwargs) -> str:
+        return f"Page: {query}\nSummary: " + " ".join(WORDS)
+
+
+# ─── tldr ─────────────────────────────────────────────────────────────────────
+PAGE = """# {tool}
+
+> {tool} does one small thing well.
+> More information: <https://example.com/{tool}>.
+
+- Print a greeting with {tool}:
+
+`echo {tool} {{{{greeting}}}}`
+
+- List files and count them with {tool}:
+
+`echo {tool} {{{{path/to/directory}}}}`
+
+- Show the version of {tool}:
+
+`echo {tool} --version`
+"""
+
+
+def tldr_tree(root: Path, pages: int, seed: int = 0) -> Path:
+    """a tldr checkout with `pages` pages under pages/common"""
+    rng = random.Random(seed)
+    directory = Path(root) / "pages" / "common"
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(pages):
+        tool = f"tool{i}-{rng.choice(WORDS)}"
+        (directory / f"{tool}.md").write_text(PAGE.format(tool=tool))
+    return Path(root)
@@ -1,20 +1,30 @@
 # system prompt
+import asyncio
 import importlib.resources as pkg_resources
 import os
 import sqlite3
+import time
 from pathlib import Path
-from typing import Iterator, List
+from typing import AsyncIterator, Iterator, List, Optional
 
 import tiktoken
+from langchain_core.callbacks.base import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_openai import ChatOpenAI
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, MessagesState, StateGraph
-from langgraph.prebuilt import ToolNode
 
-from trtl.memory import persistent_memory_vector_store
-from trtl.tools import tool_belt
+from trtl.agent.context import ContextWindow
+from trtl.agent.events import Event, aevents, events
+from trtl.memory.checkpoint import DeltaSqliteSaver
+from trtl.memory.recall import Recall
+from trtl.models.http import get_async_http_client, get_http_client
+from trtl.models.scheduler import INTERACTIVE, get_scheduler
+from trtl.tools import tool_belt, tool_timeouts
+from trtl.tools.executor import ConcurrentToolNode
+from trtl.utils import tracing
 
 
 # ============================================================================
@@ -24,27 +34,80 @@ class State(MessagesState):
     recall_memories: List[str]
 
 
+# LLM tokens, whatever tools write to the custom stream (command output),
+# and each node's update once it is done (tool calls, results, usage)
+STREAM_MODES = ["messages", "custom", "updates"]
+
+# tokens kept free in the context window for the recalled memories
+RECALL_TOKENS = 512
+
+
+class _Streamed(BaseCallbackHandler):
+    """
+    notes whether a model call has handed out tokens. Those already went
+        to the UI through the messages stream, the scheduler must not
+        retry a call that failed after them or the answer shows twice
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.started = False
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.started = True
+
+
 system_prompt = pkg_resources.read_text("trtl.config", "system_prompt.txt")
 
 
 prompt = ChatPromptTemplate.from_messages(
     [
         ("system", system_prompt),
+        ("system", "{recall_memories}"),
         ("placeholder", "{messages}"),
     ]
 )
 
 
 class Agent:
-    def __init__(self):
-        self.model = ChatOpenAI(model_name="gpt-4o")
-        self.tokenizer = tiktoken.encoding_for_model("gpt-4o")
-        self.tools = tool_belt
+    def __init__(
+        self,
+        model: Optional[BaseChatModel] = None,
+        tools: Optional[list] = None,
+        checkpointer: Optional[DeltaSqliteSaver] = None,
+        tokenizer=None,
+    ):
+        """
+        model, tools, checkpointer and tokenizer default to the real
+            ones, the benchmarks pass scripted stand-ins to run the graph
+            offline (tiktoken downloads its encodings on first use)
+        """
+        # stream_usage puts the token counts on the streamed message too,
+        # the scheduler books them. It does the retrying as well
+        self.model = model or ChatOpenAI(
+            model_name="gpt-4o",
+            stream_usage=True,
+            # the scheduler learns the account's rate limits from them
+            include_response_headers=True,
+            max_retries=0,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+        )
+        self.tokenizer = tokenizer or tiktoken.encoding_for_model("gpt-4o")
+        # keeps the history sent to the model within a token budget
+        self.context = ContextWindow(self.tokenizer)
+        # recalled memories go into the prompt next to the system prompt,
+        # room for both is kept out of the history's budget
+        self.recall = Recall()
+        self._system_tokens = self.context.count_text(system_prompt)
+        self._reserved = self._system_tokens + RECALL_TOKENS
+        self.tools = tool_belt if tools is None else tools
         self.model_with_tools = self.model.bind_tools(self.tools)
-        # persistent memory is ALWAYS accessible to the agent
-        self.persistent_memory = persistent_memory_vector_store.as_retriever()
-        # TODO: swap this to a SQLite memory saver later
-        self.chat_history = MemorySaver()
+        # durable history, survives restarts and stores each message once
+        self.chat_history = checkpointer or DeltaSqliteSaver()
+        # every model call is timed and its tokens counted (trtl.utils.tracing)
+        tracing.watch_models()
         """TODO:
         chat config maintains info about the current user via user_id 
             and chat history via thread_id 
@@ -53,6 +116,9 @@ class Agent:
             chat history 
         We have to make the thread_id configuratble later, as people request
             to be able to quickly open a "context-less" chat 
+
+        these are the defaults, request() and friends take a thread_id
+            and a user_id for the one call (the daemon serves several)
         """
         self.chat_config = {"configurable": {"user_id": "1", "thread_id": "1"}}
 
@@ -62,61 +128,176 @@ class Agent:
     def _build_graph(self):
         builder = StateGraph(State)
 
-        builder.add_node("load_memories", self._load_memories)
-        builder.add_node("agent", self._create_agent)
-        builder.add_node("tools", ToolNode(self.tools))
+        # every node has a sync and an async implementation, graph.stream
+        # runs the former and graph.astream the latter
+        builder.add_node(
+            "agent",
+            RunnableLambda(
+                tracing.node("agent", self._create_agent),
+                afunc=tracing.node("agent", self._acreate_agent),
+            ),
+        )
+        builder.add_node(
+            "tools", ConcurrentToolNode(self.tools, timeouts=tool_timeouts)
+        )
 
-        builder.add_edge(START, "load_memories")
-        builder.add_edge("load_memories", "agent")
+        builder.add_edge(START, "agent")
         builder.add_conditional_edges("agent", self._route_tools, ["tools", END])
         builder.add_edge("tools", "agent")
 
         return builder.compile(checkpointer=self.chat_history)
 
-    def _load_memories(self, state: State) -> State:
+    def _recall_query(self, state: State) -> str:
         user_messages = [
             m.content for m in state["messages"] if isinstance(m, HumanMessage)
         ]
-        query = user_messages[-1] if user_messages else ""
+        return user_messages[-1] if user_messages else ""
 
-        # Filter by user_id like your tool does
-        user_id = self.chat_config["configurable"]["user_id"]
-        documents = persistent_memory_vector_store.similarity_search(
-            query, k=3, filter={"user_id": user_id}
-        )
-        recall_memories = [doc.page_content for doc in documents]
+    def _prompt_input(self, messages: list, memories: List[str]) -> dict:
+        recall_str = "<recall_memory>\n" + "\n".join(memories) + "\n</recall_memory>"
+        return {"messages": messages, "recall_memories": recall_str}
 
-        return {**state, "recall_memories": recall_memories}
+    def _config(
+        self, thread_id: Optional[str] = None, user_id: Optional[str] = None
+    ) -> dict:
+        configurable = dict(self.chat_config["configurable"])
+        if thread_id is not None:
+            configurable["thread_id"] = thread_id
+        if user_id is not None:
+            configurable["user_id"] = user_id
+        # ties the spans of one turn together in the trace
+        return {"configurable": configurable, "metadata": {"turn": os.urandom(6).hex()}}
 
-    def _create_agent(self, state: State) -> State:
-        bound = prompt | self.model_with_tools
-        recall_str = (
-            "<recall_memory>\n"
-            + "\n".join(state["recall_memories"])
-            + "\n</recall_memory>"
+    def _budget(self, messages: list, memories: List[str]) -> dict:
+        """
+        the scheduler arguments for one model call on messages. It is
+            booked at its prompt, the answer is added once usage says
+            how long it was
+        """
+        prompt_tokens = (
+            self.context.total(messages)
+            + self._system_tokens
+            + sum(self.context.count_text(memory) for memory in memories)
         )
-        prediction = bound.invoke(
-            {
-                "messages": state["messages"],
-                "recall_memories": recall_str,
-            }
+        return {
+            "model": "gpt-4o",
+            "tokens": prompt_tokens,
+            "priority": INTERACTIVE,
+            "usage": lambda m: (m.usage_metadata or {}).get("total_tokens"),
+        }
+
+    def _create_agent(self, state: State, config: RunnableConfig) -> State:
+        # persistent memory is ALWAYS accessible to the agent. the search
+        # runs in the background while the history is being fitted
+        user_id = config["configurable"]["user_id"]
+        query = self._recall_query(state)
+        deadline = time.monotonic() + self.recall.budget
+        pending = self.recall.start(user_id, query)
+        with tracing.span("context.fit"):
+            messages = self.context.fit(state["messages"], reserved=self._reserved)
+        with tracing.span("recall") as span:
+            memories = self.recall.collect(user_id, query, pending, deadline)
+            span.set(memories=len(memories))
+
+        streamed = _Streamed()
+        bound = (prompt | self.model_with_tools).with_config(callbacks=[streamed])
+        prediction = get_scheduler().call(
+            lambda: bound.invoke(self._prompt_input(messages, memories), config),
+            may_retry=lambda: not streamed.started,
+            **self._budget(messages, memories),
         )
         # Optional: Save this exchange to SQLite history (not surfaced now)
-        return {"messages": [prediction]}
+        return {"messages": [prediction], "recall_memories": memories}
+
+    async def _acreate_agent(self, state: State, config: RunnableConfig) -> State:
+        user_id = config["configurable"]["user_id"]
+        query = self._recall_query(state)
+        deadline = time.monotonic() + self.recall.budget
+        pending = self.recall.astart(user_id, query)
+        # let the search get as far as its embedding request, then fit the
+        # history in a thread so the loop keeps serving the search meanwhile
+        await asyncio.sleep(0)
+        with tracing.span("context.fit"):
+            messages = await asyncio.to_thread(
+                self.context.fit, state["messages"], reserved=self._reserved
+            )
+        with tracing.span("recall") as span:
+            memories = await self.recall.acollect(user_id, query, pending, deadline)
+            span.set(memories=len(memories))
+
+        streamed = _Streamed()
+        bound = (prompt | self.model_with_tools).with_config(callbacks=[streamed])
+        # tokens still reach graph.astream(stream_mode="messages") through
+        # the node's callbacks, passed on explicitly: with_config's would
+        # replace the ones ainvoke finds in the context otherwise
+        prediction = await get_scheduler().acall(
+            lambda: bound.ainvoke(self._prompt_input(messages, memories), config),
+            may_retry=lambda: not streamed.started,
+            **self._budget(messages, memories),
+        )
+        return {"messages": [prediction], "recall_memories": memories}
 
     def _route_tools(self, state: State):
         msg = state["messages"][-1]
         return "tools" if getattr(msg, "tool_calls", None) else END
 
-    def request(self, prompt: str) -> Iterator:
+    def request(
+        self,
+        prompt: str,
+        thread_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> Iterator:
         """
         returns an Iterator over a stream of chunks
             so that this can be called by different
             pieces of code that might want to display
             the stream (CLI, native UI)
+
+        items are (mode, payload): ("messages", (chunk, metadata)) for
+            the LLM tokens, ("custom", {"tool": ..., "output": ...}) for
+            the live output of a running command, ("updates", {node:
+            update}) when a node is done. events() is the same stream
+            as typed events
         """
-        return self.graph.stream(
-            input={"messages": [HumanMessage(prompt)]},
-            config=self.chat_config,
-            stream_mode="messages",
-        )
+        try:
+            yield from self.graph.stream(
+                input={"messages": [HumanMessage(prompt)]},
+                config=self._config(thread_id, user_id),
+                stream_mode=STREAM_MODES,
+            )
+        finally:
+            # the checkpointer batches commits, the turn is over
+            self.chat_history.flush()
+
+    async def arequest(
+        self,
+        prompt: str,
+        thread_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+    ) -> AsyncIterator:
+        """
+        async counterpart of request, an AsyncIterator over the same
+            (mode, payload) stream, so a single event loop can serve
+            memory recall, the LLM stream and the tools without blocking
+        """
+        try:
+            async for item in self.graph.astream(
+                input={"messages": [HumanMessage(prompt)]},
+                config=self._config(thread_id, user_id),
+                stream_mode=STREAM_MODES,
+            ):
+                yield item
+        finally:
+            self.chat_history.flush()
+
+    def events(self, prompt: str, **config) -> Iterator[Event]:
+        """
+        request as typed events (see trtl.agent.events), tokens coalesced
+            and the graph read on its own thread so a slow frontend does
+            not hold it up
+        """
+        return events(self.request(prompt, **config))
+
+    def aevents(self, prompt: str, **config) -> AsyncIterator[Event]:
+        """async counterpart of events, over arequest"""
+        return aevents(self.arequest(prompt, **config))
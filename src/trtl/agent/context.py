@@ -0,0 +1,195 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+"""
+Token budget for the history the agent sends to the model.
+
+Without this every model call carries the whole thread, raw tool output
+    included, so each step of a long session is slower and pricier than
+    the one before. ContextWindow.fit trims the history down to a token
+    budget before it goes into the prompt:
+
+    1. tool outputs older than the last few turns are cut down to a
+       short head, the model already acted on them
+    2. if that is not enough, the oldest turns are dropped whole and
+       replaced by a one line note listing what the user asked in them
+    3. as a last resort the tool outputs of the current turn are cut,
+       except for the newest ones
+
+A turn starts at a human message, so dropping whole turns never splits
+    an assistant tool call from its tool results. Truncated tool messages
+    keep their id and tool_call_id for the same reason.
+
+Token counts are cached per message (id + content length), so each
+    message is tokenized once no matter how many steps it survives.
+"""
+
+DEFAULT_BUDGET = int(os.getenv("TRTL_CONTEXT_TOKENS", "24000"))
+
+# rough per message framing the chat format adds on top of the content
+MESSAGE_OVERHEAD = 4
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    # multi part content, only the text parts cost text tokens
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in content
+    )
+
+
+class ContextWindow:
+    def __init__(
+        self,
+        tokenizer,
+        budget: int = DEFAULT_BUDGET,
+        keep_turns: int = 2,
+        stale_tool_tokens: int = 300,
+        cache_size: int = 20_000,
+    ):
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self.stale_tool_tokens = stale_tool_tokens
+        self.cache_size = cache_size
+        self._counts: "OrderedDict[tuple, int]" = OrderedDict()
+        self._truncated: "OrderedDict[tuple, BaseMessage]" = OrderedDict()
+        # the async agent fits in worker threads, several turns at once
+        self._lock = threading.Lock()
+
+    # ─── counting ─────────────────────────────────────────────────────────────
+    def _remember(self, cache: OrderedDict, key, value):
+        with self._lock:
+            cache[key] = value
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def _recall(self, cache: OrderedDict, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def count_text(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, disallowed_special=()))
+
+    def count(self, message: BaseMessage) -> int:
+        text = _text(message.content)
+        key = (message.id, len(text)) if message.id else None
+        if key is not None and (cached := self._recall(self._counts, key)) is not None:
+            return cached
+        tokens = MESSAGE_OVERHEAD + self.count_text(text)
+        for call in getattr(message, "tool_calls", None) or []:
+            tokens += self.count_text(f"{call['name']}{call['args']}")
+        if key is None:
+            return tokens
+        return self._remember(self._counts, key, tokens)
+
+    def total(self, messages: Sequence[BaseMessage]) -> int:
+        return sum(self.count(m) for m in messages)
+
+    # ─── shrinking ────────────────────────────────────────────────────────────
+    def _truncate(self, message: BaseMessage, limit: int) -> BaseMessage:
+        if not isinstance(message, ToolMessage) or self.count(message) <= limit:
+            return message
+        key = (message.id, limit)
+        if message.id and (cached := self._recall(self._truncated, key)) is not None:
+            return cached
+        tokens = self.tokenizer.encode(_text(message.content), disallowed_special=())
+        head = self.tokenizer.decode(tokens[:limit])
+        short = message.model_copy(
+            update={
+                "content": f"{head}\n…[{len(tokens) - limit} tokens of older tool output trimmed]"
+            }
+        )
+        if not message.id:
+            return short
+        return self._remember(self._truncated, key, short)
+
+    @staticmethod
+    def _turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+        turns: List[List[BaseMessage]] = [[]]
+        for message in messages:
+            if isinstance(message, HumanMessage) and turns[-1]:
+                turns.append([])
+            turns[-1].append(message)
+        return [turn for turn in turns if turn]
+
+    @staticmethod
+    def _omitted_note(dropped: List[List[BaseMessage]]) -> Optional[SystemMessage]:
+        asks = [
+            _text(m.content)[:120].replace("\n", " ")
+            for turn in dropped
+            for m in turn
+            if isinstance(m, HumanMessage)
+        ]
+        if not dropped:
+            return None
+        listing = "; ".join(asks[-10:]) if asks else "none"
+        return SystemMessage(
+            f"[{len(dropped)} earlier turns omitted to fit the context window. "
+            f"The user had asked: {listing}]"
+        )
+
+    def fit(
+        self, messages: Sequence[BaseMessage], reserved: int = 0
+    ) -> List[BaseMessage]:
+        """
+        the messages to send, within budget - reserved tokens (reserved
+        covers the system prompt and anything else added around them)
+        """
+        budget = self.budget - reserved
+        if self.total(messages) <= budget:
+            return list(messages)
+
+        turns = self._turns(messages)
+        recent = max(1, self.keep_turns)
+        # 1. older tool output down to a short head
+        turns = [
+            (
+                [self._truncate(m, self.stale_tool_tokens) for m in turn]
+                if i < len(turns) - recent
+                else turn
+            )
+            for i, turn in enumerate(turns)
+        ]
+
+        # 2. drop the oldest turns, never the current one
+        sizes = [self.total(turn) for turn in turns]
+        dropped = []
+        while len(turns) > 1 and sum(sizes) > budget:
+            dropped.append(turns.pop(0))
+            sizes.pop(0)
+        note = self._omitted_note(dropped)
+        fitted = [m for turn in turns for m in turn]
+        if note is not None:
+            fitted.insert(0, note)
+
+        # 3. the current turn alone is too big, trim its tool output oldest
+        # first and leave the newest step's results alone
+        over = self.total(fitted) - budget
+        if over > 0:
+            last_call = max(
+                (i for i, m in enumerate(fitted) if getattr(m, "tool_calls", None)),
+                default=len(fitted),
+            )
+            for i, message in enumerate(fitted[:last_call]):
+                if over <= 0:
+                    break
+                short = self._truncate(message, self.stale_tool_tokens)
+                over -= self.count(message) - self.count(short)
+                fitted[i] = short
+        return fitted
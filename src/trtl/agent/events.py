@@ -0,0 +1,410 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, ClassVar, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+"""
+Typed events for the agent's stream.
+
+graph.stream hands out (mode, payload) tuples whose shape depends on
+    the mode, and every frontend had to know LangGraph's internals to
+    pick tokens out of them. StreamAdapter turns them into a small set
+    of events instead:
+
+    Token            text the model is streaming
+    ToolCallStarted  the model asked for a tool, it is about to run
+    ToolOutput       live output of a running command (final=False), or
+                     what a tool returned to the model (final=True)
+    NodeTiming       how long a graph node (agent, tools) took
+    Usage            tokens used by one model call
+    Done             the turn is over, totals for it and the error if any
+
+Between the graph and the frontend sits an EventQueue, bounded to
+    max_events entries. Tokens (and live command output) merge into the
+    last queued event of their kind instead of queueing behind it: for
+    `window` seconds so a fast consumer gets a few words per event
+    instead of one, up to max_chars, and without limit once the queue
+    is full. So a slow renderer makes events bigger, never makes the
+    model stream wait. Only the other events, a few per turn, block
+    the producer when the queue is full.
+
+Every event has a `kind` and to_dict(), so a frontend other than the
+    CLI can serialise the same stream.
+"""
+
+WINDOW = float(os.getenv("TRTL_STREAM_WINDOW_MS", "30")) / 1000
+MAX_EVENTS = 256
+MAX_CHARS = 4096
+
+
+# ─── events ───────────────────────────────────────────────────────────────────
+@dataclass
+class Event:
+    kind: ClassVar[str] = "event"
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, **asdict(self)}
+
+
+@dataclass
+class Token(Event):
+    kind: ClassVar[str] = "token"
+    text: str
+    node: str = "agent"
+
+
+@dataclass
+class ToolCallStarted(Event):
+    kind: ClassVar[str] = "tool_call_started"
+    call_id: str
+    name: str
+    args: dict = field(default_factory=dict)
+
+
+@dataclass
+class ToolOutput(Event):
+    kind: ClassVar[str] = "tool_output"
+    tool: str
+    text: str
+    call_id: Optional[str] = None
+    final: bool = False
+    status: str = "success"
+
+
+@dataclass
+class NodeTiming(Event):
+    kind: ClassVar[str] = "node_timing"
+    node: str
+    seconds: float
+
+
+@dataclass
+class Usage(Event):
+    kind: ClassVar[str] = "usage"
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+
+
+@dataclass
+class Done(Event):
+    kind: ClassVar[str] = "done"
+    seconds: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    tool_calls: int = 0
+    error: Optional[str] = None
+
+
+def _merge(last: Event, event: Event, max_chars: Optional[int]) -> bool:
+    """appends event's text to last when they are the same stream of text"""
+    if isinstance(last, Token) and isinstance(event, Token):
+        if last.node != event.node:
+            return False
+    elif isinstance(last, ToolOutput) and isinstance(event, ToolOutput):
+        if last.final or event.final or last.tool != event.tool:
+            return False
+    else:
+        return False
+    if max_chars is not None and len(last.text) + len(event.text) > max_chars:
+        return False
+    last.text += event.text
+    return True
+
+
+# ─── raw stream -> events ─────────────────────────────────────────────────────
+class StreamAdapter:
+    """
+    turns the (mode, payload) items of Agent.request into events, needs
+        the "messages", "custom" and "updates" stream modes
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        # the graph runs one node at a time, a node ran from the previous
+        # update (or the start) to its own
+        self._node_started = self.started
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.tool_calls = 0
+
+    def feed(self, mode: str, payload) -> List[Event]:
+        if mode == "messages":
+            chunk, metadata = payload
+            content = getattr(chunk, "content", None)
+            # the tool node's ToolMessages come through here as well
+            if content and not isinstance(chunk, ToolMessage):
+                node = metadata.get("langgraph_node", "agent")
+                return [
+                    Token(content if isinstance(content, str) else str(content), node)
+                ]
+            return []
+        if mode == "custom":
+            if isinstance(payload, dict) and "output" in payload:
+                return [ToolOutput(payload.get("tool", ""), payload["output"])]
+            return []
+        if mode == "updates":
+            return self._updates(payload)
+        return []
+
+    def _updates(self, payload) -> List[Event]:
+        events: List[Event] = []
+        if not isinstance(payload, dict):
+            return events
+        now = time.monotonic()
+        for node, update in payload.items():
+            if node.startswith("__"):
+                continue
+            events.append(NodeTiming(node, now - self._node_started))
+            for message in (update or {}).get("messages", []):
+                events.extend(self._message(message))
+        self._node_started = now
+        return events
+
+    def _message(self, message) -> List[Event]:
+        events: List[Event] = []
+        if isinstance(message, AIMessage):
+            usage = message.usage_metadata
+            if usage:
+                self.input_tokens += usage.get("input_tokens", 0)
+                self.output_tokens += usage.get("output_tokens", 0)
+                events.append(
+                    Usage(
+                        usage.get("input_tokens", 0),
+                        usage.get("output_tokens", 0),
+                        usage.get("total_tokens", 0),
+                    )
+                )
+            for call in message.tool_calls:
+                self.tool_calls += 1
+                events.append(
+                    ToolCallStarted(call.get("id") or "", call["name"], call["args"])
+                )
+        elif isinstance(message, ToolMessage):
+            events.append(
+                ToolOutput(
+                    message.name or "",
+                    str(message.content),
+                    call_id=message.tool_call_id,
+                    final=True,
+                    status=message.status,
+                )
+            )
+        return events
+
+    def done(self, error: Optional[BaseException] = None) -> Done:
+        return Done(
+            seconds=time.monotonic() - self.started,
+            input_tokens=self.input_tokens,
+            output_tokens=self.output_tokens,
+            tool_calls=self.tool_calls,
+            error=None if error is None else f"{type(error).__name__}: {error}",
+        )
+
+
+# ─── coalescing queue ─────────────────────────────────────────────────────────
+class _Buffer:
+    """the merge rules, without any of the waiting"""
+
+    def __init__(self, max_events: int, window: float, max_chars: int):
+        self.max_events = max_events
+        self.window = window
+        self.max_chars = max_chars
+        # (event, time it was queued)
+        self.items: deque = deque()
+        self.closed = False
+        self.merged = 0
+
+    def offer(self, event: Event) -> bool:
+        """False when the queue is full and event has to wait"""
+        if self.items:
+            last, queued = self.items[-1]
+            full = len(self.items) >= self.max_events
+            young = time.monotonic() - queued < self.window
+            if (full or young) and _merge(
+                last, event, None if full else self.max_chars
+            ):
+                self.merged += 1
+                return True
+            if full:
+                return False
+        self.items.append((event, time.monotonic()))
+        return True
+
+    def take(self) -> Tuple[Optional[Event], float]:
+        """the next event, or None and how long to wait for it"""
+        if not self.items:
+            return None, float("inf")
+        event, queued = self.items[0]
+        if len(self.items) == 1 and not self.closed:
+            # the last event may still grow, hand it out once its window
+            # is over or something was queued behind it
+            left = queued + self.window - time.monotonic()
+            if (
+                left > 0
+                and isinstance(event, (Token, ToolOutput))
+                and not (isinstance(event, ToolOutput) and event.final)
+            ):
+                return None, left
+        self.items.popleft()
+        return event, 0.0
+
+
+class EventQueue:
+    """bounded, coalescing queue from a producer thread to a consumer"""
+
+    def __init__(
+        self, max_events: int = MAX_EVENTS, window: float = WINDOW, max_chars=MAX_CHARS
+    ):
+        self._buffer = _Buffer(max_events, window, max_chars)
+        self._changed = threading.Condition()
+        self.cancelled = False
+
+    def put(self, event: Event):
+        with self._changed:
+            while not self._buffer.offer(event):
+                if self.cancelled:
+                    return
+                self._changed.wait()
+            self._changed.notify_all()
+
+    def close(self):
+        with self._changed:
+            self._buffer.closed = True
+            self._changed.notify_all()
+
+    def cancel(self):
+        """the consumer is gone, a blocked put returns"""
+        with self._changed:
+            self.cancelled = True
+            self._changed.notify_all()
+
+    def get(self) -> Optional[Event]:
+        """the next event, None once the queue is closed and empty"""
+        with self._changed:
+            while True:
+                event, wait = self._buffer.take()
+                if event is not None:
+                    self._changed.notify_all()
+                    return event
+                if self._buffer.closed and not self._buffer.items:
+                    return None
+                self._changed.wait(None if wait == float("inf") else wait)
+
+
+class AsyncEventQueue:
+    """EventQueue for a producer task and a consumer on the same loop"""
+
+    def __init__(
+        self, max_events: int = MAX_EVENTS, window: float = WINDOW, max_chars=MAX_CHARS
+    ):
+        self._buffer = _Buffer(max_events, window, max_chars)
+        self._changed = asyncio.Condition()
+
+    async def put(self, event: Event):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._buffer.offer(event))
+            self._changed.notify_all()
+
+    async def close(self):
+        async with self._changed:
+            self._buffer.closed = True
+            self._changed.notify_all()
+
+    async def get(self) -> Optional[Event]:
+        async with self._changed:
+            while True:
+                event, wait = self._buffer.take()
+                if event is not None:
+                    self._changed.notify_all()
+                    return event
+                if self._buffer.closed and not self._buffer.items:
+                    return None
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait(),
+                        None if wait == float("inf") else wait,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+
+# ─── pumps ────────────────────────────────────────────────────────────────────
+def events(stream: Iterator, **queue_options) -> Iterator[Event]:
+    """
+    typed events for a (mode, payload) stream. The stream is read on a
+        thread of its own so a slow consumer never holds it up, an
+        exception in it is raised here after its Done event
+    """
+    queue = EventQueue(**queue_options)
+    adapter = StreamAdapter()
+    failure: List[BaseException] = []
+
+    def pump():
+        error = None
+        try:
+            for mode, payload in stream:
+                if queue.cancelled:
+                    break
+                for event in adapter.feed(mode, payload):
+                    queue.put(event)
+        except BaseException as e:
+            error = e
+            failure.append(e)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None and queue.cancelled:
+                close()
+            queue.put(adapter.done(error))
+            queue.close()
+
+    thread = threading.Thread(target=pump, name="trtl-events", daemon=True)
+    thread.start()
+    try:
+        while (event := queue.get()) is not None:
+            yield event
+    finally:
+        queue.cancel()
+    if failure:
+        raise failure[0]
+
+
+async def aevents(stream: AsyncIterator, **queue_options) -> AsyncIterator[Event]:
+    """async counterpart of events, the stream is read by its own task"""
+    queue = AsyncEventQueue(**queue_options)
+    adapter = StreamAdapter()
+    failure: List[BaseException] = []
+
+    async def pump():
+        error = None
+        try:
+            async for mode, payload in stream:
+                for event in adapter.feed(mode, payload):
+                    await queue.put(event)
+        except asyncio.CancelledError:
+            # the consumer is gone, nobody to tell
+            raise
+        except Exception as e:
+            error = e
+            failure.append(e)
+        await queue.put(adapter.done(error))
+        await queue.close()
+
+    task = asyncio.ensure_future(pump())
+    try:
+        while (event := await queue.get()) is not None:
+            yield event
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    if failure:
+        raise failure[0]
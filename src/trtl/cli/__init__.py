@@ -2,7 +2,11 @@
 This file handles the command line interaction with the trtl daemon.
 """
 
+import asyncio
+import os
+import signal
 import sys
+import threading
 import time
 from enum import Enum
 from typing import Any, Dict, List, Optional
@@ -10,17 +14,17 @@ from typing import Any, Dict, List, Optional
 from rich import box
 from rich.align import Align
 from rich.box import Box
-
-# TODO: we should use a stream adapter in the agent, and handle
-# receiving that stream here
-from rich.console import Console
+from rich.console import Console, Group
 from rich.layout import Layout
 from rich.live import Live
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.spinner import Spinner
+from rich.table import Table
 from rich.text import Text
 
+from trtl.cli.render import IncrementalMarkdown
+
 
 # innocence theme
 class Innocence(Enum):
@@ -69,6 +73,9 @@ def cli_loop(agent):
             # specific commands the user may find convenient
             if prompt.lower() in ("exit", "quit"):
                 break
+            if prompt.strip() == "/stats":
+                print_stats(console)
+                continue
             """
             agent.request(prompt) will give an Iterator to a stream
             of LLM response tokens.
@@ -83,11 +90,118 @@ def cli_loop(agent):
             this is the "control + c" scenario
                 for ending the program.
             """
+            from trtl.tools.process import kill_all
+
+            # commands run in their own process group, Ctrl+C does not
+            # reach them on its own
+            kill_all()
             console.print()
             console.print("👋 🐢 🌸 thanks for spending time with trtl...")
             sys.exit(1)
 
 
+class _StdinLines:
+    """
+    line reader for stdin that lives on the event loop.
+
+    input() in a worker thread can not be cancelled, a Ctrl+C would
+        leave the thread blocked on the terminal and hang the exit.
+        Reading the fd when the loop reports it readable avoids that,
+        and buffering ourselves keeps piped input with several lines
+        per read working.
+
+    stdin redirected from a regular file can not be watched (epoll
+        refuses it, as does the Windows loop), it is read from a thread
+        instead, a file never leaves that thread blocked for long.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+        self.eof = False
+        self.pollable = True
+
+    async def _wait_readable(self, loop, fd: int):
+        readable = loop.create_future()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+
+    async def _read(self, fd: int) -> bytes:
+        if self.pollable:
+            loop = asyncio.get_running_loop()
+            try:
+                await self._wait_readable(loop, fd)
+                return os.read(fd, 4096)
+            except (PermissionError, NotImplementedError):
+                self.pollable = False
+        return await asyncio.to_thread(os.read, fd, 4096)
+
+    async def readline(self) -> str:
+        fd = sys.stdin.fileno()
+        while b"\n" not in self.buffer and not self.eof:
+            chunk = await self._read(fd)
+            self.buffer += chunk
+            self.eof = not chunk
+        if not self.buffer:
+            raise EOFError
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line.decode(errors="replace")
+
+
+_stdin = _StdinLines()
+
+
+async def ainput(prompt: str = "") -> str:
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    return await _stdin.readline()
+
+
+async def acli_loop(agent, **config):
+    """
+    asyncio version of cli_loop, the prompt, the agent's stream and its
+        tools all share one event loop. config (thread_id, user_id) goes
+        to every request.
+
+    Run it with asyncio.run. A Ctrl+C cancels this task, whatever the
+        Python version (asyncio.run only does that itself from 3.11), so
+        the goodbye and the cleanup below always run. asyncio.run then
+        raises CancelledError, or KeyboardInterrupt.
+    """
+
+    console = Console()
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGINT, asyncio.current_task().cancel
+        )
+    except (NotImplementedError, RuntimeError):
+        # no signal handlers on Windows or off the main thread, a Ctrl+C
+        # is then a KeyboardInterrupt out of the loop
+        pass
+    while True:
+        try:
+            prompt = await ainput("\n> ")
+            if prompt.lower() in ("exit", "quit"):
+                break
+            if prompt.strip() == "/stats":
+                print_stats(console)
+                continue
+            await astream_into_box(agent, prompt, console, **config)
+        except EOFError:
+            break
+        except asyncio.CancelledError:
+            from trtl.tools.process import kill_all
+
+            # cancelled tool calls kill their own commands, this gets the
+            # ones sync tools started from worker threads
+            kill_all()
+            console.print()
+            console.print("👋 🐢 🌸 thanks for spending time with trtl...")
+            raise
+
+
 """
 What is in the splash, 
 it HAS TO let the user know how to feel about the application
@@ -198,24 +312,94 @@ def print_tools(tools, console):
     console.print(panel)
 
 
+def print_stats(console: Console, report: Optional[dict] = None):
+    """
+    where this session's time went (/stats): p50 and p95 per stage, slowest
+        stage first, and the tokens used per model. report defaults to
+        this process's trtl.utils.tracing.stats()
+    """
+    if report is None:
+        from trtl.utils import tracing
+
+        report = tracing.stats()
+    if not report["enabled"]:
+        console.print("tracing is off, unset TRTL_TRACE=0 to get /stats")
+        return
+
+    stages = Table(box=box.SIMPLE, header_style=Innocence.BLUE.value)
+    for column in ("stage", "calls", "p50 ms", "p95 ms", "total s", "errors"):
+        stages.add_column(column, justify="left" if column == "stage" else "right")
+    ranked = sorted(report["stages"].items(), key=lambda item: -item[1]["total_s"])
+    for stage, row in ranked:
+        stages.add_row(
+            stage,
+            str(row["count"]),
+            f"{row['p50_ms']:.1f}",
+            f"{row['p95_ms']:.1f}",
+            f"{row['total_s']:.2f}",
+            str(row["errors"]) if row["errors"] else "",
+        )
+
+    tokens = Table(box=box.SIMPLE, header_style=Innocence.BLUE.value)
+    for column in ("model", "calls", "prompt", "completion", "cached"):
+        tokens.add_column(column, justify="left" if column == "model" else "right")
+    for model, row in sorted(report["tokens"].items()):
+        tokens.add_row(
+            model,
+            *(str(row[kind]) for kind in ("calls", "prompt", "completion", "cached")),
+        )
+
+    content = Group(stages, tokens) if report["tokens"] else stages
+    if not report["stages"]:
+        content = Text("nothing timed yet", style=Innocence.GREY.value)
+    console.print(
+        Panel(
+            content,
+            title="📊 this session",
+            border_style=Innocence.VIOLET.value,
+            expand=False,
+        )
+    )
+
+
 class DynamicResponseBox:
     """
     Manages a dynamically growing response box for streaming text from an agent.
+
+    Tokens go into an IncrementalMarkdown (see trtl.cli.render) and only
+        mark the box dirty. Live pulls the panel on its own refresh
+        timer, so however fast tokens arrive the panel is rebuilt at
+        most refresh_per_second times, and only the open markdown block
+        is parsed again when it is.
     """
 
+    refresh_per_second = 10
+
     def __init__(self, console: Console):
         self.console = console
         self.live = None
-        self.response_text = ""
+        self.response = IncrementalMarkdown()
+        self.placeholder = ""
+        # tail of a running command's output, shown under the response
+        self.tool_output = ""
         self.running = False
+        self.finished = False
+        # Live's refresh thread builds the panel while tokens keep coming
+        self._lock = threading.Lock()
+        self._panel = None
         # TODO: define singular panel here
 
+    @property
+    def response_text(self) -> str:
+        return self.response.text
+
     def start(self, initial_message: str = "Waiting for response..."):
-        self.response_text = initial_message
+        # shown until the first token arrives
+        self.placeholder = initial_message
 
         # Create an initial panel with minimal content
-        initial_panel = Panel(
-            Markdown(self.response_text),
+        self._panel = Panel(
+            Markdown(self.placeholder),
             border_style=Innocence.BLUE.value,
             # Start with a reasonable width - adjust as needed
             width=40,
@@ -223,61 +407,117 @@ class DynamicResponseBox:
 
         # Start the live display
         self.live = Live(
-            initial_panel, console=self.console, refresh_per_second=10, transient=False
+            console=self.console,
+            refresh_per_second=self.refresh_per_second,
+            transient=False,
+            get_renderable=self._current_panel,
         )
         self.live.start()
         self.running = True
 
-    def update(self, text: str):
+    def append(self, text: str):
         if not self.running:
             return
 
-        # Update the response text
-        self.response_text = text
+        with self._lock:
+            self.response.append(text)
+            # the model is talking again, so whatever a command printed
+            # before is done
+            self.tool_output = ""
+            self._panel = None
 
-        # Create a new panel with updated content
-        panel = Panel(
-            Markdown(self.response_text),
-            border_style=Innocence.BLUE.value,
-            # Let the width grow based on content
-            width=None,
-        )
+    def update(self, text: str):
+        """replaces the whole response with text"""
+        if not self.running:
+            return
 
-        # Update the live display
-        self.live.update(panel)
+        with self._lock:
+            self.response = IncrementalMarkdown()
+            self.response.append(text)
+            self.tool_output = ""
+            self._panel = None
+
+    def show_tool_output(self, text: str, max_lines: int = 12):
+        if not self.running:
+            return
+        with self._lock:
+            lines = (self.tool_output + text).splitlines(keepends=True)
+            self.tool_output = "".join(lines[-max_lines:])
+            self._panel = None
+
+    def _response(self, max_lines: Optional[int] = None):
+        if not self.response:
+            return Markdown(self.placeholder)
+        return self.response.renderable(max_lines)
+
+    def _current_panel(self):
+        with self._lock:
+            if self._panel is None:
+                # Live shows the top of a panel taller than the terminal,
+                # the rest is not worth laying out until the final print
+                content = self._response(
+                    None if self.finished else self.console.size.height
+                )
+                if self.tool_output:
+                    content = Group(
+                        content,
+                        Text(self.tool_output.rstrip(), style=Innocence.GREY.value),
+                    )
+                # Let the width grow based on content
+                self._panel = Panel(
+                    content, border_style=Innocence.BLUE.value, width=None
+                )
+            return self._panel
 
     def finish(self):
         if not self.running:
             return
 
-        # Final update with completed content
-        final_panel = Panel(
-            Markdown(self.response_text),
-            border_style=Innocence.BLUE.value,
-        )
+        # Final update with completed content, the command output is
+        # not part of the answer
+        with self._lock:
+            self.tool_output = ""
+            self._panel = None
+            self.finished = True
 
         # Ensure final update is visible and stop the live display
         if self.live:
-            self.live.update(final_panel)
+            self.live.refresh()
             self.live.stop()
         self.running = False
 
 
+def _show_event(box: DynamicResponseBox, event):
+    # events are told apart by kind, importing trtl.agent.events here
+    # would load the agent before the splash is up
+    if event.kind == "token":
+        box.append(event.text)
+    elif event.kind == "tool_call_started":
+        box.show_tool_output(f"▸ {event.name}\n")
+    elif event.kind == "tool_output" and not event.final:
+        box.show_tool_output(event.text)
+
+
 def stream_into_box(agent, prompt: str, console: Console):
     box = DynamicResponseBox(console)
     box.start()
 
     try:
-        for chunk, metadata in agent.request(prompt):
-            # Filter only LLM node outputs if needed
-            if "langgraph_node" in metadata:
-                # You can optionally filter by node name if your graph has multiple streaming LLMs:
-                # if metadata["langgraph_node"] != "llm_response":
-                #     continue
-
-                content = getattr(chunk, "content", None)
-                if content:
-                    box.update(box.response_text + content)
+        for event in agent.events(prompt):
+            _show_event(box, event)
+    except Exception as e:
+        box.update(f"[red]Error during stream:[/red] {e}")
+    finally:
+        box.finish()
+
+
+async def astream_into_box(agent, prompt: str, console: Console, **config):
+    box = DynamicResponseBox(console)
+    box.start()
+
+    try:
+        async for event in agent.aevents(prompt, **config):
+            _show_event(box, event)
     except Exception as e:
         box.update(f"[red]Error during stream:[/red] {e}")
     finally:
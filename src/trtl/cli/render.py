@@ -0,0 +1,173 @@
+import re
+from typing import List, Optional
+
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.markdown import Markdown
+from rich.segment import Segment
+
+"""
+Incremental markdown rendering for the streamed response.
+
+Re-parsing the whole response for every token is quadratic: each token
+    copies the text so far, parses it as markdown and lays all of it
+    out again, and a long answer with big code blocks pegs the CPU.
+    IncrementalMarkdown splits the stream into markdown blocks as it
+    arrives instead:
+
+    - chunks are appended to a list, nothing is joined per token
+    - complete lines are walked once. A blank line outside a code fence
+      (or a closing fence) ends the block, unless the next line is
+      indented and so still belongs to it (nested lists, indented code)
+    - a finished block is parsed once and its rendered lines are cached
+      per width, only the open block at the end is parsed again, and
+      only when renderable() is asked for, which DynamicResponseBox
+      does at most at the display's refresh rate
+    - renderable(max_lines) stops laying out blocks once that many lines
+      are out. Live crops a panel taller than the terminal to its top
+      anyway, so while streaming only a screenful is ever rendered
+
+Blocks are laid out one blank line apart, the blank lines rich puts
+    around some elements on its own are trimmed so the spacing does
+    not depend on where the stream happened to be split.
+"""
+
+FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+
+def _blank(line: List[Segment]) -> bool:
+    # code blocks pad with lines of spaces on a background, those stay
+    return all(
+        not segment.text.strip() and not (segment.style and segment.style.bgcolor)
+        for segment in line
+    )
+
+
+class _Block:
+    """one markdown block, its rendered lines cached for the last width"""
+
+    def __init__(self, source: str, code_theme: str):
+        self.source = source
+        self.code_theme = code_theme
+        self._width: Optional[int] = None
+        self._lines: List[List[Segment]] = []
+
+    def lines(self, console: Console, options: ConsoleOptions) -> List[List[Segment]]:
+        if options.max_width != self._width:
+            markdown = Markdown(self.source, code_theme=self.code_theme)
+            lines = console.render_lines(markdown, options, pad=False)
+            start, end = 0, len(lines)
+            while start < end and _blank(lines[start]):
+                start += 1
+            while end > start and _blank(lines[end - 1]):
+                end -= 1
+            self._lines, self._width = lines[start:end], options.max_width
+        return self._lines
+
+
+class _Blocks:
+    """renders a snapshot of the blocks, one blank line between them"""
+
+    def __init__(self, blocks: List[_Block], max_lines: Optional[int] = None):
+        self.blocks = blocks
+        self.max_lines = max_lines
+
+    def __rich_console__(
+        self, console: Console, options: ConsoleOptions
+    ) -> RenderResult:
+        options = options.update(height=None)
+        left = self.max_lines
+        first = True
+        for block in self.blocks:
+            if left is not None and left <= 0:
+                return
+            lines = block.lines(console, options)
+            if not lines:
+                continue
+            if left is not None:
+                left -= len(lines) + 1
+            if not first:
+                yield Segment.line()
+            first = False
+            for line in lines:
+                yield from line
+                yield Segment.line()
+
+
+class IncrementalMarkdown:
+    def __init__(self, code_theme: str = "monokai"):
+        self.code_theme = code_theme
+        self._chunks: List[str] = []
+        self._blocks: List[_Block] = []
+        # complete lines of the open block, and the partial line after them
+        self._lines: List[str] = []
+        self._partial: List[str] = []
+        self._fence: Optional[str] = None
+        # a blank line was seen, the block ends unless the next line is indented
+        self._closing = False
+        self._tail: Optional[_Block] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def __bool__(self) -> bool:
+        return bool(self._chunks)
+
+    # ─── feeding ──────────────────────────────────────────────────────────────
+    def append(self, chunk: str):
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        self._tail = None
+        if "\n" not in chunk:
+            self._partial.append(chunk)
+            return
+        *complete, rest = chunk.split("\n")
+        complete[0] = "".join(self._partial) + complete[0]
+        self._partial = [rest] if rest else []
+        for line in complete:
+            self._line(line)
+
+    def _line(self, line: str):
+        if self._fence is not None:
+            self._lines.append(line)
+            if line.strip().startswith(self._fence) and not line.strip().strip(
+                self._fence[0]
+            ):
+                self._fence = None
+                self._close()
+            return
+        if not line.strip():
+            self._closing = bool(self._lines)
+            if self._closing:
+                self._lines.append(line)
+            return
+        if self._closing:
+            self._closing = False
+            if not line[0].isspace():
+                self._close()
+        fence = FENCE.match(line)
+        if fence:
+            if self._lines:
+                self._close()
+            self._fence = fence.group(1)
+        self._lines.append(line)
+
+    def _close(self):
+        source = "\n".join(self._lines).strip("\n")
+        if source:
+            self._blocks.append(_Block(source, self.code_theme))
+        self._lines = []
+        self._closing = False
+
+    # ─── rendering ────────────────────────────────────────────────────────────
+    def renderable(self, max_lines: Optional[int] = None) -> _Blocks:
+        """
+        a snapshot of what has streamed so far, later appends do not
+            change it. With max_lines the blocks after the first
+            max_lines lines are left out
+        """
+        if self._tail is None:
+            source = "\n".join(self._lines + ["".join(self._partial)])
+            self._tail = _Block(source.strip("\n"), self.code_theme)
+        return _Blocks(self._blocks + [self._tail], max_lines)
@@ -0,0 +1,13 @@
+import os
+from pathlib import Path
+
+"""
+Shared locations for everything trtl keeps on disk.
+
+The memory store and the tldr data live inside the package (see
+    trtl.memory, trtl.tools), caches that are safe to throw away
+    live under CACHE_DIR. Point TRTL_CACHE_DIR somewhere else to
+    move them, e.g. when the package is installed read-only.
+"""
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = Path(os.getenv("TRTL_CACHE_DIR", PROJECT_ROOT / "cache"))
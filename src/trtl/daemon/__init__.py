@@ -0,0 +1,13 @@
+"""
+trtl as a resident process.
+
+trtld (trtl.daemon.server) builds the Agent, its stores and its HTTP
+    clients once and serves requests over a Unix socket. The trtl
+    command (trtl.daemon.client) only imports the standard library, so
+    it is up in tens of milliseconds and streams the daemon's events
+    back. Without a daemon running, trtl starts the regular in process
+    CLI.
+
+Nothing heavy may be imported in this package's __init__, the client
+    imports it too.
+"""
@@ -0,0 +1,207 @@
+import argparse
+import os
+import socket
+import sys
+import time
+
+from trtl.daemon.protocol import decode, encode, socket_path
+
+"""
+The thin trtl client.
+
+Only the standard library is imported, so a `trtl "..."` against a
+    running daemon costs an interpreter start and a socket connect, not
+    the seconds the agent takes to build. Output is plain text streamed
+    as the events arrive, tool activity dimmed.
+
+    trtl                       interactive, on thread 1
+    trtl -t work "question"    one question on the thread "work"
+    trtl --new                 interactive on a fresh thread
+    trtl --start / --stop      start / stop the daemon
+
+/stats in the interactive client shows where the daemon's time went.
+
+Threads live in the daemon's checkpointer, naming one again picks its
+    history back up, from this client or any other. With no daemon to
+    talk to, trtl runs the regular in process CLI instead.
+"""
+
+DIM = "\033[2m"
+RESET = "\033[0m"
+
+
+def connect(path=None):
+    """a socket connected to the daemon, None when none is running"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(path or socket_path()))
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def call(message: dict, path=None):
+    """sends message and yields the daemon's answer, one dict per line"""
+    client = connect(path)
+    if client is None:
+        raise ConnectionError("trtld is not running")
+    with client, client.makefile("rb") as lines:
+        client.sendall(encode(message))
+        for line in lines:
+            yield decode(line)
+
+
+def _show(event: dict, out) -> None:
+    kind = event.get("kind")
+    if kind == "token":
+        out.write(event["text"])
+    elif kind == "tool_call_started":
+        out.write(f"\n{DIM}▸ {event['name']}{RESET}\n")
+    elif kind == "tool_output" and not event.get("final"):
+        out.write(f"{DIM}{event['text']}{RESET}")
+    elif kind == "done":
+        out.write("\n")
+        if event.get("error"):
+            out.write(f"error: {event['error']}\n")
+    elif kind == "error":
+        out.write(f"error: {event['error']}\n")
+    out.flush()
+
+
+def _show_stats(report: dict, out) -> None:
+    """the daemon's stats as a plain table, slowest stage first"""
+    if not report.get("enabled"):
+        out.write("tracing is off in the daemon (TRTL_TRACE=0)\n")
+        return
+    stages = sorted(report["stages"].items(), key=lambda item: -item[1]["total_s"])
+    out.write(f"{'stage':<28}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'total s':>9}\n")
+    for stage, row in stages:
+        out.write(
+            f"{stage:<28}{row['count']:>7}{row['p50_ms']:>10.1f}"
+            f"{row['p95_ms']:>10.1f}{row['total_s']:>9.2f}\n"
+        )
+    for model, row in sorted(report["tokens"].items()):
+        out.write(
+            f"{DIM}{model}: {row['calls']} calls, {row['prompt']} prompt"
+            f" ({row['cached']} cached), {row['completion']} completion"
+            f" tokens{RESET}\n"
+        )
+    out.flush()
+
+
+def ask(prompt: str, thread_id: str, user_id: str, path=None, out=sys.stdout):
+    message = {
+        "op": "request",
+        "prompt": prompt,
+        "thread_id": thread_id,
+        "user_id": user_id,
+    }
+    for event in call(message, path):
+        _show(event, out)
+
+
+def start_daemon(path=None, wait: float = 60.0) -> bool:
+    """starts trtld in the background, True once it answers"""
+    import subprocess
+
+    if connect(path) is not None:
+        return True
+    log = open(os.path.join(os.path.dirname(path or socket_path()), "trtld.log"), "ab")
+    command = [sys.executable, "-m", "trtl.daemon.server"]
+    if path:
+        command += ["--socket", str(path)]
+    with log:
+        daemon = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + wait
+    # a daemon that died on the way up is not worth waiting for
+    while time.monotonic() < deadline and daemon.poll() is None:
+        client = connect(path)
+        if client is not None:
+            client.close()
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def _interactive(thread_id: str, user_id: str, path=None):
+    while True:
+        try:
+            prompt = input("\n> ")
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+        if prompt.lower() in ("exit", "quit"):
+            return
+        if not prompt.strip():
+            continue
+        if prompt.strip() == "/stats":
+            try:
+                _show_stats(next(call({"op": "stats"}, path)), sys.stdout)
+            except ConnectionError:
+                print("trtld went away")
+                return
+            continue
+        try:
+            ask(prompt, thread_id, user_id, path)
+        except KeyboardInterrupt:
+            # closing the connection cancels the answer, trtl stays
+            print(f"\n{DIM}[stopped]{RESET}")
+        except ConnectionError:
+            print("trtld went away")
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="talk to trtl")
+    parser.add_argument("prompt", nargs="*", help="ask this and exit")
+    parser.add_argument("-t", "--thread", default="1", help="conversation to use")
+    parser.add_argument("--new", action="store_true", help="start a fresh thread")
+    parser.add_argument("--user", default="1")
+    parser.add_argument("--socket", help="daemon socket")
+    parser.add_argument("--start", action="store_true", help="start the daemon")
+    parser.add_argument("--stop", action="store_true", help="stop the daemon")
+    args = parser.parse_args()
+
+    if args.stop:
+        try:
+            list(call({"op": "shutdown"}, args.socket))
+        except ConnectionError:
+            pass
+        return
+    if args.start:
+        if not start_daemon(args.socket):
+            sys.exit("trtld did not come up, see trtld.log")
+        if not args.prompt:
+            return
+
+    thread_id = os.urandom(4).hex() if args.new else args.thread
+    client = connect(args.socket)
+    if client is None:
+        if args.prompt:
+            sys.exit("trtld is not running, start it with `trtl --start`")
+        # no daemon, the full CLI in this process
+        from trtl.main import main as local_main
+
+        return local_main(thread_id=thread_id, user_id=args.user)
+    client.close()
+
+    if args.new:
+        print(f"{DIM}thread {thread_id}{RESET}")
+    if args.prompt:
+        try:
+            ask(" ".join(args.prompt), thread_id, args.user, args.socket)
+        except KeyboardInterrupt:
+            sys.exit(130)
+        return
+    _interactive(thread_id, args.user, args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import json
+import os
+
+"""
+The wire format between trtl and trtld: one JSON object per line.
+
+The client sends a single request line per connection:
+
+    {"op": "request", "prompt": ..., "thread_id": ..., "user_id": ...}
+    {"op": "ping"}
+    {"op": "stats"}
+    {"op": "shutdown"}
+
+and the daemon answers with lines of events (Event.to_dict, see
+    trtl.agent.events) up to and including the "done" event, or a
+    single "pong" / "stats" / "bye" / "error" line. "stats" carries
+    trtl.utils.tracing.stats() of the daemon's session. Closing the connection
+    mid-stream cancels the request.
+
+Standard library only and as little of it as possible, the client
+    imports this.
+"""
+
+
+def socket_path() -> str:
+    path = os.getenv("TRTL_SOCKET")
+    if path:
+        return path
+    # kept short, a Unix socket path can not be longer than ~100 bytes
+    base = os.getenv("XDG_RUNTIME_DIR")
+    if not base:
+        import tempfile
+
+        base = tempfile.gettempdir()
+    return os.path.join(base, f"trtl-{os.getuid()}.sock")
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message, default=str).encode() + b"\n"
+
+
+def decode(line: bytes) -> dict:
+    return json.loads(line)
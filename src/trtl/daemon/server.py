@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from trtl.daemon.protocol import decode, encode, socket_path
+
+"""
+trtld, the resident trtl process.
+
+Everything that makes a fresh `trtl` slow to start (langchain imports,
+    the Agent and its compiled graph, the OpenAI clients, the Chroma
+    stores and the tldr index) is built once here and reused for every
+    request. Requests come in over a Unix socket (see
+    trtl.daemon.protocol), each one streams its events back on its own
+    connection, so several clients can talk to one daemon at once.
+
+Requests on the same thread_id are run one after the other, two turns
+    interleaving in one history would confuse both. A client that goes
+    away mid-answer cancels its request, which also kills any command
+    it was running.
+
+The session's timings and token counts (trtl.utils.tracing) are served
+    as Prometheus text on http://127.0.0.1:TRTL_METRICS_PORT/metrics
+    (9464, 0 turns it off), and to clients as a "stats" request.
+"""
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("TRTL_METRICS_PORT", "9464"))
+
+
+class Daemon:
+    def __init__(self, path: Optional[Path] = None, metrics_port: int = METRICS_PORT):
+        self.path = Path(path or socket_path())
+        self.metrics_port = metrics_port
+        self.agent = None
+        self.started = time.monotonic()
+        self.requests = 0
+        # thread_id -> [its lock, requests holding or waiting for it]
+        self._threads: Dict[str, List] = {}
+        self._stopped = asyncio.Event()
+        self._server = None
+        self._metrics_server = None
+
+    # ─── lifecycle ────────────────────────────────────────────────────────────
+    def _claim_socket(self):
+        """removes a socket left behind by a daemon that is gone"""
+        if not self.path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.path))
+        except OSError:
+            self.path.unlink()
+        else:
+            raise SystemExit(f"trtld is already running on {self.path}")
+        finally:
+            probe.close()
+
+    @staticmethod
+    def _warm():
+        """opens what the first request would otherwise wait for"""
+        from trtl.memory import get_memory_partitions
+        from trtl.models import get_embeddings
+        from trtl.tools import get_tldr_index
+
+        get_embeddings()
+        get_memory_partitions()
+        get_tldr_index()
+
+    async def start(self):
+        from trtl.agent import Agent
+
+        self._claim_socket()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.agent = await asyncio.to_thread(Agent)
+        # the socket is created 0600, a chmod after the bind would leave
+        # a moment where anyone could connect
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(
+                self._handle, path=str(self.path)
+            )
+        finally:
+            os.umask(umask)
+        await self._serve_metrics()
+        # the stores open in the background, the socket is already up
+        asyncio.get_running_loop().run_in_executor(None, self._warm)
+
+    def shutdown(self):
+        self._stopped.set()
+
+    async def serve(self):
+        """runs until shutdown(), a "shutdown" request or a signal"""
+        await self.start()
+        print(f"trtld listening on {self.path}", file=sys.stderr, flush=True)
+        try:
+            await self._stopped.wait()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        from trtl.tools.process import kill_all
+
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            self._metrics_server = None
+        kill_all()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    # ─── connections ──────────────────────────────────────────────────────────
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            request = decode(line)
+            op = request.get("op")
+            if op == "request":
+                await self._request(request, reader, writer)
+            elif op == "ping":
+                writer.write(
+                    encode(
+                        {
+                            "kind": "pong",
+                            "pid": os.getpid(),
+                            "uptime": time.monotonic() - self.started,
+                            "requests": self.requests,
+                        }
+                    )
+                )
+            elif op == "stats":
+                from trtl.utils import tracing
+
+                writer.write(encode({"kind": "stats", **tracing.stats()}))
+            elif op == "shutdown":
+                writer.write(encode({"kind": "bye"}))
+                self.shutdown()
+            else:
+                writer.write(encode({"kind": "error", "error": f"unknown op {op!r}"}))
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @asynccontextmanager
+    async def _turn(self, thread_id: str):
+        """
+        one request at a time per thread, the lock is dropped once no
+            request holds or waits for it
+        """
+        entry = self._threads.get(thread_id)
+        if entry is None:
+            entry = self._threads[thread_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._threads[thread_id]
+
+    async def _request(
+        self,
+        request: dict,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        self.requests += 1
+        thread_id = str(request.get("thread_id") or "1")
+        user_id = str(request.get("user_id") or "1")
+
+        async def stream():
+            async with self._turn(thread_id):
+                async for event in self.agent.aevents(
+                    request.get("prompt", ""), thread_id=thread_id, user_id=user_id
+                ):
+                    writer.write(encode(event.to_dict()))
+                    # a slow client makes the queue coalesce, not the model wait
+                    await writer.drain()
+
+        streaming = asyncio.ensure_future(stream())
+        # the client sends nothing more, EOF means it went away
+        hangup = asyncio.ensure_future(reader.read())
+        try:
+            await asyncio.wait({streaming, hangup}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            hangup.cancel()
+            if not streaming.done():
+                streaming.cancel()
+            try:
+                await streaming
+            except (asyncio.CancelledError, ConnectionError):
+                pass
+            except Exception as e:
+                # the Done event already carried it, the log gets the rest
+                print(f"trtld: request failed: {e!r}", file=sys.stderr, flush=True)
+
+    # ─── metrics ──────────────────────────────────────────────────────────────
+    async def _serve_metrics(self):
+        from trtl.utils import tracing
+
+        if not self.metrics_port or not tracing.ENABLED:
+            return
+        try:
+            self._metrics_server = await asyncio.start_server(
+                self._metrics, METRICS_HOST, self.metrics_port
+            )
+        except OSError as e:
+            # another daemon has the port, the socket is what matters
+            print(f"trtld: no metrics endpoint: {e}", file=sys.stderr, flush=True)
+        else:
+            print(
+                f"trtld metrics on http://{METRICS_HOST}:{self.metrics_port}/metrics",
+                file=sys.stderr,
+                flush=True,
+            )
+
+    def _prometheus(self) -> str:
+        from trtl.utils import tracing
+
+        return tracing.prometheus() + (
+            "# HELP trtl_daemon_requests_total requests served\n"
+            "# TYPE trtl_daemon_requests_total counter\n"
+            f"trtl_daemon_requests_total {self.requests}\n"
+            "# HELP trtl_daemon_uptime_seconds time since the daemon started\n"
+            "# TYPE trtl_daemon_uptime_seconds gauge\n"
+            f"trtl_daemon_uptime_seconds {time.monotonic() - self.started:.3f}\n"
+        )
+
+    async def _metrics(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """just enough HTTP for a scraper, GET /metrics and nothing else"""
+        try:
+            request = await reader.readline()
+            # the headers, up to the empty line
+            while (await reader.readline()).strip():
+                pass
+            method, target, _ = request.decode("latin-1").split()
+            if method == "GET" and target.split("?")[0] == "/metrics":
+                status, body = "200 OK", self._prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="the resident trtl daemon")
+    parser.add_argument("--socket", help="Unix socket to listen on")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help="port of the Prometheus endpoint on 127.0.0.1, 0 for none",
+    )
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    daemon = Daemon(args.socket, args.metrics_port)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, daemon.shutdown)
+        await daemon.serve()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Structured index of the tldr pages, next to the tldr_manuals embeddings.
+
+A tldr page is already structured: a one line summary of the tool and
+a list of examples, each a description line followed by a command
+template:
+
+    # tar
+    > Archiving utility.
+
+    - Create an archive from files:
+
+    `tar cf {{path/to/target.tar}} {{path/to/file1 path/to/file2}}`
+
+parse_page turns a page into exactly that, and TldrIndex keeps it in
+SQLite: tool -> [(description, command)] plus an FTS5 index over the
+example descriptions. When the caller already knows which tool it wants
+(EnhancedTerminal always does) a lookup is a local query of a few
+microseconds instead of an embedding request and a vector search, and
+an example's description never gets split from its command by the
+chunker. trtl-ingest builds the index in the same pass as the
+embeddings, vector search stays as the fallback.
+"""
+
+import re
+import sqlite3
+import sys
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+_EXAMPLE = re.compile(r"^- (.+?):?\s*\n+`(.+)`\s*$", re.MULTILINE)
+_SUMMARY = re.compile(r"^> (.*)$", re.MULTILINE)
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class PageEntry:
+    key: str
+    tool: str
+    platform: str
+    language: str
+    description: str
+    examples: List[Tuple[str, str]]  # (description, command template)
+
+
+def parse_page(
+    key: str, content: str, tool: str, platform: str, language: str
+) -> PageEntry:
+    summary = [
+        line
+        for line in _SUMMARY.findall(content)
+        if not line.startswith(("More information", "See also"))
+    ]
+    return PageEntry(
+        key=key,
+        tool=tool,
+        platform=platform,
+        language=language,
+        description=" ".join(line.strip() for line in summary),
+        examples=[(d.strip(), c.strip()) for d, c in _EXAMPLE.findall(content)],
+    )
+
+
+def _platforms() -> Tuple[str, ...]:
+    # tldr keeps per OS pages next to common/, prefer the ones for this OS
+    native = {"darwin": "osx", "win32": "windows"}.get(sys.platform, sys.platform)
+    return ("common", native)
+
+
+class TldrIndex:
+    def __init__(self, path: Path, readonly: bool = False):
+        self.path = Path(path)
+        if readonly:
+            uri = f"{self.path.resolve().as_uri()}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " key TEXT PRIMARY KEY,"
+                " tool TEXT NOT NULL,"
+                " platform TEXT NOT NULL,"
+                " language TEXT NOT NULL,"
+                " description TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS pages_tool ON pages (tool, language);"
+                "CREATE TABLE IF NOT EXISTS examples ("
+                " id INTEGER PRIMARY KEY,"
+                " key TEXT NOT NULL,"
+                " description TEXT NOT NULL,"
+                " command TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS examples_key ON examples (key);"
+                "CREATE VIRTUAL TABLE IF NOT EXISTS examples_fts USING fts5("
+                " description, content='examples', content_rowid='id');"
+            )
+            self._conn.commit()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["TldrIndex"]:
+        """the index at path for lookups, None if it was never built"""
+        if not Path(path).exists():
+            return None
+        return cls(path, readonly=True)
+
+    # ─── writing ──────────────────────────────────────────────────────────────
+    def _delete(self, keys: List[str]):
+        # an external content fts table needs the old values to delete them
+        self._conn.executemany(
+            "INSERT INTO examples_fts (examples_fts, rowid, description)"
+            " SELECT 'delete', id, description FROM examples WHERE key = ?",
+            [(key,) for key in keys],
+        )
+        self._conn.executemany(
+            "DELETE FROM examples WHERE key = ?", [(key,) for key in keys]
+        )
+        self._conn.executemany(
+            "DELETE FROM pages WHERE key = ?", [(key,) for key in keys]
+        )
+
+    def replace(self, entries: Iterable[PageEntry]):
+        entries = list(entries)
+        with self._lock:
+            self._delete([e.key for e in entries])
+            self._conn.executemany(
+                "INSERT INTO pages VALUES (?, ?, ?, ?, ?)",
+                [
+                    (e.key, e.tool, e.platform, e.language, e.description)
+                    for e in entries
+                ],
+            )
+            for entry in entries:
+                for description, command in entry.examples:
+                    cursor = self._conn.execute(
+                        "INSERT INTO examples (key, description, command)"
+                        " VALUES (?, ?, ?)",
+                        (entry.key, description, command),
+                    )
+                    self._conn.execute(
+                        "INSERT INTO examples_fts (rowid, description) VALUES (?, ?)",
+                        (cursor.lastrowid, description),
+                    )
+            self._conn.commit()
+
+    def forget(self, keys: List[str]):
+        with self._lock:
+            self._delete(keys)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM examples")
+            self._conn.execute(
+                "INSERT INTO examples_fts (examples_fts) VALUES ('delete-all')"
+            )
+            self._conn.commit()
+
+    def keys(self) -> set:
+        return {key for (key,) in self._conn.execute("SELECT key FROM pages")}
+
+    def close(self):
+        self._conn.close()
+
+    # ─── lookups ──────────────────────────────────────────────────────────────
+    def _page(self, tool: str, language: str) -> Optional[str]:
+        common, native = _platforms()
+        row = self._conn.execute(
+            "SELECT key FROM pages WHERE tool = ? AND language IN (?, 'en')"
+            " ORDER BY language = ? DESC, platform = ? DESC, platform = ? DESC"
+            " LIMIT 1",
+            (tool, language, language, common, native),
+        ).fetchone()
+        return row[0] if row else None
+
+    def examples(self, tool: str, language: str = "en") -> List[Tuple[str, str]]:
+        """every (description, command) tldr has for tool"""
+        key = self._page(tool, language)
+        if key is None:
+            return []
+        return self._conn.execute(
+            "SELECT description, command FROM examples WHERE key = ? ORDER BY id",
+            (key,),
+        ).fetchall()
+
+    def lookup(
+        self, tool: str, task: str = "", language: str = "en", limit: int = 3
+    ) -> List[Tuple[str, str]]:
+        """
+        tool's examples best matching task, by bm25 over the example
+            descriptions. when no description matches, the page's
+            first examples, they are the most common uses
+        """
+        key = self._page(tool, language)
+        if key is None:
+            return []
+        words = _WORD.findall(task.lower())
+        if words:
+            rows = self._conn.execute(
+                "SELECT e.description, e.command"
+                " FROM examples_fts JOIN examples e ON e.id = examples_fts.rowid"
+                " WHERE examples_fts MATCH ? AND e.key = ?"
+                " ORDER BY bm25(examples_fts) LIMIT ?",
+                (" OR ".join(f'"{w}"' for w in words), key, limit),
+            ).fetchall()
+            if rows:
+                return rows
+        return self._conn.execute(
+            "SELECT description, command FROM examples WHERE key = ?"
+            " ORDER BY id LIMIT ?",
+            (key, limit),
+        ).fetchall()
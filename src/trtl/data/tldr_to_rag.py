@@ -1,53 +1,463 @@
 """
-This scripts reads all of the manual pages 
-of a bunch of commandline tools that are in the tldr 
-project. 
+This module reads the manual pages of a bunch of commandline tools
+from the tldr project and keeps the tldr_manuals Chroma collection
+in sync with them.
 
-It expects the tldr dir to be in the same scope
-as the agent dir. 
+Point it at a checkout of https://github.com/tldr-pages/tldr, every
+platform under pages/ and every translation under pages.<lang>/ is
+picked up:
+
+    trtl-ingest ~/src/tldr
+    trtl-ingest ~/src/tldr --language en --language de
+
+Ingestion is incremental. A manifest next to the Chroma files records
+the hash and chunk count of every page, so a refresh only re-chunks and
+re-embeds pages that were added or changed, and deletes the chunks of
+pages that went away. Chunking runs in a process pool, embedding in
+bounded batches on a few threads. A page only lands in the manifest
+once all of its chunks are written, so an interrupted run picks up
+where it stopped.
+
+The same pass parses every page into the structured tldr index (see
+tldr_index.py), which answers exact tool lookups without embeddings.
+A sync that changed the collection also exports it for the in process
+numpy backend (see tldr_vectors.py).
 """
 
+import argparse
+import hashlib
+import os
 import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
 
 import trtl
+from trtl.data.tldr_index import PageEntry, TldrIndex, parse_page
 
 load_dotenv()
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
 
 # ─── Project Base & Data Directory ────────────────────────────────────────────
 PROJECT_ROOT = Path(trtl.__file__).resolve().parent
 DATA_DIR = PROJECT_ROOT / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-# === LOAD & CHUNK FILES ===
-docs = []
-splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=20)
+TLDR_PATH = os.getenv("TLDR_PATH")
+COLLECTION_NAME = "tldr_manuals"
+PERSIST_DIR = DATA_DIR
+MANIFEST_PATH = DATA_DIR / "tldr_manifest.sqlite3"
+INDEX_PATH = DATA_DIR / "tldr_index.sqlite3"
+VECTORS_PATH = DATA_DIR / "tldr_vectors"
+
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 20
+
+
+def _language(key: str) -> str:
+    # pages/ is english, translations live in pages.<lang>/
+    top = key.split("/", 1)[0]
+    return top.split(".", 1)[1] if "." in top else "en"
+
+
+@dataclass
+class Page:
+    key: str  # path relative to the tldr root, e.g. pages/linux/apt.md
+    path: Path
+    size: int
+    mtime_ns: int
+    digest: Optional[str] = None
+
+    @property
+    def language(self) -> str:
+        return _language(self.key)
+
+    @property
+    def platform(self) -> str:
+        return Path(self.key).parent.name
+
+
+@dataclass
+class IngestReport:
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (
+            f"{self.added} added, {self.changed} changed, {self.removed} removed, "
+            f"{self.unchanged} unchanged, {self.chunks} chunks embedded "
+            f"in {self.seconds:.1f}s"
+        )
+
+
+# ─── Page discovery ───────────────────────────────────────────────────────────
+def discover_pages(root: Path, languages: Optional[List[str]] = None) -> Iterator[Page]:
+    """
+    yields every page under pages/ and pages.<lang>/, or every *.md
+    directly inside root when it is a single platform directory
+    """
+    page_dirs = sorted(
+        d
+        for d in root.iterdir()
+        if d.is_dir() and re.fullmatch(r"pages(\..+)?", d.name)
+    )
+    if page_dirs:
+        files = (f for d in page_dirs for f in sorted(d.glob("*/*.md")))
+    else:
+        files = iter(sorted(root.glob("*.md")))
+
+    for file_path in files:
+        stat = file_path.stat()
+        page = Page(
+            key=file_path.relative_to(root).as_posix(),
+            path=file_path,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+        )
+        if languages and page.language not in languages:
+            continue
+        yield page
+
+
+def _hash_file(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _chunk_ids(key: str, count: int) -> List[str]:
+    return [f"{key}#{i}" for i in range(count)]
+
+
+# ─── Chunking (runs in worker processes) ─────────────────────────────────────
+_splitter = None
+
 
-for file_path in Path(TLDR_PATH).glob("*.md"):
-    tool = file_path.stem
-    content = file_path.read_text(encoding="utf-8")
+def chunk_page(key: str, path: str, language: str, platform: str):
+    """
+    split one page into chunks, returns (key, [(text, metadata)], PageEntry)
+    """
+    global _splitter
+    if _splitter is None:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+        )
+
+    content = Path(path).read_text(encoding="utf-8")
     # Extract the first quoted line as the tool description
     desc_match = re.search(r"> (.*?)\n", content)
-    description = desc_match.group(1).strip() if desc_match else ""
+    metadata = {
+        "tool": Path(path).stem,
+        "description": desc_match.group(1).strip() if desc_match else "",
+        "platform": platform,
+        "language": language,
+        "source": key,
+    }
+    entry = parse_page(key, content, metadata["tool"], platform, language)
+    return key, [(text, metadata) for text in _splitter.split_text(content)], entry
+
+
+def index_page(key: str, path: str, language: str, platform: str) -> PageEntry:
+    """
+    parse one page for the structured index only, for pages whose
+    embeddings are up to date but that are missing from the index
+    """
+    content = Path(path).read_text(encoding="utf-8")
+    return parse_page(key, content, Path(path).stem, platform, language)
+
+
+# ─── Manifest ─────────────────────────────────────────────────────────────────
+class Manifest:
+    """
+    page key -> (sha256, size, mtime, chunk count) of what is in Chroma
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " key TEXT PRIMARY KEY,"
+            " digest TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " chunks INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Tuple[str, int, int, int]]:
+        rows = self._conn.execute(
+            "SELECT key, digest, size, mtime_ns, chunks FROM pages"
+        ).fetchall()
+        return {key: rest for key, *rest in rows}
+
+    def record(self, pages: List[Tuple[Page, int]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                [(p.key, p.digest, p.size, p.mtime_ns, n) for p, n in pages],
+            )
+            self._conn.commit()
 
-    chunks = splitter.create_documents(
-        [content], metadatas=[{"tool": tool, "description": description}]
+    def touch(self, pages: List[Page]):
+        """
+        content unchanged, only the stat info moved (git checkout, touch)
+        """
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE pages SET size = ?, mtime_ns = ? WHERE key = ?",
+                [(p.size, p.mtime_ns, p.key) for p in pages],
+            )
+            self._conn.commit()
+
+    def forget(self, keys: List[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM pages WHERE key = ?", [(key,) for key in keys]
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+# ─── Pipeline ─────────────────────────────────────────────────────────────────
+def _open_store(persist_dir: Path, collection_name: str):
+    from langchain_chroma import Chroma
+
+    from trtl.models import get_embeddings
+
+    return Chroma(
+        persist_directory=str(persist_dir),
+        collection_name=collection_name,
+        embedding_function=get_embeddings(),
     )
-    docs.extend(chunks)
-
-# === EMBED & PERSIST ===
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-db = Chroma.from_documents(
-    documents=docs,
-    embedding=embeddings,
-    collection_name=COLLECTION_NAME,
-    persist_directory=PERSIST_DIR,
-)
-db.persist()
-print(f"✅ RAG DB built with {len(docs)} chunks for {TLDR_PATH}")
+
+
+def _plan(pages: List[Page], known: dict, report: IngestReport):
+    """
+    sort pages into the ones that need (re)embedding and the ones that
+    only need their stat info refreshed
+    """
+    todo, touched = [], []
+    for page in pages:
+        entry = known.get(page.key)
+        if entry and (entry[1], entry[2]) == (page.size, page.mtime_ns):
+            report.unchanged += 1
+            continue
+        # stat changed or page is new, the hash decides
+        page.digest = _hash_file(page.path)
+        if entry and entry[0] == page.digest:
+            touched.append(page)
+            report.unchanged += 1
+        else:
+            todo.append(page)
+            if entry:
+                report.changed += 1
+            else:
+                report.added += 1
+    return todo, touched
+
+
+def _batches(chunked, batch_size: int):
+    """
+    group whole pages into batches of roughly batch_size chunks, so a
+    batch finishing means every page in it is fully written
+    """
+    batch, size = [], 0
+    for item in chunked:
+        batch.append(item)
+        size += len(item[1])
+        if size >= batch_size:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def ingest(
+    tldr_path: Path,
+    languages: Optional[List[str]] = None,
+    persist_dir: Path = PERSIST_DIR,
+    collection_name: str = COLLECTION_NAME,
+    manifest_path: Path = MANIFEST_PATH,
+    index_path: Path = INDEX_PATH,
+    vectors_path: Optional[Path] = VECTORS_PATH,
+    int8: bool = False,
+    workers: Optional[int] = None,
+    batch_size: int = 256,
+    embed_concurrency: int = 4,
+    full: bool = False,
+) -> IngestReport:
+    started = time.perf_counter()
+    report = IngestReport()
+    manifest = Manifest(manifest_path)
+    index = TldrIndex(index_path)
+    store = _open_store(persist_dir, collection_name)
+    collection = store._collection
+    write_lock = threading.Lock()
+
+    try:
+        if full:
+            manifest.clear()
+            index.clear()
+        known = manifest.load()
+        if not known and collection.count():
+            # chunks from a build that predates the manifest have random ids
+            # we cannot map back to pages, start the collection over
+            store.reset_collection()
+            collection = store._collection
+
+        pages = list(discover_pages(Path(tldr_path), languages))
+        seen = {page.key for page in pages}
+        todo, touched = _plan(pages, known, report)
+        manifest.touch(touched)
+
+        gone = [key for key in known if key not in seen]
+        # removed pages only count when the whole corpus was scanned
+        if languages:
+            gone = [key for key in gone if _language(key) in languages]
+        for key in gone:
+            collection.delete(ids=_chunk_ids(key, known[key][3]))
+        manifest.forget(gone)
+        index.forget(gone)
+        report.removed = len(gone)
+
+        by_key = {page.key: page for page in todo}
+        embeddings = store.embeddings
+
+        def write(batch):
+            texts = [text for _, chunks, _ in batch for text, _ in chunks]
+            vectors = embeddings.embed_documents(texts)
+            ids, metadatas, stale = [], [], []
+            for key, chunks, _ in batch:
+                ids.extend(_chunk_ids(key, len(chunks)))
+                metadatas.extend(metadata for _, metadata in chunks)
+                previous = known.get(key)
+                if previous and previous[3] > len(chunks):
+                    stale.extend(_chunk_ids(key, previous[3])[len(chunks) :])
+            with write_lock:
+                if stale:
+                    collection.delete(ids=stale)
+                if ids:
+                    collection.upsert(
+                        ids=ids,
+                        embeddings=vectors,
+                        metadatas=metadatas,
+                        documents=texts,
+                    )
+            index.replace(entry for _, _, entry in batch)
+            manifest.record([(by_key[key], len(chunks)) for key, chunks, _ in batch])
+            return len(texts)
+
+        with ProcessPoolExecutor(max_workers=workers) as chunkers, ThreadPoolExecutor(
+            max_workers=embed_concurrency
+        ) as embedders:
+            chunked = chunkers.map(
+                chunk_page,
+                [p.key for p in todo],
+                [str(p.path) for p in todo],
+                [p.language for p in todo],
+                [p.platform for p in todo],
+                chunksize=64,
+            )
+            pending = set()
+            for batch in _batches(chunked, batch_size):
+                # keep at most a couple of batches in flight per embedder
+                if len(pending) >= embed_concurrency * 2:
+                    done = next(as_completed(pending))
+                    pending.remove(done)
+                    report.chunks += done.result()
+                pending.add(embedders.submit(write, batch))
+            for done in as_completed(pending):
+                report.chunks += done.result()
+
+            # pages embedded before the index existed, parse them, no embedding
+            indexed = index.keys()
+            missing = [p for p in pages if p.key not in indexed]
+            index.replace(
+                chunkers.map(
+                    index_page,
+                    [p.key for p in missing],
+                    [str(p.path) for p in missing],
+                    [p.language for p in missing],
+                    [p.platform for p in missing],
+                    chunksize=64,
+                )
+            )
+        changed = report.added or report.changed or report.removed
+        if vectors_path is not None and (changed or not Path(vectors_path).exists()):
+            from trtl.data.tldr_vectors import export
+
+            export(collection, vectors_path, int8=int8)
+    finally:
+        manifest.close()
+        index.close()
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sync tldr pages into trtl's RAG db")
+    parser.add_argument(
+        "tldr_path",
+        nargs="?",
+        default=TLDR_PATH,
+        help="tldr checkout (or a single pages dir), defaults to $TLDR_PATH",
+    )
+    parser.add_argument(
+        "--language",
+        action="append",
+        dest="languages",
+        help="only ingest these languages (repeatable), default is all",
+    )
+    parser.add_argument("--workers", type=int, help="chunking processes")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--embed-concurrency", type=int, default=4)
+    parser.add_argument(
+        "--full", action="store_true", help="ignore the manifest and rebuild"
+    )
+    parser.add_argument(
+        "--int8",
+        action="store_true",
+        help="quantize the exported vectors of the numpy backend",
+    )
+    args = parser.parse_args()
+    if not args.tldr_path:
+        parser.error("no tldr path given and $TLDR_PATH is not set")
+
+    try:
+        report = ingest(
+            Path(args.tldr_path).expanduser(),
+            languages=args.languages,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            embed_concurrency=args.embed_concurrency,
+            full=args.full,
+            int8=args.int8,
+        )
+    except KeyboardInterrupt:
+        print("interrupted, finished pages are kept, run again to resume")
+        sys.exit(130)
+    print(f"✅ RAG DB synced for {args.tldr_path}: {report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+The tldr_manuals embeddings as one matrix, searched in process.
+
+The collection is a few thousand short chunks and read far more often
+than it is written, so going through Chroma's client, its SQLite and
+its HNSW graph for every query is more machinery than it needs.
+export() writes the collection out next to it as
+
+    vectors.npy    one row per chunk, unit length, float32, or int8
+                   with a per row scale in scales.npy (a quarter of
+                   the size, a little recall lost to rounding)
+    records.bin    each chunk's text and metadata as JSON, back to back
+    offsets.npy    where each chunk's record starts in records.bin
+    meta.json      count, dimensions, dtype, when it was exported
+
+TldrVectors.open() maps those files instead of reading them, so opening
+is a few syscalls and the pages are read as queries touch them. A
+search is one matrix product against the (normalised) query vectors,
+any number of queries at once, and an argpartition for the top k: an
+exact search, where HNSW is approximate. For unit vectors the ranking
+is the one Chroma's l2 distance gives.
+
+TldrVectorRetriever puts it behind langchain's retriever interface,
+get_cli_rag_retriever (trtl.tools) hands it to EnhancedTerminal when
+TRTL_TLDR_BACKEND says so. trtl-ingest exports after every sync that
+changed the collection.
+
+    python -m trtl.data.tldr_vectors             export the collection
+    python -m trtl.data.tldr_vectors --int8      the same, quantized
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManager,
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManager,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import get_config_list
+
+import trtl
+from trtl.utils import tracing
+
+PROJECT_ROOT = Path(trtl.__file__).resolve().parent
+VECTORS_PATH = PROJECT_ROOT / "data" / "tldr_vectors"
+
+# rows read from chroma per request while exporting
+_EXPORT_BATCH = 1000
+# rows of an int8 matrix turned back into float32 at a time
+_DEQUANT_BLOCK = 8192
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """symmetric per row int8, vectors ≈ quantized * scales[:, None]"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+# ─── export ───────────────────────────────────────────────────────────────────
+def _read_collection(collection):
+    """ids, vectors, documents and metadatas of every chunk, in id order"""
+    ids, vectors, documents, metadatas = [], [], [], []
+    total = collection.count()
+    for offset in range(0, total, _EXPORT_BATCH):
+        batch = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=_EXPORT_BATCH,
+            offset=offset,
+        )
+        ids.extend(batch["ids"])
+        vectors.extend(batch["embeddings"])
+        documents.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+    # same order whatever order chroma hands them out in
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    return (
+        [ids[i] for i in order],
+        [vectors[i] for i in order],
+        [documents[i] for i in order],
+        [metadatas[i] for i in order],
+    )
+
+
+def export(collection, path: Path = VECTORS_PATH, int8: bool = False) -> dict:
+    """
+    writes the chroma collection out as a TldrVectors directory at path,
+        replacing the one there only once the new one is complete. An
+        empty collection has nothing to search, it removes the export
+        instead, so TldrVectors.open() comes back with None
+    """
+    path = Path(path)
+    if collection.count() == 0:
+        shutil.rmtree(path, ignore_errors=True)
+        return {"count": 0, "dim": 0, "dtype": None, "exported_at": time.time()}
+    ids, vectors, documents, metadatas = _read_collection(collection)
+    staging = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    matrix = _normalise(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+    if int8:
+        matrix, scales = quantize(matrix)
+        np.save(staging / "scales.npy", scales)
+    np.save(staging / "vectors.npy", matrix)
+
+    offsets = [0]
+    with open(staging / "records.bin", "wb") as f:
+        for chunk_id, text, metadata in zip(ids, documents, metadatas):
+            record = json.dumps(
+                {"id": chunk_id, "page_content": text, "metadata": metadata or {}},
+                ensure_ascii=False,
+            ).encode("utf-8")
+            f.write(record)
+            offsets.append(offsets[-1] + len(record))
+    np.save(staging / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+    meta = {
+        "count": len(ids),
+        "dim": int(matrix.shape[1]),
+        "dtype": str(matrix.dtype),
+        "exported_at": time.time(),
+    }
+    (staging / "meta.json").write_text(json.dumps(meta))
+
+    # a reader that already mapped the old files keeps them until it closes
+    retired = path.with_name(f"{path.name}.{os.getpid()}.old")
+    if path.exists():
+        os.replace(path, retired)
+    os.replace(staging, path)
+    shutil.rmtree(retired, ignore_errors=True)
+    return meta
+
+
+# ─── search ───────────────────────────────────────────────────────────────────
+class TldrVectors:
+    def __init__(self, path: Path):
+        path = Path(path)
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text())
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        self.scales = (
+            np.load(path / "scales.npy", mmap_mode="r")
+            if self.vectors.dtype == np.int8
+            else None
+        )
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.records = np.memmap(path / "records.bin", dtype=np.uint8, mode="r")
+
+    @classmethod
+    def open(cls, path: Path = VECTORS_PATH) -> Optional["TldrVectors"]:
+        """the export at path, None if there never was one"""
+        if not (Path(path) / "meta.json").exists():
+            return None
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """(rows, queries) cosine similarities"""
+        if self.scales is None:
+            return self.vectors @ queries.T
+        # int8 goes back to float32 a block at a time, never the whole
+        # matrix at once
+        scores = np.empty((len(self), queries.shape[0]), dtype=np.float32)
+        for start in range(0, len(self), _DEQUANT_BLOCK):
+            stop = start + _DEQUANT_BLOCK
+            block = self.vectors[start:stop].astype(np.float32) @ queries.T
+            scores[start:stop] = block * self.scales[start:stop, None]
+        return scores
+
+    def search(
+        self, queries: Sequence[Sequence[float]], k: int = 4
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        the k best (row, score) of each query, best first. All queries
+            go through one matrix product
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if queries.shape[1] != self.dim:
+            raise ValueError(
+                f"query has {queries.shape[1]} dimensions, the tldr vectors "
+                f"have {self.dim}, re-run trtl-ingest with this embedding model"
+            )
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in queries]
+        scores = self._scores(_normalise(queries))
+        # the k best in any order, then only those k get sorted
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        results = []
+        for column in range(queries.shape[0]):
+            rows = top[:, column]
+            best = rows[np.argsort(-scores[rows, column], kind="stable")]
+            results.append([(int(row), float(scores[row, column])) for row in best])
+        return results
+
+    def record(self, row: int) -> dict:
+        start, stop = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self.records[start:stop].tobytes())
+
+    def document(self, row: int, score: Optional[float] = None) -> Document:
+        record = self.record(row)
+        metadata = dict(record["metadata"])
+        if score is not None:
+            metadata["score"] = score
+        return Document(
+            id=record["id"], page_content=record["page_content"], metadata=metadata
+        )
+
+
+class TldrVectorRetriever(BaseRetriever):
+    """
+    retriever over TldrVectors, a drop in for the Chroma retriever.
+        batch() embeds all its queries in one request and searches them
+        in one matrix product, with the callbacks invoke() would run
+    """
+
+    vectors: TldrVectors
+    embeddings: Embeddings
+    k: int = 4
+
+    def _documents(self, hits: List[Tuple[int, float]]) -> List[Document]:
+        return [self.vectors.document(row, score) for row, score in hits]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = self.embeddings.embed_query(query)
+        with tracing.span("tldr.search", backend="numpy"):
+            (hits,) = self.vectors.search([vector], self.k)
+        return self._documents(hits)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = await self.embeddings.aembed_query(query)
+        # a few milliseconds of numpy, not worth a thread
+        with tracing.span("tldr.search", backend="numpy"):
+            (hits,) = self.vectors.search([vector], self.k)
+        return self._documents(hits)
+
+    def search_many(self, queries: List[str]) -> List[List[Document]]:
+        if not queries:
+            return []
+        vectors = self.embeddings.embed_documents(queries)
+        return self._search_vectors(vectors)
+
+    async def asearch_many(self, queries: List[str]) -> List[List[Document]]:
+        if not queries:
+            return []
+        vectors = await self.embeddings.aembed_documents(queries)
+        return self._search_vectors(vectors)
+
+    def _search_vectors(self, vectors) -> List[List[Document]]:
+        with tracing.span("tldr.search", backend="numpy", queries=len(vectors)):
+            hits = self.vectors.search(vectors, self.k)
+        return [self._documents(found) for found in hits]
+
+    def _callback_managers(self, inputs: List[str], config, manager_class):
+        """
+        (callback manager, on_retriever_start arguments) per query, set
+            up the way invoke() sets up its own
+        """
+        managers = []
+        for query, conf in zip(inputs, get_config_list(config, len(inputs))):
+            manager = manager_class.configure(
+                conf.get("callbacks"),
+                None,
+                inheritable_tags=conf.get("tags"),
+                local_tags=self.tags,
+                inheritable_metadata={
+                    **(conf.get("metadata") or {}),
+                    **self._get_ls_params(),
+                },
+                local_metadata=self.metadata,
+            )
+            start = dict(
+                serialized=None,
+                query=query,
+                name=conf.get("run_name") or self.get_name(),
+                run_id=conf.get("run_id"),
+            )
+            managers.append((manager, start))
+        return managers
+
+    def batch(
+        self,
+        inputs: List[str],
+        config=None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs,
+    ) -> List[List[Document]]:
+        """
+        one embedding request and one matrix product for all of inputs,
+            each query still reported as a retriever run of its own. They
+            share the request, so an error is every query's error
+        """
+        if not inputs:
+            return []
+        runs = [
+            manager.on_retriever_start(**start)
+            for manager, start in self._callback_managers(
+                inputs, config, CallbackManager
+            )
+        ]
+        try:
+            results = self.search_many(inputs)
+        except Exception as e:
+            for run in runs:
+                run.on_retriever_error(e)
+            if return_exceptions:
+                return [e] * len(inputs)
+            raise
+        for run, documents in zip(runs, results):
+            run.on_retriever_end(documents)
+        return results
+
+    async def abatch(
+        self,
+        inputs: List[str],
+        config=None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs,
+    ) -> List[List[Document]]:
+        if not inputs:
+            return []
+        runs = [
+            await manager.on_retriever_start(**start)
+            for manager, start in self._callback_managers(
+                inputs, config, AsyncCallbackManager
+            )
+        ]
+        try:
+            results = await self.asearch_many(inputs)
+        except Exception as e:
+            for run in runs:
+                await run.on_retriever_error(e)
+            if return_exceptions:
+                return [e] * len(inputs)
+            raise
+        for run, documents in zip(runs, results):
+            await run.on_retriever_end(documents)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="export the tldr_manuals collection for the numpy backend"
+    )
+    parser.add_argument("--int8", action="store_true", help="quantize the vectors")
+    parser.add_argument("--output", default=str(VECTORS_PATH))
+    args = parser.parse_args()
+
+    from trtl.data.tldr_to_rag import COLLECTION_NAME, PERSIST_DIR, _open_store
+
+    collection = _open_store(PERSIST_DIR, COLLECTION_NAME)._collection
+    meta = export(collection, Path(args.output), int8=args.int8)
+    if not meta["count"]:
+        print("⚠️ the tldr_manuals collection is empty, nothing exported")
+        return
+    print(f"✅ {meta['count']} chunks ({meta['dtype']}) exported to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
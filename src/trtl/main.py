@@ -1,19 +1,32 @@
+import asyncio
+import sys
+from typing import Optional
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from rich.console import Console
 
-from .agent import Agent
-from .cli import cli_loop, print_splash, print_tools
+from .cli import acli_loop, print_splash, print_tools
 
 
-def main():
+def main(thread_id: Optional[str] = None, user_id: Optional[str] = None):
+    """the full CLI in this process, thread and user default to the agent's"""
     console = Console()
-    trtl_agent = Agent()
+    # splash goes up before the agent is built, so the user sees
+    # something while langchain and the model client load
     print_splash(console)
+
+    from .agent import Agent
+
+    trtl_agent = Agent()
     print_tools(trtl_agent.tools, console)
-    cli_loop(trtl_agent)
+    try:
+        asyncio.run(acli_loop(trtl_agent, thread_id=thread_id, user_id=user_id))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # a Ctrl+C, acli_loop already said goodbye
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,15 @@
+import asyncio
 import uuid
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 
-from langchain_chroma import Chroma
-from langchain_core.documents import Document
 from langchain_core.runnables import RunnableConfig
-from langchain_core.tools import tool
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.tools import StructuredTool
 
 import trtl
+from trtl.memory.lifecycle import get_memory_lifecycle
+from trtl.memory.writer import get_memory_writer
 
 # ─── Determine Project Base Directory ──────────────────────────────────────────
 # If this file lives at project_root/src/trtl/memory.py, then:
@@ -36,14 +37,22 @@ TODO: there is a better design for this than instantiating
       randomly declared instance of the vector store.
       Vector store should likely be created as part of Agent
       and should be passed into memory tool...?
+
+The store is opened on first use rather than at import time, so
+    that importing trtl (and printing the splash) stays cheap.
 """
-persistent_memory_vector_store = Chroma(
-    collection_name="trtl_persisted_memories",
-    embedding_function=OpenAIEmbeddings(model="text-embedding-3-small"),
-    persist_directory=str(PERSIST_DIR),  # now absolute to project base
-)
 
-memory_retriever = persistent_memory_vector_store.as_retriever(search_kwargs={"k": 3})
+
+@lru_cache(maxsize=None)
+def get_memory_partitions():
+    from trtl.memory.partitions import MemoryPartitions
+
+    return MemoryPartitions(PERSIST_DIR)  # now absolute to project base
+
+
+def get_persistent_memory_vector_store(user_id: str):
+    """every user's memories live in a collection of their own"""
+    return get_memory_partitions().get(user_id)
 
 
 def _get_user_id(config: RunnableConfig) -> str:
@@ -57,8 +66,7 @@ def _get_user_id(config: RunnableConfig) -> str:
     return user_id
 
 
-@tool
-def save_persistent_memory(memory: str, config: RunnableConfig) -> str:
+def _save_persistent_memory(memory: str, config: RunnableConfig) -> str:
     """
     This is tool is used for persisting memory accross sessions.
     It can be requested any time by telling trtl to persist whatever info
@@ -66,17 +74,17 @@ def save_persistent_memory(memory: str, config: RunnableConfig) -> str:
     it thinks will enhance its interactions with them in the future including
     notes on the users file system, habits, personal info, preferences, interests, ect.
     """
-    user_id = _get_user_id(config)
-    document = Document(
-        page_content=memory,
-        metadata={"user_id": user_id},
-    )
-    persistent_memory_vector_store.add_documents([document])
+    # queued, the writer embeds and stores it in the background
+    get_memory_writer().submit(_get_user_id(config), memory)
+    return memory
+
+
+async def _asave_persistent_memory(memory: str, config: RunnableConfig) -> str:
+    get_memory_writer().submit(_get_user_id(config), memory)
     return memory
 
 
-@tool
-def search_persistent_memories(query: str, config: RunnableConfig) -> List[str]:
+def _search_persistent_memories(query: str, config: RunnableConfig) -> List[str]:
     """
     This tool is for searching through persistent memories. trtl can use this whenever
     the user asks about what persistent memories it has access to. trtl will use this
@@ -84,8 +92,36 @@ def search_persistent_memories(query: str, config: RunnableConfig) -> List[str]:
     habits and preferences.
     """
     user_id = _get_user_id(config)
+    # memories saved moments ago may still be queued
+    if get_memory_writer().pending(user_id):
+        get_memory_writer().flush()
 
-    documents = persistent_memory_vector_store.similarity_search(
-        query, k=3, filter={"user_id": user_id}
+    documents = get_persistent_memory_vector_store(user_id).similarity_search(
+        query, k=3
     )
+    get_memory_lifecycle().touch(user_id, documents)
+    return [doc.page_content for doc in documents]
+
+
+async def _asearch_persistent_memories(query: str, config: RunnableConfig) -> List[str]:
+    user_id = _get_user_id(config)
+    if get_memory_writer().pending(user_id):
+        await asyncio.to_thread(get_memory_writer().flush)
+    store = get_persistent_memory_vector_store(user_id)
+    vector = await store.embeddings.aembed_query(query)
+    documents = await asyncio.to_thread(store.similarity_search_by_vector, vector, k=3)
+    await asyncio.to_thread(get_memory_lifecycle().touch, user_id, documents)
     return [doc.page_content for doc in documents]
+
+
+save_persistent_memory = StructuredTool.from_function(
+    func=_save_persistent_memory,
+    coroutine=_asave_persistent_memory,
+    name="save_persistent_memory",
+)
+
+search_persistent_memories = StructuredTool.from_function(
+    func=_search_persistent_memories,
+    coroutine=_asearch_persistent_memories,
+    name="search_persistent_memories",
+)
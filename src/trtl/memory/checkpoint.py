@@ -0,0 +1,560 @@
+import asyncio
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.types import TASKS
+
+import trtl
+
+"""
+Durable chat history for the agent graph.
+
+LangGraph hands the checkpointer the full channel values on every step,
+    so storing them as-is (what MemorySaver and SqliteSaver do) copies
+    the whole, ever growing, messages list into every checkpoint. Here
+    every message is stored once, in an append-only table keyed by its
+    id and a digest of its content, and a checkpoint's messages channel
+    is just the list of those refs. Storage grows with the conversation
+    instead of with its square.
+
+Writes go to SQLite in WAL mode and are committed in batches (every
+    commit_every statements or commit_interval seconds, and on flush()).
+    Only the newest keep_checkpoints checkpoints of a thread are kept,
+    compact() drops the rest along with messages and channel values
+    nothing references any more.
+"""
+
+PROJECT_ROOT = Path(trtl.__file__).resolve().parent
+PERSIST_DIR = PROJECT_ROOT / "trtl_chat_history_db"
+
+MESSAGES_CHANNEL = "messages"
+# type tag of a messages channel value that was stored as refs
+REFS_TYPE = "trtl_message_refs"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    ref TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, ref)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    blob BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
+
+
+class DeltaSqliteSaver(BaseCheckpointSaver[str]):
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        *,
+        keep_checkpoints: int = 20,
+        compact_every: int = 50,
+        commit_every: int = 64,
+        commit_interval: float = 1.0,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = Path(path or PERSIST_DIR / "checkpoints.sqlite3")
+        self.keep_checkpoints = keep_checkpoints
+        self.compact_every = compact_every
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # let the WAL file shrink back after checkpoints instead of staying
+        # at its high water mark
+        self._conn.execute("PRAGMA journal_size_limit=4194304")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._lock = threading.RLock()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        self._puts_since_compact = {}
+        # (thread, ns, message id) -> (message object, ref), so a message
+        # that is already stored is not serialized again on every step
+        self._refs: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._refs_max = 10_000
+
+    # ─── commit batching ──────────────────────────────────────────────────────
+    def _wrote(self, statements: int = 1):
+        self._uncommitted += statements
+        if (
+            self._uncommitted >= self.commit_every
+            or time.monotonic() - self._last_commit >= self.commit_interval
+        ):
+            self._commit()
+
+    def _commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def flush(self):
+        """
+        commit whatever is still pending, call at the end of a turn
+        """
+        with self._lock:
+            if self._uncommitted:
+                self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+    # ─── messages, stored once and referenced afterwards ──────────────────────
+    def _message_refs(self, thread_id: str, checkpoint_ns: str, messages) -> List[str]:
+        refs, rows = [], []
+        for message in messages:
+            message_id = getattr(message, "id", None)
+            cache_key = (thread_id, checkpoint_ns, message_id)
+            cached = self._refs.get(cache_key) if message_id else None
+            if cached and cached[0] is message:
+                self._refs.move_to_end(cache_key)
+                refs.append(cached[1])
+                continue
+            type_, blob = self.serde.dumps_typed(message)
+            # the digest keeps older checkpoints intact when a message is
+            # replaced by id (add_messages allows that)
+            ref = f"{message_id or ''}:{hashlib.sha1(blob).hexdigest()[:16]}"
+            rows.append((thread_id, checkpoint_ns, ref, type_, blob))
+            refs.append(ref)
+            if message_id:
+                self._refs[cache_key] = (message, ref)
+                if len(self._refs) > self._refs_max:
+                    self._refs.popitem(last=False)
+        if rows:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return refs
+
+    def _load_messages(self, thread_id: str, checkpoint_ns: str, refs: List[str]):
+        loaded = {}
+        for start in range(0, len(refs), 500):
+            batch = refs[start : start + 500]
+            marks = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                "SELECT ref, type, blob FROM messages WHERE thread_id = ?"
+                f" AND checkpoint_ns = ? AND ref IN ({marks})",
+                (thread_id, checkpoint_ns, *batch),
+            ).fetchall()
+            loaded.update(
+                (ref, self.serde.loads_typed((type_, blob)))
+                for ref, type_, blob in rows
+            )
+        # the graph carries these objects forward, remember their refs so
+        # the next put does not serialize them all over again
+        for ref, message in loaded.items():
+            if message_id := getattr(message, "id", None):
+                self._refs[(thread_id, checkpoint_ns, message_id)] = (message, ref)
+        while len(self._refs) > self._refs_max:
+            self._refs.popitem(last=False)
+        return [loaded[ref] for ref in refs if ref in loaded]
+
+    # ─── channel values ───────────────────────────────────────────────────────
+    def _dump_value(self, thread_id: str, checkpoint_ns: str, channel: str, value):
+        if channel == MESSAGES_CHANNEL and isinstance(value, list):
+            refs = self._message_refs(thread_id, checkpoint_ns, value)
+            return REFS_TYPE, json.dumps(refs).encode()
+        return self.serde.dumps_typed(value)
+
+    def _load_values(
+        self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions
+    ) -> dict:
+        values = {}
+        for channel, version in versions.items():
+            row = self._conn.execute(
+                "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?"
+                " AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                continue
+            type_, blob = row
+            if type_ == REFS_TYPE:
+                refs = json.loads(blob)
+                values[channel] = self._load_messages(thread_id, checkpoint_ns, refs)
+            else:
+                values[channel] = self.serde.loads_typed((type_, blob))
+        return values
+
+    # ─── reading ──────────────────────────────────────────────────────────────
+    def _tuple(self, row) -> CheckpointTuple:
+        (
+            thread_id,
+            checkpoint_ns,
+            checkpoint_id,
+            parent_id,
+            type_,
+            blob,
+            metadata_type,
+            metadata,
+        ) = row
+        checkpoint = self.serde.loads_typed((type_, blob))
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, blob FROM writes WHERE thread_id = ?"
+            " AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        sends = []
+        if parent_id:
+            sends = self._conn.execute(
+                "SELECT type, blob FROM writes WHERE thread_id = ? AND checkpoint_ns = ?"
+                " AND checkpoint_id = ? AND channel = ? ORDER BY task_path, task_id, idx",
+                (thread_id, checkpoint_ns, parent_id, TASKS),
+            ).fetchall()
+        return CheckpointTuple(
+            config=_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_values(
+                    thread_id, checkpoint_ns, checkpoint["channel_versions"]
+                ),
+                "pending_sends": [self.serde.loads_typed(send) for send in sends],
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                _config(thread_id, checkpoint_ns, parent_id) if parent_id else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((t, b)))
+                for task_id, channel, t, b in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+            return self._tuple(row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query, params = "SELECT * FROM checkpoints WHERE 1 = 1", []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            with self._lock:
+                item = self._tuple(row)
+            if filter and not all(
+                item.metadata.get(key) == value for key, value in filter.items()
+            ):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    # ─── writing ──────────────────────────────────────────────────────────────
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        c = checkpoint.copy()
+        c.pop("pending_sends", None)
+        values = c.pop("channel_values")
+
+        with self._lock:
+            blob_rows = []
+            for channel, version in new_versions.items():
+                if channel in values:
+                    type_, blob = self._dump_value(
+                        thread_id, checkpoint_ns, channel, values[channel]
+                    )
+                else:
+                    type_, blob = "empty", None
+                blob_rows.append(
+                    (thread_id, checkpoint_ns, channel, str(version), type_, blob)
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blob_rows
+            )
+            type_, blob = self.serde.dumps_typed(c)
+            metadata_type, metadata_blob = self.serde.dumps_typed(
+                get_checkpoint_metadata(config, metadata)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    blob,
+                    metadata_type,
+                    metadata_blob,
+                ),
+            )
+            self._wrote(len(blob_rows) + 1)
+
+            key = (thread_id, checkpoint_ns)
+            self._puts_since_compact[key] = self._puts_since_compact.get(key, 0) + 1
+            if self._puts_since_compact[key] >= self.compact_every:
+                self._compact(thread_id, checkpoint_ns)
+
+        return _config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # special writes (errors, interrupts) replace, regular ones are kept
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint_id,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    blob,
+                    task_path,
+                )
+            )
+        with self._lock:
+            self._conn.executemany(
+                f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._wrote(len(rows))
+
+    # ─── retention ────────────────────────────────────────────────────────────
+    def _compact(self, thread_id: str, checkpoint_ns: str):
+        self._puts_since_compact[(thread_id, checkpoint_ns)] = 0
+        where = "thread_id = ? AND checkpoint_ns = ?"
+        key = (thread_id, checkpoint_ns)
+        stale = self._conn.execute(
+            f"SELECT checkpoint_id FROM checkpoints WHERE {where}"
+            " ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (*key, self.keep_checkpoints),
+        ).fetchall()
+        if stale:
+            ids = [(*key, checkpoint_id) for (checkpoint_id,) in stale]
+            self._conn.executemany(
+                f"DELETE FROM checkpoints WHERE {where} AND checkpoint_id = ?", ids
+            )
+            self._conn.executemany(
+                f"DELETE FROM writes WHERE {where} AND checkpoint_id = ?", ids
+            )
+
+        # channel values and messages only the dropped checkpoints used
+        kept_versions, kept_refs = set(), set()
+        for type_, blob in self._conn.execute(
+            f"SELECT type, checkpoint FROM checkpoints WHERE {where}", key
+        ).fetchall():
+            versions = self.serde.loads_typed((type_, blob))["channel_versions"]
+            kept_versions.update((ch, str(v)) for ch, v in versions.items())
+        for channel, version, type_, blob in self._conn.execute(
+            f"SELECT channel, version, type, blob FROM blobs WHERE {where}", key
+        ).fetchall():
+            if (channel, version) not in kept_versions:
+                self._conn.execute(
+                    f"DELETE FROM blobs WHERE {where} AND channel = ? AND version = ?",
+                    (*key, channel, version),
+                )
+            elif type_ == REFS_TYPE:
+                kept_refs.update(json.loads(blob))
+        orphans = [
+            (*key, ref)
+            for (ref,) in self._conn.execute(
+                f"SELECT ref FROM messages WHERE {where}", key
+            ).fetchall()
+            if ref not in kept_refs
+        ]
+        self._conn.executemany(
+            f"DELETE FROM messages WHERE {where} AND ref = ?", orphans
+        )
+        self._commit()
+        if orphans:
+            # a cached ref may point at a row that is gone now
+            self._refs.clear()
+
+    def compact(self, thread_id: Optional[str] = None, vacuum: bool = False):
+        """
+        apply the retention policy now, to one thread or all of them
+        """
+        with self._lock:
+            if thread_id is None:
+                keys = self._conn.execute(
+                    "SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints"
+                ).fetchall()
+            else:
+                keys = self._conn.execute(
+                    "SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints"
+                    " WHERE thread_id = ?",
+                    (thread_id,),
+                ).fetchall()
+            for key in keys:
+                self._compact(*key)
+            if vacuum:
+                self._conn.execute("VACUUM")
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("checkpoints", "blobs", "messages", "writes"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,)
+                )
+            self._commit()
+            self._refs.clear()
+
+    def get_next_version(self, current: Optional[str], channel) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ─── async, the sqlite work runs off the event loop ───────────────────────
+    # a put can serialize a long history or run a compaction, the async CLI
+    # and the daemon would stall on it. The lock keeps the threads in order
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(
+            self.put_writes, config, writes, task_id, task_path
+        )
@@ -0,0 +1,331 @@
+import argparse
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from trtl.memory.recall import memory_changed
+
+"""
+Lifecycle of the persistent memory store.
+
+Left alone the memory store only grows, and every recall searches
+    all of it. Each memory carries three bits of metadata:
+    created_at, last_accessed (epoch seconds) and access_count, bumped
+    whenever recall or the search tool returns it. With those:
+
+    - enforce(): memories not accessed for TTL days are expired and a user
+      over their cap loses the least used ones. It runs after every
+      write of the memory writer, so it only reads a user's memories
+      when they are over the cap or their expiry sweep (at most one
+      per SWEEP_SECONDS) is due, and then reads them once for both.
+    - consolidate(): memories of a user that sit within merge_similarity
+      of each other are merged into the most used one of them (their
+      access counts add up), the rest are deleted.
+    - compact(): the offline job, expire + consolidate + cap for every
+      user, then VACUUM the Chroma sqlite file. Returns a report with
+      the store size before and after.
+
+TRTL_MEMORY_TTL_DAYS, TRTL_MEMORY_CAP and TRTL_MEMORY_MERGE tune the
+    defaults. `trtl-memory stats` and `trtl-memory compact` run it all
+    from the shell, best while trtl itself is not running. Every user has
+    a collection of their own (see partitions.py), the policies run per
+    collection.
+"""
+
+DEFAULT_TTL_DAYS = float(os.getenv("TRTL_MEMORY_TTL_DAYS", "180"))
+DEFAULT_CAP = int(os.getenv("TRTL_MEMORY_CAP", "500"))
+DEFAULT_MERGE_SIMILARITY = float(os.getenv("TRTL_MEMORY_MERGE", "0.85"))
+DAY = 24 * 60 * 60
+# a TTL counts in days, enforce() looks for expired memories this often
+SWEEP_SECONDS = 60 * 60
+
+
+def new_metadata(user_id: str, now: Optional[float] = None) -> dict:
+    now = time.time() if now is None else now
+    return {
+        "user_id": user_id,
+        "created_at": now,
+        "last_accessed": now,
+        "access_count": 0,
+    }
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+@dataclass
+class StoreStats:
+    memories: int
+    per_user: Dict[str, int]
+    disk_bytes: int
+
+    def __str__(self):
+        return (
+            f"{self.memories} memories for {len(self.per_user)} users, "
+            f"{self.disk_bytes / 1e6:.1f}MB on disk"
+        )
+
+
+@dataclass
+class CompactionReport:
+    before: StoreStats
+    after: Optional[StoreStats] = None
+    expired: int = 0
+    merged: int = 0
+    evicted: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (
+            f"{self.expired} expired, {self.merged} merged, {self.evicted} evicted "
+            f"in {self.seconds:.1f}s\n  before: {self.before}\n  after:  {self.after}"
+        )
+
+
+@dataclass
+class _Record:
+    id: str
+    text: str
+    metadata: dict
+    vector: list = field(repr=False, default_factory=list)
+
+    @property
+    def last_accessed(self) -> float:
+        return self.metadata.get("last_accessed") or self.metadata.get(
+            "created_at", 0.0
+        )
+
+    @property
+    def access_count(self) -> int:
+        return self.metadata.get("access_count", 0)
+
+
+class MemoryLifecycle:
+    def __init__(
+        self,
+        ttl_days: float = DEFAULT_TTL_DAYS,
+        cap: int = DEFAULT_CAP,
+        merge_similarity: float = DEFAULT_MERGE_SIMILARITY,
+    ):
+        self.ttl = ttl_days * DAY
+        self.cap = cap
+        self.merge_similarity = merge_similarity
+        # user_id -> when enforce() last looked for expired memories
+        self._swept: Dict[str, float] = {}
+
+    @staticmethod
+    def collection(user_id: str):
+        from trtl.memory import get_persistent_memory_vector_store
+
+        return get_persistent_memory_vector_store(user_id)._collection
+
+    # ─── access tracking ──────────────────────────────────────────────────────
+    def touch(self, user_id: str, documents: Iterable):
+        """records a hit on each of user_id's documents (as returned by a search)"""
+        ids = [doc.id for doc in documents if doc.id]
+        if not ids:
+            return
+        now = time.time()
+        collection = self.collection(user_id)
+        found = collection.get(ids=ids, include=["metadatas"])
+        metadatas = []
+        for metadata in found["metadatas"]:
+            metadata = dict(metadata or {})
+            metadata.setdefault("created_at", now)
+            metadata["last_accessed"] = now
+            metadata["access_count"] = metadata.get("access_count", 0) + 1
+            metadatas.append(metadata)
+        collection.update(ids=found["ids"], metadatas=metadatas)
+
+    # ─── records ──────────────────────────────────────────────────────────────
+    def users(self) -> Dict[str, int]:
+        from trtl.memory import get_memory_partitions
+
+        return {
+            user_id: self.collection(user_id).count()
+            for user_id in get_memory_partitions().users()
+        }
+
+    def _records(self, user_id: str, vectors: bool = False) -> List[_Record]:
+        include = ["metadatas", "documents"] + (["embeddings"] if vectors else [])
+        collection = self.collection(user_id)
+        found = collection.get(include=include)
+        embeddings = found.get("embeddings")
+        if embeddings is None:
+            embeddings = [[]] * len(found["ids"])
+        records = [
+            _Record(id, text, dict(metadata or {}), list(vector))
+            for id, text, metadata, vector in zip(
+                found["ids"], found["documents"], found["metadatas"], embeddings
+            )
+        ]
+        # memories from before the lifecycle existed start their clock now
+        legacy = [r for r in records if "created_at" not in r.metadata]
+        if legacy:
+            now = time.time()
+            for record in legacy:
+                record.metadata = {**new_metadata(user_id, now), **record.metadata}
+            collection.update(
+                ids=[r.id for r in legacy], metadatas=[r.metadata for r in legacy]
+            )
+        return records
+
+    def _delete(self, user_id: str, ids: List[str]) -> int:
+        if ids:
+            self.collection(user_id).delete(ids=ids)
+            memory_changed(user_id)
+        return len(ids)
+
+    # ─── policies ─────────────────────────────────────────────────────────────
+    def _stale(self, records: List[_Record], now: Optional[float] = None) -> List[str]:
+        cutoff = (time.time() if now is None else now) - self.ttl
+        return [r.id for r in records if r.last_accessed < cutoff]
+
+    def _overflow(self, records: List[_Record]) -> List[str]:
+        if len(records) <= self.cap:
+            return []
+        # least used first, the least recently used among equals
+        records = sorted(records, key=lambda r: (r.access_count, r.last_accessed))
+        return [r.id for r in records[: len(records) - self.cap]]
+
+    def expire(self, user_id: str, now: Optional[float] = None) -> int:
+        return self._delete(user_id, self._stale(self._records(user_id), now))
+
+    def evict(self, user_id: str) -> int:
+        return self._delete(user_id, self._overflow(self._records(user_id)))
+
+    def enforce(self, user_ids: Iterable[str]) -> int:
+        now = time.time()
+        removed = 0
+        for user_id in user_ids:
+            sweep = now - self._swept.get(user_id, 0.0) >= SWEEP_SECONDS
+            if not sweep and self.collection(user_id).count() <= self.cap:
+                continue
+            records = self._records(user_id)
+            stale = set(self._stale(records, now)) if sweep else set()
+            kept = [r for r in records if r.id not in stale]
+            removed += self._delete(user_id, [*stale, *self._overflow(kept)])
+            if sweep:
+                self._swept[user_id] = now
+        return removed
+
+    def consolidate(self, user_id: str) -> int:
+        import numpy as np
+
+        records = self._records(user_id, vectors=True)
+        if len(records) < 2:
+            return 0
+        # the most used memory of a cluster is the one that survives it
+        records.sort(key=lambda r: (r.access_count, r.last_accessed), reverse=True)
+        vectors = np.asarray([r.vector for r in records], dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        similarity = vectors @ vectors.T
+
+        kept: List[int] = []
+        absorbed: Dict[int, List[int]] = {}
+        for i in range(len(records)):
+            into = next(
+                (k for k in kept if similarity[i, k] >= self.merge_similarity), None
+            )
+            if into is None:
+                kept.append(i)
+            else:
+                absorbed.setdefault(into, []).append(i)
+
+        updated, removed = [], []
+        for k, members in absorbed.items():
+            metadata = dict(records[k].metadata)
+            metadata["access_count"] = sum(
+                records[i].access_count for i in [k, *members]
+            )
+            metadata["last_accessed"] = max(
+                records[i].last_accessed for i in [k, *members]
+            )
+            metadata["merged"] = metadata.get("merged", 0) + len(members)
+            updated.append((records[k].id, metadata))
+            removed += [records[i].id for i in members]
+        if updated:
+            self.collection(user_id).update(
+                ids=[id for id, _ in updated], metadatas=[m for _, m in updated]
+            )
+        return self._delete(user_id, removed)
+
+    # ─── offline compaction ───────────────────────────────────────────────────
+    def stats(self) -> StoreStats:
+        per_user = self.users()
+        from trtl.memory import PERSIST_DIR
+
+        return StoreStats(sum(per_user.values()), per_user, _dir_size(PERSIST_DIR))
+
+    def vacuum(self):
+        from trtl.memory import PERSIST_DIR
+
+        conn = sqlite3.connect(PERSIST_DIR / "chroma.sqlite3", timeout=30)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    def compact(
+        self, user_id: Optional[str] = None, vacuum: bool = True
+    ) -> CompactionReport:
+        started = time.monotonic()
+        report = CompactionReport(before=self.stats())
+        for user in [user_id] if user_id else list(report.before.per_user):
+            report.expired += self.expire(user)
+            report.merged += self.consolidate(user)
+            report.evicted += self.evict(user)
+        if vacuum:
+            self.vacuum()
+        report.after = self.stats()
+        report.seconds = time.monotonic() - started
+        return report
+
+
+@lru_cache(maxsize=None)
+def get_memory_lifecycle() -> MemoryLifecycle:
+    return MemoryLifecycle()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="maintain trtl's persistent memory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="size of the memory store")
+    compact = commands.add_parser(
+        "compact", help="expire, merge and evict memories, then vacuum"
+    )
+    compact.add_argument("--user", help="only this user id")
+    compact.add_argument("--no-vacuum", action="store_true")
+    commands.add_parser(
+        "migrate", help="split the old shared collection into one per user"
+    )
+    args = parser.parse_args()
+
+    lifecycle = get_memory_lifecycle()
+    if args.command == "migrate":
+        from trtl.memory import get_memory_partitions
+
+        moved = get_memory_partitions().migrate()
+        if moved is None:
+            print("nothing to migrate")
+        else:
+            for user_id, count in sorted(moved.items()):
+                print(f"  user {user_id}: {count} memories")
+            print(f"✅ migrated {sum(moved.values())} memories")
+    elif args.command == "stats":
+        stats = lifecycle.stats()
+        print(stats)
+        for user_id, count in sorted(stats.per_user.items()):
+            print(f"  user {user_id}: {count}")
+    else:
+        report = lifecycle.compact(user_id=args.user, vacuum=not args.no_vacuum)
+        print(f"✅ memory compacted: {report}")
+
+
+if __name__ == "__main__":
+    main()
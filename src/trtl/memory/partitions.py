@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+"""
+One Chroma collection per user.
+
+Memories used to live in a single trtl_persisted_memories collection and
+    every search filtered it by user_id, so each query walked an index
+    mostly made of other people's vectors. Now every user gets their own
+    collection, created on first use, and a search only ever touches the
+    vectors of the user asking.
+
+Collection names are a hash of the user id (Chroma is strict about
+    names), the user id itself is kept in the collection metadata.
+    MemoryPartitions keeps at most max_open collection handles around,
+    least recently used goes first, and has Chroma unload idle HNSW
+    segments past TRTL_MEMORY_SEGMENT_MB.
+
+migrate() splits an old single collection into the per user ones, run
+    `trtl-memory migrate` once after upgrading.
+"""
+
+LEGACY_COLLECTION = "trtl_persisted_memories"
+PREFIX = "trtl_memories_"
+DEFAULT_MAX_OPEN = int(os.getenv("TRTL_MEMORY_OPEN_PARTITIONS", "32"))
+SEGMENT_CACHE_MB = int(os.getenv("TRTL_MEMORY_SEGMENT_MB", "512"))
+
+
+def collection_name(user_id: str) -> str:
+    return PREFIX + hashlib.sha1(user_id.encode()).hexdigest()[:20]
+
+
+class MemoryPartitions:
+    def __init__(self, persist_dir, max_open: int = DEFAULT_MAX_OPEN):
+        self.persist_dir = str(persist_dir)
+        self.max_open = max_open
+        self._open: "OrderedDict[str, object]" = OrderedDict()
+        self._client = None
+        # Chroma races on creating the same collection from two threads
+        self._lock = threading.RLock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import chromadb
+                from chromadb.config import Settings
+
+                self._client = chromadb.PersistentClient(
+                    path=self.persist_dir,
+                    settings=Settings(
+                        anonymized_telemetry=False,
+                        chroma_segment_cache_policy="LRU",
+                        chroma_memory_limit_bytes=SEGMENT_CACHE_MB * 1024 * 1024,
+                    ),
+                )
+            return self._client
+
+    def get(self, user_id: str):
+        """the vector store holding user_id's memories"""
+        with self._lock:
+            store = self._open.get(user_id)
+            if store is not None:
+                self._open.move_to_end(user_id)
+                return store
+
+            from langchain_chroma import Chroma
+
+            from trtl.models import get_embeddings
+
+            store = Chroma(
+                client=self.client,
+                collection_name=collection_name(user_id),
+                collection_metadata={"user_id": user_id},
+                embedding_function=get_embeddings(),
+            )
+            self._open[user_id] = store
+            if len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+            return store
+
+    def _names(self) -> List[str]:
+        # since chroma 0.6 list_collections gives names only
+        return [str(name) for name in self.client.list_collections()]
+
+    def users(self) -> Dict[str, str]:
+        """user id -> collection name, for every user that has memories"""
+        users = {}
+        for name in self._names():
+            if name.startswith(PREFIX):
+                metadata = self.client.get_collection(name).metadata or {}
+                users[metadata.get("user_id", name)] = name
+        return users
+
+    # ─── migration ────────────────────────────────────────────────────────────
+    def migrate(self, page_size: int = 1000) -> Optional[Dict[str, int]]:
+        """
+        moves every memory of the old shared collection into its user's
+            collection and drops the old one, None when there is nothing
+            to migrate. vectors are copied, nothing is re-embedded
+        """
+        if LEGACY_COLLECTION not in self._names():
+            return None
+        legacy = self.client.get_collection(LEGACY_COLLECTION)
+        moved: Dict[str, int] = {}
+        offset = 0
+        while True:
+            page = legacy.get(
+                include=["metadatas", "documents", "embeddings"],
+                limit=page_size,
+                offset=offset,
+            )
+            if not page["ids"]:
+                break
+            by_user: Dict[str, list] = {}
+            for row in zip(
+                page["ids"], page["documents"], page["metadatas"], page["embeddings"]
+            ):
+                user_id = (row[2] or {}).get("user_id", "unknown")
+                by_user.setdefault(user_id, []).append(row)
+            for user_id, rows in by_user.items():
+                # upsert, so a migration that was cut short can be rerun
+                self.get(user_id)._collection.upsert(
+                    ids=[r[0] for r in rows],
+                    documents=[r[1] for r in rows],
+                    metadatas=[{**(r[2] or {}), "user_id": user_id} for r in rows],
+                    embeddings=[list(r[3]) for r in rows],
+                )
+                moved[user_id] = moved.get(user_id, 0) + len(rows)
+            offset += len(page["ids"])
+        self.client.delete_collection(LEGACY_COLLECTION)
+        return moved
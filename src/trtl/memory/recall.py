@@ -0,0 +1,182 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+from trtl.utils import tracing
+
+"""
+Memory recall with a latency budget.
+
+The agent wants the user's persistent memories in the prompt on every
+    model call, but a recall costs an embedding request plus a vector
+    search. Recall makes that cheap enough to do every time:
+
+    - results are cached per (user, query), so the steps of one turn
+      (same human message) and repeated questions never search twice
+    - a search is started before the history is prepared and only
+      waited on afterwards, so the two overlap
+    - the wait is capped by a budget (TRTL_RECALL_BUDGET_MS). A slower
+      search is left running, the step goes ahead without memories and
+      the finished result is cached for the next step
+
+Saving a memory bumps that user's generation, which is part of the
+    cache key, so a new memory shows up in the very next recall.
+"""
+
+DEFAULT_BUDGET_MS = float(os.getenv("TRTL_RECALL_BUDGET_MS", "300"))
+
+_generations: Dict[str, int] = defaultdict(int)
+
+
+def memory_changed(user_id: str):
+    """called whenever memories of user_id are written, drops cached recalls"""
+    _generations[user_id] += 1
+
+
+Key = Tuple[str, int, str]
+
+
+class Recall:
+    def __init__(
+        self, k: int = 3, budget_ms: float = DEFAULT_BUDGET_MS, cache_size: int = 256
+    ):
+        self.k = k
+        self.budget = budget_ms / 1000
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Key, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Key, Future] = {}
+        self._ainflight: Dict[Key, asyncio.Task] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _key(self, user_id: str, query: str) -> Key:
+        return (user_id, _generations[user_id], query)
+
+    def _cached(self, key: Key) -> Optional[List[str]]:
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def _store(self, key: Key, memories: List[str]):
+        with self._lock:
+            self._cache[key] = memories
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ─── searching ────────────────────────────────────────────────────────────
+    def search(self, user_id: str, query: str) -> List[str]:
+        from trtl.memory import get_persistent_memory_vector_store
+        from trtl.memory.lifecycle import get_memory_lifecycle
+
+        with tracing.span("recall.search"):
+            documents = get_persistent_memory_vector_store(user_id).similarity_search(
+                query, k=self.k
+            )
+        get_memory_lifecycle().touch(user_id, documents)
+        return [doc.page_content for doc in documents]
+
+    async def asearch(self, user_id: str, query: str) -> List[str]:
+        from trtl.memory import get_persistent_memory_vector_store
+        from trtl.memory.lifecycle import get_memory_lifecycle
+
+        store = get_persistent_memory_vector_store(user_id)
+        with tracing.span("recall.search"):
+            # embedding goes out on the event loop, the vector search is local
+            vector = await store.embeddings.aembed_query(query)
+            documents = await asyncio.to_thread(
+                store.similarity_search_by_vector, vector, k=self.k
+            )
+        await asyncio.to_thread(get_memory_lifecycle().touch, user_id, documents)
+        return [doc.page_content for doc in documents]
+
+    # ─── start now, collect later ─────────────────────────────────────────────
+    def start(self, user_id: str, query: str) -> Optional[Future]:
+        """
+        begins a search in the background, None when the result is
+            already cached (or there is nothing to search for)
+        """
+        key = self._key(user_id, query)
+        if not query or self._cached(key) is not None:
+            return None
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=2, thread_name_prefix="trtl-recall"
+                    )
+                # in the turn's context, so the search's spans are part of it
+                future = self._pool.submit(
+                    contextvars.copy_context().run, self.search, user_id, query
+                )
+                self._inflight[key] = future
+                future.add_done_callback(lambda f: self._finish(key, f))
+        return future
+
+    def _finish(self, key: Key, future: Future):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self._store(key, future.result())
+
+    def collect(
+        self, user_id: str, query: str, future: Optional[Future], deadline: float
+    ) -> List[str]:
+        """
+        the memories for query, waiting for future at most until deadline
+            (a time.monotonic value), [] when it is not there by then
+        """
+        cached = self._cached(self._key(user_id, query))
+        if cached is not None or future is None:
+            return cached or []
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            return []
+        except Exception:
+            return []
+
+    def astart(self, user_id: str, query: str) -> Optional[asyncio.Task]:
+        key = self._key(user_id, query)
+        if not query or self._cached(key) is not None:
+            return None
+        task = self._ainflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.asearch(user_id, query))
+            self._ainflight[key] = task
+            task.add_done_callback(lambda t: self._afinish(key, t))
+        return task
+
+    def _afinish(self, key: Key, task: asyncio.Task):
+        self._ainflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._store(key, task.result())
+
+    async def acollect(
+        self,
+        user_id: str,
+        query: str,
+        task: Optional[asyncio.Task],
+        deadline: float,
+    ) -> List[str]:
+        cached = self._cached(self._key(user_id, query))
+        if cached is not None or task is None:
+            return cached or []
+        try:
+            # shield, so a missed deadline leaves the search running
+            return await asyncio.wait_for(
+                asyncio.shield(task), max(0.0, deadline - time.monotonic())
+            )
+        except asyncio.TimeoutError:
+            return []
+        except Exception:
+            # recall is a nice to have, a failing store must not fail the turn
+            return []
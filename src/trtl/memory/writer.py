@@ -0,0 +1,240 @@
+import atexit
+import math
+import os
+import threading
+import time
+import uuid
+import warnings
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from trtl.memory.lifecycle import get_memory_lifecycle, new_metadata
+from trtl.memory.recall import memory_changed
+
+"""
+Write-behind saving of persistent memories.
+
+The agent is told to save memories on its own, so save_persistent_memory
+    runs a lot and used to cost an embedding request plus a Chroma write
+    inline in the agent loop every time, often for a fact it had already
+    saved. MemoryWriter takes the save off the loop:
+
+    - submit() only queues the memory and returns
+    - a background thread flushes the queue once it holds batch_size
+      memories or the oldest one has waited flush_interval seconds, and
+      close() (registered with atexit) flushes whatever is left
+    - a flush embeds the whole batch in one request and drops every
+      memory that is within `similarity` (cosine) of one the user
+      already has, or of one earlier in the same batch
+
+Queued memories are not searchable until they are flushed, the memory
+    search tool flushes first so the agent always finds what it saved.
+
+A flush that fails puts its batch back, and the background thread waits
+    longer before each try (flush_interval, doubling up to MAX_BACKOFF).
+    A memory is given up on after TRTL_MEMORY_ATTEMPTS tries, with a
+    warning naming it, and counted in stats()["dropped"].
+"""
+
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_FLUSH_INTERVAL = 2.0
+DEFAULT_SIMILARITY = float(os.getenv("TRTL_MEMORY_DEDUPE", "0.92"))
+MAX_ATTEMPTS = int(os.getenv("TRTL_MEMORY_ATTEMPTS", "3"))
+# longest wait between two tries of a failing flush
+MAX_BACKOFF = 60.0
+
+
+@dataclass
+class PendingMemory:
+    user_id: str
+    text: str
+    attempts: int = 0
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class MemoryWriter:
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        similarity: float = DEFAULT_SIMILARITY,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.similarity = similarity
+        self._queue: List[PendingMemory] = []
+        self._oldest: Optional[float] = None
+        self._wake = threading.Condition()
+        # one flush at a time, the background thread and flush() share it
+        self._flushing = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._failures = 0
+        self.written = 0
+        self.skipped = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _collection(user_id: str):
+        from trtl.memory import get_persistent_memory_vector_store
+
+        return get_persistent_memory_vector_store(user_id)._collection
+
+    # ─── queueing ─────────────────────────────────────────────────────────────
+    def submit(self, user_id: str, text: str):
+        with self._wake:
+            if self._closed:
+                raise RuntimeError("memory writer is closed")
+            self._queue.append(PendingMemory(user_id, text))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="trtl-memory-writer", daemon=True
+                )
+                self._thread.start()
+            self._wake.notify()
+
+    def pending(self, user_id: Optional[str] = None) -> int:
+        with self._wake:
+            return sum(
+                1 for m in self._queue if user_id is None or m.user_id == user_id
+            )
+
+    def _due(self) -> bool:
+        return len(self._queue) >= self.batch_size or (
+            self._oldest is not None
+            and time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def _loop(self):
+        while True:
+            with self._wake:
+                while not self._closed and not self._due():
+                    wait = None
+                    if self._oldest is not None:
+                        wait = self._oldest + self.flush_interval - time.monotonic()
+                    self._wake.wait(timeout=wait)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                # the batch went back on the queue, back off before the next
+                # try, submit() keeps queueing meanwhile
+                warnings.warn(f"saving memories failed: {e}")
+                with self._wake:
+                    self._wake.wait_for(lambda: self._closed, self._backoff())
+
+    # ─── flushing ─────────────────────────────────────────────────────────────
+    def _take(self) -> List[PendingMemory]:
+        with self._wake:
+            batch, self._queue = self._queue, []
+            self._oldest = None
+        return batch
+
+    def _backoff(self) -> float:
+        return min(self.flush_interval * 2 ** (self._failures - 1), MAX_BACKOFF)
+
+    def _requeue(self, batch: List[PendingMemory]):
+        retry = [m for m in batch if m.attempts < MAX_ATTEMPTS]
+        given_up = [m for m in batch if m.attempts >= MAX_ATTEMPTS]
+        if given_up:
+            self.dropped += len(given_up)
+            warnings.warn(
+                f"gave up saving {len(given_up)} memories after {MAX_ATTEMPTS} "
+                "attempts: "
+                + "; ".join(f"{m.user_id}: {m.text[:80]!r}" for m in given_up)
+            )
+        with self._wake:
+            self._queue[:0] = retry
+            if retry and self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _is_known(self, user_id: str, vector: List[float]) -> bool:
+        found = self._collection(user_id).query(
+            query_embeddings=[vector], n_results=1, include=["embeddings"]
+        )
+        nearest = found["embeddings"][0] if found["embeddings"] else []
+        return len(nearest) > 0 and _cosine(vector, nearest[0]) >= self.similarity
+
+    def flush(self) -> int:
+        """writes out everything queued, returns how many memories were stored"""
+        with self._flushing:
+            batch = self._take()
+            if not batch:
+                return 0
+            for memory in batch:
+                memory.attempts += 1
+            try:
+                from trtl.models import get_embeddings
+
+                vectors = get_embeddings().embed_documents([m.text for m in batch])
+                keep: List[int] = []
+                for i, (memory, vector) in enumerate(zip(batch, vectors)):
+                    duplicate = any(
+                        batch[j].user_id == memory.user_id
+                        and _cosine(vector, vectors[j]) >= self.similarity
+                        for j in keep
+                    ) or self._is_known(memory.user_id, vector)
+                    if duplicate:
+                        self.skipped += 1
+                    else:
+                        keep.append(i)
+                now = time.time()
+                for user_id in {batch[i].user_id for i in keep}:
+                    mine = [i for i in keep if batch[i].user_id == user_id]
+                    self._collection(user_id).add(
+                        ids=[str(uuid.uuid4()) for _ in mine],
+                        embeddings=[vectors[i] for i in mine],
+                        documents=[batch[i].text for i in mine],
+                        metadatas=[new_metadata(user_id, now) for _ in mine],
+                    )
+            except Exception:
+                self._failures += 1
+                self._requeue(batch)
+                raise
+            self._failures = 0
+            written = {batch[i].user_id for i in keep}
+            for user_id in written:
+                memory_changed(user_id)
+            self.written += len(keep)
+            # keep the users that just grew within their TTL and cap
+            get_memory_lifecycle().enforce(written)
+            return len(keep)
+
+    def close(self):
+        """flushes what is left and stops the background thread"""
+        with self._wake:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
+        while self.pending():
+            try:
+                self.flush()
+            except Exception as e:
+                warnings.warn(f"saving memories failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending(),
+            "written": self.written,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_memory_writer() -> MemoryWriter:
+    writer = MemoryWriter()
+    atexit.register(writer.close)
+    return writer
@@ -0,0 +1,57 @@
+from functools import lru_cache
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+from trtl.models.embeddings import CachedEmbeddings, ScheduledEmbeddings
+
+"""
+Model clients shared across trtl.
+
+Anything that talks to a model provider should get its client from
+    here rather than constructing its own, so caching (and anything
+    else layered on later) applies everywhere at once. Every call to
+    the provider goes through trtl.models.scheduler, the clients are
+    built without retries of their own, and they all share the one
+    connection pool of trtl.models.http.
+"""
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# set by use_embeddings, stands in for every model
+_override: Optional[Embeddings] = None
+
+
+def use_embeddings(embeddings: Optional[Embeddings]):
+    """
+    makes get_embeddings return embeddings from now on (None goes back
+    to the provider's), for the benchmarks and anything else that has
+    to run without network
+    """
+    global _override
+    _override = embeddings
+
+
+def get_embeddings(model: str = EMBEDDING_MODEL) -> Embeddings:
+    """
+    the one embeddings instance for a model, used by memory, the tldr
+    retriever and ingestion alike
+    """
+    if _override is not None:
+        return _override
+    return _provider_embeddings(model)
+
+
+@lru_cache(maxsize=None)
+def _provider_embeddings(model: str) -> CachedEmbeddings:
+    from langchain_openai import OpenAIEmbeddings
+
+    from trtl.models.http import get_async_http_client, get_http_client
+
+    client = OpenAIEmbeddings(
+        model=model,
+        max_retries=0,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+    return CachedEmbeddings(ScheduledEmbeddings(client, model), model=model)
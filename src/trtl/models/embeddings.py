@@ -0,0 +1,287 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+from trtl.config import CACHE_DIR
+from trtl.utils import tracing
+
+"""
+Content addressed embedding cache.
+
+Vectors are keyed by sha256(model + text) and kept in a local SQLite
+    file, so the same text is only ever sent to the provider once,
+    no matter whether memory, the tldr retriever or ingestion asked
+    for it. Misses in one call are embedded in a single batched
+    request, and the least recently used rows are evicted once the
+    cache grows past max_entries.
+"""
+
+DEFAULT_PATH = CACHE_DIR / "embeddings.sqlite3"
+
+# sqlite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def _key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    wraps any langchain Embeddings with the on-disk cache
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        path: Optional[Path] = None,
+        max_entries: int = 200_000,
+        batch_size: int = 512,
+    ):
+        self.underlying = underlying
+        self.model = model
+        self.path = Path(path or DEFAULT_PATH)
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        # rows in the table, at most: counted once, then every insert adds
+        # to it (a replaced row or another process's rows make it drift,
+        # it is only recounted once it says the cache is full)
+        self._rows: Optional[int] = None
+
+    # ─── storage ──────────────────────────────────────────────────────────────
+    def _db(self) -> sqlite3.Connection:
+        # opened on first use, the cache should not cost anything at import
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used"
+                " ON embeddings (last_used)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            db = self._db()
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start : start + _SQL_BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})",
+                    batch,
+                ).fetchall()
+                found.update((key, _unpack(blob)) for key, blob in rows)
+            if found:
+                now = time.time()
+                db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                db.commit()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                [(key, self.model, _pack(vec), now) for key, vec in vectors.items()],
+            )
+            if self._rows is not None:
+                self._rows += len(vectors)
+            self._evict(db)
+            db.commit()
+
+    def _count(self, db: sqlite3.Connection) -> int:
+        (self._rows,) = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return self._rows
+
+    def _evict(self, db: sqlite3.Connection):
+        if self._rows is not None and self._rows <= self.max_entries:
+            return
+        overflow = self._count(db) - self.max_entries
+        if overflow <= 0:
+            return
+        db.execute(
+            "DELETE FROM embeddings WHERE key IN"
+            " (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (overflow,),
+        )
+        self._rows -= overflow
+        self.evictions += overflow
+
+    # ─── cache logic shared by the sync and async paths ──────────────────────
+    def _partition(self, texts: List[str]):
+        keys = [_key(self.model, text) for text in texts]
+        cached = self._lookup(list(dict.fromkeys(keys)))
+        # every distinct text that is not cached yet, embedded only once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.hits += sum(1 for key in keys if key in cached)
+        self.misses += len(missing)
+        return keys, cached, missing
+
+    def _batches(self, missing: Dict[str, str]):
+        items = list(missing.items())
+        for start in range(0, len(items), self.batch_size):
+            yield items[start : start + self.batch_size]
+
+    # ─── Embeddings interface ─────────────────────────────────────────────────
+    # each call is a span (trtl.utils.tracing), with how many texts had to
+    # go to the provider
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with tracing.span("embed.documents", texts=len(texts)) as span:
+            keys, cached, missing = self._partition(texts)
+            span.set(misses=len(missing))
+            for batch in self._batches(missing):
+                vectors = self.underlying.embed_documents([text for _, text in batch])
+                fresh = {key: vec for (key, _), vec in zip(batch, vectors)}
+                self._store(fresh)
+                cached.update(fresh)
+            return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        with tracing.span("embed.query") as span:
+            # a miss goes out as a query, the scheduler puts those first
+            keys, cached, missing = self._partition([text])
+            span.set(misses=len(missing))
+            if missing:
+                cached[keys[0]] = self.underlying.embed_query(text)
+                self._store({keys[0]: cached[keys[0]]})
+            return cached[keys[0]]
+
+    # the sqlite reads and writes go to a thread, a commit waits on the
+    # disk and the loop has other turns to serve meanwhile
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        with tracing.span("embed.documents", texts=len(texts)) as span:
+            keys, cached, missing = await asyncio.to_thread(self._partition, texts)
+            span.set(misses=len(missing))
+            for batch in self._batches(missing):
+                vectors = await self.underlying.aembed_documents(
+                    [text for _, text in batch]
+                )
+                fresh = {key: vec for (key, _), vec in zip(batch, vectors)}
+                await asyncio.to_thread(self._store, fresh)
+                cached.update(fresh)
+            return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with tracing.span("embed.query") as span:
+            keys, cached, missing = await asyncio.to_thread(self._partition, [text])
+            span.set(misses=len(missing))
+            if missing:
+                cached[keys[0]] = await self.underlying.aembed_query(text)
+                await asyncio.to_thread(self._store, {keys[0]: cached[keys[0]]})
+            return cached[keys[0]]
+
+    # ─── introspection ────────────────────────────────────────────────────────
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = (
+                self._db().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            )
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    sends the provider calls of underlying through the request scheduler,
+        queries (someone is waiting on them) ahead of document batches
+    """
+
+    def __init__(self, underlying: Embeddings, model: str):
+        self.underlying = underlying
+        self.model = model
+
+    def _call(self, fn, texts: List[str], priority: int):
+        from trtl.models.scheduler import estimate_tokens, get_scheduler
+
+        tokens = estimate_tokens(self.model, texts)
+        return get_scheduler().call(fn, self.model, tokens, priority)
+
+    async def _acall(self, fn, texts: List[str], priority: int):
+        from trtl.models.scheduler import estimate_tokens, get_scheduler
+
+        tokens = estimate_tokens(self.model, texts)
+        return await get_scheduler().acall(fn, self.model, tokens, priority)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        from trtl.models.scheduler import BACKGROUND
+
+        return self._call(
+            lambda: self.underlying.embed_documents(texts), texts, BACKGROUND
+        )
+
+    def embed_query(self, text: str) -> List[float]:
+        from trtl.models.scheduler import INTERACTIVE
+
+        return self._call(
+            lambda: self.underlying.embed_query(text), [text], INTERACTIVE
+        )
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        from trtl.models.scheduler import BACKGROUND
+
+        return await self._acall(
+            lambda: self.underlying.aembed_documents(texts), texts, BACKGROUND
+        )
+
+    async def aembed_query(self, text: str) -> List[float]:
+        from trtl.models.scheduler import INTERACTIVE
+
+        return await self._acall(
+            lambda: self.underlying.aembed_query(text), [text], INTERACTIVE
+        )
@@ -0,0 +1,137 @@
+import os
+import threading
+from functools import lru_cache
+from importlib.util import find_spec
+
+import httpx
+
+"""
+One connection pool for everything that talks to OpenAI.
+
+The chat model, the embeddings and the image tool each used to build
+    their own client, so each kept its own pool and paid for its own
+    TCP and TLS handshakes. They now all get get_http_client() (sync)
+    and get_async_http_client() (async) from here, a connection one of
+    them opened is kept alive and reused by the next call of any.
+
+Tuned with
+    TRTL_HTTP_MAX_CONNECTIONS   open connections in total (100)
+    TRTL_HTTP_MAX_KEEPALIVE     idle connections kept open (20)
+    TRTL_HTTP_KEEPALIVE         seconds an idle connection is kept (120)
+    TRTL_HTTP2=1                HTTP/2, when the h2 package is installed
+
+stats() counts requests and the connections opened for them, the rest
+    went over a connection that was already there.
+"""
+
+MAX_CONNECTIONS = int(os.getenv("TRTL_HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("TRTL_HTTP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("TRTL_HTTP_KEEPALIVE", "120"))
+HTTP2 = os.getenv("TRTL_HTTP2", "0") == "1" and find_spec("h2") is not None
+
+# the openai sdk's own default, long generations take minutes
+TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+
+class ConnectionCounters:
+    """fed by httpcore's trace hook, which reports every connect"""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def request(self):
+        with self._lock:
+            self.requests += 1
+
+    def trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections += 1
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    async def atrace(self, event: str, info: dict):
+        self.trace(event, info)
+
+    def stats(self) -> dict:
+        with self._lock:
+            reused = max(0, self.requests - self.connections)
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused": reused,
+                "reuse_rate": reused / self.requests if self.requests else 0.0,
+            }
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    def __init__(self, counters: ConnectionCounters, **kwargs):
+        super().__init__(**kwargs)
+        self.counters = counters
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.counters.request()
+        request.extensions.setdefault("trace", self.counters.trace)
+        return super().handle_request(request)
+
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, counters: ConnectionCounters, **kwargs):
+        super().__init__(**kwargs)
+        self.counters = counters
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.counters.request()
+        request.extensions.setdefault("trace", self.counters.atrace)
+        return await super().handle_async_request(request)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def new_client(counters: ConnectionCounters, verify=True, **kwargs) -> httpx.Client:
+    """a pooled client with trtl's settings, kwargs go to httpx.Client"""
+    transport = _CountingTransport(
+        counters, limits=_limits(), http2=HTTP2, verify=verify
+    )
+    kwargs.setdefault("timeout", TIMEOUT)
+    return httpx.Client(transport=transport, follow_redirects=True, **kwargs)
+
+
+def new_async_client(
+    counters: ConnectionCounters, verify=True, **kwargs
+) -> httpx.AsyncClient:
+    transport = _AsyncCountingTransport(
+        counters, limits=_limits(), http2=HTTP2, verify=verify
+    )
+    kwargs.setdefault("timeout", TIMEOUT)
+    return httpx.AsyncClient(transport=transport, follow_redirects=True, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def get_counters() -> ConnectionCounters:
+    return ConnectionCounters()
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    return new_client(get_counters())
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client() -> httpx.AsyncClient:
+    return new_async_client(get_counters())
+
+
+def stats() -> dict:
+    return {"http2": HTTP2, **get_counters().stats()}
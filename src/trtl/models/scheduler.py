@@ -0,0 +1,400 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+from backoff import full_jitter
+
+"""
+One scheduler in front of every call to the OpenAI account.
+
+Chat, embeddings and image generation used to hit the account on their
+    own, each with the SDK's private retry loop, so under load they all
+    got 429s and all retried at the same moment. Every call now goes
+    through RequestScheduler.call / acall:
+
+    - each model has a requests-per-minute and a tokens-per-minute
+      budget, kept as two token buckets that refill continuously.
+      A call says up front how many tokens it will use (estimate_tokens
+      counts them with tiktoken) and waits until both buckets have room.
+      settle() books the difference once the real usage is known
+    - waiting calls are served in priority order, INTERACTIVE (the chat
+      turn, the recall query) before TOOL (images) before BACKGROUND
+      (memory writes, ingestion). Only the first waiter of a model may
+      take budget, so background work can not starve a chat turn
+    - a 429 or a 5xx is retried, after the server's retry-after when it
+      sent one and after an exponential, fully jittered backoff when it
+      did not. A 429 also pauses the whole model for that long, the
+      other callers would only run into the same wall
+    - stats() has the queue depth, time spent throttled and the retry
+      counts, per priority where it matters
+
+The SDK clients are built with max_retries=0, retrying is done here.
+
+Budgets default to requests per minute only, the tokens per minute an
+    account gets vary too much to guess: a guess that is too low holds
+    every multi step turn up for nothing. The first response that
+    carries OpenAI's x-ratelimit-limit-* headers sets the real limits
+    for its model (and x-ratelimit-remaining-tokens where the bucket
+    stands). TRTL_RATE_LIMITS sets them up front instead, and is never
+    overridden, as "model=rpm/tpm,...", e.g. "gpt-4o=5000/800000,dall-e-3=7".
+"""
+
+INTERACTIVE = 0
+TOOL = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", TOOL: "tool", BACKGROUND: "background"}
+
+# model -> (requests per minute, tokens per minute or None), the token
+# budgets come from the response headers (see learn)
+DEFAULT_LIMITS = {
+    "gpt-4o": (500, None),
+    "text-embedding-3-small": (3_000, None),
+    "dall-e-3": (5, None),
+}
+FALLBACK_LIMIT = (500, None)
+MAX_ATTEMPTS = int(os.getenv("TRTL_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+T = TypeVar("T")
+
+
+def _parse_limits(spec: str) -> Dict[str, tuple]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition("/")
+        limits[model.strip()] = (float(rpm), float(tpm) if tpm else None)
+    return limits
+
+
+class _Approximate:
+    """about four characters a token, for when tiktoken has no encoding"""
+
+    def encode(self, text: str, **kwargs) -> range:
+        return range((len(text) + 3) // 4)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # the encoding is downloaded on first use, an estimate is all
+        # the buckets need, it is not worth failing the call over
+        return _Approximate()
+
+
+def estimate_tokens(model: str, texts: Iterable[str]) -> int:
+    encoding = _encoding(model)
+    return sum(len(encoding.encode(text)) for text in texts)
+
+
+class _Bucket:
+    def __init__(self, per_minute: Optional[float]):
+        self.capacity = per_minute
+        self.level = per_minute or 0.0
+        self.rate = (per_minute or 0.0) / 60
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.capacity is not None:
+            self.level = min(
+                self.capacity, self.level + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    def clamp(self, amount: float) -> float:
+        # a call bigger than the whole budget would wait forever
+        return amount if self.capacity is None else min(amount, self.capacity)
+
+    def wait_for(self, amount: float) -> float:
+        if self.capacity is None or self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if self.capacity is not None:
+            self.level -= amount
+
+    def resize(self, per_minute: float, now: float):
+        self.refill(now)
+        # a bucket that had no limit starts out full
+        self.level = per_minute if self.capacity is None else self.level
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = min(self.level, per_minute)
+
+
+@dataclass(order=True)
+class Ticket:
+    priority: int
+    seq: int
+    model: str = field(compare=False)
+    tokens: int = field(compare=False)
+    queued: float = field(compare=False, default_factory=time.monotonic)
+
+
+class _Model:
+    def __init__(self, rpm: float, tpm: Optional[float]):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.waiting: List[Ticket] = []
+        self.paused_until = 0.0
+
+
+def _header(headers: dict, name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _headers(result) -> Optional[dict]:
+    """response headers langchain kept on a chat result, if it did"""
+    metadata = getattr(result, "response_metadata", None) or {}
+    return metadata.get("headers")
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _retryable(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # the SDK's connection errors and timeouts carry no status
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class RequestScheduler:
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        # configured limits win over what the headers say
+        self.configured = set(limits or ())
+        self._models: Dict[str, _Model] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._seq = itertools.count()
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttled_seconds = {name: 0.0 for name in PRIORITY_NAMES.values()}
+
+    def _model(self, model: str) -> _Model:
+        if model not in self._models:
+            self._models[model] = _Model(*self.limits.get(model, FALLBACK_LIMIT))
+        return self._models[model]
+
+    # ─── admission ────────────────────────────────────────────────────────────
+    def _enqueue(self, model: str, tokens: int, priority: int) -> Ticket:
+        with self._lock:
+            state = self._model(model)
+            ticket = Ticket(
+                priority, next(self._seq), model, state.tokens.clamp(tokens)
+            )
+            heapq.heappush(state.waiting, ticket)
+            return ticket
+
+    def _try(self, ticket: Ticket) -> float:
+        """takes the budget for ticket, or says how long to wait for it"""
+        with self._lock:
+            state = self._models[ticket.model]
+            now = time.monotonic()
+            if state.waiting[0] is not ticket:
+                # someone more urgent (or earlier) goes first
+                return 0.05
+            if now < state.paused_until:
+                return state.paused_until - now
+            state.requests.refill(now)
+            state.tokens.refill(now)
+            wait = max(state.requests.wait_for(1), state.tokens.wait_for(ticket.tokens))
+            if wait > 0:
+                return wait
+            state.requests.take(1)
+            state.tokens.take(ticket.tokens)
+            heapq.heappop(state.waiting)
+            self.calls += 1
+            self.throttled_seconds[PRIORITY_NAMES[ticket.priority]] += (
+                now - ticket.queued
+            )
+            self._changed.notify_all()
+            return 0.0
+
+    def _abandon(self, ticket: Ticket):
+        with self._lock:
+            waiting = self._models[ticket.model].waiting
+            if ticket in waiting:
+                waiting.remove(ticket)
+                heapq.heapify(waiting)
+                self._changed.notify_all()
+
+    def acquire(self, model: str, tokens: int = 0, priority: int = INTERACTIVE):
+        """blocks until model has the budget for a call of tokens"""
+        ticket = self._enqueue(model, tokens, priority)
+        try:
+            while (wait := self._try(ticket)) > 0:
+                with self._changed:
+                    self._changed.wait(min(wait, 1.0))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    async def aacquire(self, model: str, tokens: int = 0, priority: int = INTERACTIVE):
+        ticket = self._enqueue(model, tokens, priority)
+        try:
+            while (wait := self._try(ticket)) > 0:
+                await asyncio.sleep(min(wait, 0.25))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    def settle(self, ticket: Ticket, used: int):
+        """books the tokens a call really used against its estimate"""
+        with self._lock:
+            self._models[ticket.model].tokens.take(used - ticket.tokens)
+
+    def learn(self, model: str, headers: Optional[dict]):
+        """
+        takes model's real limits from OpenAI's x-ratelimit-* response
+            headers, unless TRTL_RATE_LIMITS set them
+        """
+        if not headers or model in self.configured:
+            return
+        headers = {name.lower(): value for name, value in headers.items()}
+        rpm = _header(headers, "x-ratelimit-limit-requests")
+        tpm = _header(headers, "x-ratelimit-limit-tokens")
+        remaining = _header(headers, "x-ratelimit-remaining-tokens")
+        with self._lock:
+            state = self._model(model)
+            now = time.monotonic()
+            if rpm and rpm != state.requests.capacity:
+                state.requests.resize(rpm, now)
+            if tpm and tpm != state.tokens.capacity:
+                state.tokens.resize(tpm, now)
+            if remaining is not None and state.tokens.capacity is not None:
+                state.tokens.refill(now)
+                state.tokens.level = min(state.tokens.level, remaining)
+            self._changed.notify_all()
+
+    # ─── retries ──────────────────────────────────────────────────────────────
+    def _backoff(self, ticket: Ticket, error: BaseException, attempt: int) -> float:
+        self.retries += 1
+        delay = _retry_after(error)
+        if delay is None:
+            # full jitter, callers that failed together do not retry together
+            delay = full_jitter(min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+        self.throttled_seconds[PRIORITY_NAMES[ticket.priority]] += delay
+        if getattr(error, "status_code", None) == 429:
+            self.rate_limited += 1
+            with self._lock:
+                state = self._models[ticket.model]
+                state.paused_until = max(state.paused_until, time.monotonic() + delay)
+        return delay
+
+    @staticmethod
+    def _retry(error: BaseException, attempt: int, may_retry) -> bool:
+        return (
+            _retryable(error)
+            and attempt < MAX_ATTEMPTS - 1
+            and (may_retry is None or may_retry())
+        )
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        model: str,
+        tokens: int = 0,
+        priority: int = INTERACTIVE,
+        usage: Optional[Callable[[T], Optional[int]]] = None,
+        may_retry: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """
+        runs fn once model has budget for it, retrying rate limits and
+            server errors. usage(result) gives the tokens really used,
+            may_retry() whether a failed fn can still be run again (a
+            stream that already handed out tokens can not)
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            ticket = self.acquire(model, tokens, priority)
+            try:
+                result = fn()
+            except Exception as error:
+                if not self._retry(error, attempt, may_retry):
+                    raise
+                time.sleep(self._backoff(ticket, error, attempt))
+                continue
+            self.learn(model, _headers(result))
+            if usage is not None and (used := usage(result)) is not None:
+                self.settle(ticket, used)
+            return result
+
+    async def acall(
+        self,
+        fn: Callable[[], "asyncio.Future"],
+        model: str,
+        tokens: int = 0,
+        priority: int = INTERACTIVE,
+        usage: Optional[Callable] = None,
+        may_retry: Optional[Callable[[], bool]] = None,
+    ):
+        """call for a coroutine function, fn() is awaited per attempt"""
+        for attempt in range(MAX_ATTEMPTS):
+            ticket = await self.aacquire(model, tokens, priority)
+            try:
+                result = await fn()
+            except Exception as error:
+                if not self._retry(error, attempt, may_retry):
+                    raise
+                await asyncio.sleep(self._backoff(ticket, error, attempt))
+                continue
+            self.learn(model, _headers(result))
+            if usage is not None and (used := usage(result)) is not None:
+                self.settle(ticket, used)
+            return result
+
+    # ─── introspection ────────────────────────────────────────────────────────
+    def stats(self) -> dict:
+        with self._lock:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for state in self._models.values():
+                for ticket in state.waiting:
+                    depth[PRIORITY_NAMES[ticket.priority]] += 1
+            return {
+                "queue_depth": sum(depth.values()),
+                "queue_depth_by_priority": depth,
+                "throttled_seconds": dict(self.throttled_seconds),
+                "calls": self.calls,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+            }
+
+
+@lru_cache(maxsize=None)
+def get_scheduler() -> RequestScheduler:
+    return RequestScheduler(_parse_limits(os.getenv("TRTL_RATE_LIMITS", "")))
@@ -1,26 +1,68 @@
+import os
+from functools import lru_cache
 from pathlib import Path
 
-from langchain_chroma import Chroma
-from langchain_community.tools import ShellTool, WikipediaQueryRun
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_community.utilities import WikipediaAPIWrapper
-from langchain_openai import OpenAIEmbeddings
+from pydantic import BaseModel, Field
 
 import trtl
 from trtl.memory import save_persistent_memory, search_persistent_memories
 from trtl.tools.enhanced_terminal import EnhancedTerminal
+from trtl.tools.cache import CachePolicy
 from trtl.tools.image_gen import OpenAIImageTool
+from trtl.tools.registry import LazyTool
+from trtl.tools.shell_session import PersistentShell
+from trtl.tools.wikipedia import WikipediaSearch
 
 # from shell_enhanced import ShellEnhanced
 
+"""
+Every tool below is a LazyTool: its name, description and args schema
+    are declared here so listing and binding the tools is free, and
+    the client behind it is only built the first time the agent calls it.
+    The langchain_community modules are imported inside the factories
+    for the same reason, they cost most of a second to import.
+"""
+
+
+class WebSearchInput(BaseModel):
+    query: str = Field(description="search query to look up")
+
+
 # internet search
 """
 using Tavily for now to facilitate internet searches, only get 1k 
 requests per month
 
-this is imported in the 
+so results are cached (see trtl.tools.cache), a repeated search is a
+    local read for a few hours unless the model asks for a fresh one
 """
-tavily_web_search = TavilySearchResults(max_results=5)
+
+HOUR = 3600
+
+
+def _build_tavily_web_search():
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
+    return TavilySearchResults(max_results=5)
+
+
+def _found_results(result) -> bool:
+    # a failed search comes back as (repr(error), {}), not as an exception
+    return bool(result[1])
+
+
+tavily_web_search = LazyTool(
+    factory=_build_tavily_web_search,
+    name="tavily_search_results_json",
+    description=(
+        "A search engine optimized for comprehensive, accurate, and trusted results. "
+        "Useful for when you need to answer questions about current events. "
+        "Input should be a search query."
+    ),
+    args_schema=WebSearchInput,
+    response_format="content_and_artifact",
+    cache=CachePolicy(ttl=6 * HOUR, keep=_found_results),
+)
 
 """
 The shell_commands tool gives the agent access to command line execution 
@@ -28,29 +70,78 @@ The shell_commands tool gives the agent access to command line execution
     the user is operating from the command line with admin access,
     but there will be permissions issues when we are running from 
     the app layer, and apple tries to stop us.
+
+Each conversation thread gets one long lived shell (see
+    trtl.tools.shell_session), commands after the first do not pay for a
+    new process and a `cd` or an `export` holds for the next call.
 """
-terminal = ShellTool()
+terminal = LazyTool.for_class(PersistentShell, PersistentShell)
 
 # Chroma RAG for CLI manuals (TLDR pages)
 PROJECT_ROOT = Path(trtl.__file__).resolve().parent
 DATA_DIR = PROJECT_ROOT / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-cli_rag_retriever = Chroma(
-    persist_directory=str(DATA_DIR),
-    collection_name="tldr_manuals",
-    embedding_function=OpenAIEmbeddings(model="text-embedding-3-small"),
-).as_retriever(search_kwargs={"k": 4})
+"""
+TRTL_TLDR_BACKEND picks what answers the tldr vector searches:
+    chroma   the tldr_manuals collection itself
+    numpy    its export, searched in process (see trtl.data.tldr_vectors)
+    auto     numpy once trtl-ingest has exported, chroma until then
+"""
+TLDR_BACKEND = os.getenv("TRTL_TLDR_BACKEND", "auto")
+
+
+@lru_cache(maxsize=None)
+def get_cli_rag_retriever():
+    from trtl.models import get_embeddings
+
+    if TLDR_BACKEND in ("numpy", "auto"):
+        from trtl.data.tldr_vectors import TldrVectorRetriever, TldrVectors
+
+        vectors = TldrVectors.open(DATA_DIR / "tldr_vectors")
+        if vectors is not None:
+            return TldrVectorRetriever(
+                vectors=vectors, embeddings=get_embeddings(), k=4
+            )
+        if TLDR_BACKEND == "numpy":
+            raise RuntimeError(
+                "TRTL_TLDR_BACKEND=numpy but there are no tldr vectors: "
+                "trtl-ingest has not run yet, or found no pages to export"
+            )
+
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        persist_directory=str(DATA_DIR),
+        collection_name="tldr_manuals",
+        embedding_function=get_embeddings(),
+    ).as_retriever(search_kwargs={"k": 4})
+
+
+@lru_cache(maxsize=None)
+def get_tldr_index():
+    """structured tldr lookups, None until trtl-ingest has built the index"""
+    from trtl.data.tldr_index import TldrIndex
+
+    return TldrIndex.open(DATA_DIR / "tldr_index.sqlite3")
+
 
 # Enhanced shell tool with CLI tool discovery, retrieval, and execution
-enhanced_terminal = EnhancedTerminal(retriever=cli_rag_retriever)
+enhanced_terminal = LazyTool.for_class(
+    EnhancedTerminal,
+    lambda: EnhancedTerminal(
+        index=get_tldr_index(), retriever_factory=get_cli_rag_retriever
+    ),
+)
 
 """
 invoke wikipedia search with this tool
 """
-wikipedia = WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
+wikipedia = LazyTool.for_class(
+    WikipediaSearch, WikipediaSearch, cache=CachePolicy(ttl=7 * 24 * HOUR)
+)
 
-image_gen = OpenAIImageTool()
+image_gen = LazyTool.for_class(OpenAIImageTool, OpenAIImageTool)
 """
 This is the export of this file.
 Define tools and put them in here,
@@ -70,3 +161,17 @@ tool_belt = [
     wikipedia,
     image_gen,
 ]
+
+"""
+Seconds a single call of a tool may take before the tool step gives up
+    on it (see trtl.tools.executor). Tools not listed here get the
+    TRTL_TOOL_TIMEOUT default.
+"""
+tool_timeouts = {
+    "tavily_search_results_json": 30,
+    "wikipedia": 30,
+    "search_persistent_memories": 30,
+    "save_persistent_memory": 30,
+    # a batch of images waits on dall-e's few requests a minute
+    "openai_image_tool": 300,
+}
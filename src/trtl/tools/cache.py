@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, create_model
+
+from trtl.config import CACHE_DIR
+
+"""
+On-disk cache for the results of network tools.
+
+Web search and wikipedia answer the same query the same way for a
+    while, and Tavily only gives us 1k requests a month. A LazyTool
+    built with a CachePolicy keeps its results here, keyed by the tool
+    name and its arguments (whitespace and case of strings do not
+    matter), zlib compressed in a local SQLite file:
+
+    - a result is served for the policy's ttl, after that the tool is
+      asked again
+    - once the file holds more than max_bytes of results the least
+      recently used ones are dropped
+    - identical calls that overlap share one request (single flight),
+      the first one runs the tool and the others wait for its result
+    - cached tools get a `fresh` argument, the model sets it for
+      questions whose answer changes by the hour and the cache is
+      skipped (the result still refreshes it)
+
+Errors are never cached. TRTL_TOOL_CACHE=0 turns the cache off,
+    TRTL_TOOL_CACHE_MB bounds its size (64 by default).
+"""
+
+DEFAULT_PATH = CACHE_DIR / "tool_results.sqlite3"
+ENABLED = os.getenv("TRTL_TOOL_CACHE", "1") != "0"
+MAX_BYTES = int(os.getenv("TRTL_TOOL_CACHE_MB", "64")) * 1024 * 1024
+
+FRESH_DESCRIPTION = (
+    "set to true only when the answer changes by the hour (news, prices, "
+    "scores, weather) and an earlier result for the same query is not good enough"
+)
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    ttl: float
+    # results that must not be kept, e.g. an error handed back as text
+    keep: Callable[[Any], bool] = lambda result: True
+
+
+def with_fresh(schema: Type[BaseModel]) -> Type[BaseModel]:
+    """schema plus the `fresh` flag that bypasses the cache"""
+    return create_model(
+        schema.__name__,
+        __base__=schema,
+        fresh=(bool, Field(False, description=FRESH_DESCRIPTION)),
+    )
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def cache_key(tool: str, args) -> str:
+    blob = json.dumps([tool, _normalize(args)], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _Abandoned(Exception):
+    """the call being waited on was cancelled, the waiter runs its own"""
+
+
+class ToolCache:
+    def __init__(self, path: Optional[Path] = None, max_bytes: int = MAX_BYTES):
+        self.path = Path(path or DEFAULT_PATH)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.bypassed = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        # key -> future of the call running for it right now
+        self._inflight: Dict[str, Future] = {}
+
+    # ─── storage ──────────────────────────────────────────────────────────────
+    def _db(self) -> sqlite3.Connection:
+        # opened on first use, the cache should not cost anything at import
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_results ("
+                " key TEXT PRIMARY KEY,"
+                " tool TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS tool_results_last_used"
+                " ON tool_results (last_used)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str, ttl: float) -> Tuple[bool, Any]:
+        """(True, result) for a live entry, (False, None) otherwise"""
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT value, created FROM tool_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            now = time.time()
+            if now - row[1] > ttl:
+                self.expired += 1
+                db.execute("DELETE FROM tool_results WHERE key = ?", (key,))
+                db.commit()
+                return False, None
+            db.execute(
+                "UPDATE tool_results SET last_used = ? WHERE key = ?", (now, key)
+            )
+            db.commit()
+        return True, json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, tool: str, result: Any):
+        blob = zlib.compress(json.dumps(result, default=str).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO tool_results"
+                " (key, tool, value, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool, blob, len(blob), now, now),
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        (total,) = db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM tool_results"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in db.execute(
+            "SELECT key, size FROM tool_results ORDER BY last_used"
+        ):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        db.executemany("DELETE FROM tool_results WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    # ─── single flight ────────────────────────────────────────────────────────
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """the future for key's call and whether this caller has to run it"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _land(self, key: str, future: Future, result=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _lookup(self, key: str, policy: CachePolicy, fresh: bool):
+        if fresh:
+            self.bypassed += 1
+            return False, None
+        hit, result = self.get(key, policy.ttl)
+        if hit:
+            self.hits += 1
+        return hit, result
+
+    def call(
+        self,
+        tool: str,
+        args,
+        policy: CachePolicy,
+        fn: Callable[[], Any],
+        fresh: bool = False,
+    ):
+        """fn's result for tool(args), from the cache while it is live"""
+        key = cache_key(tool, args)
+        hit, result = self._lookup(key, policy, fresh)
+        if hit:
+            return result
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except _Abandoned:
+                continue
+        self.misses += 1
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(
+                key, future, error=e if isinstance(e, Exception) else _Abandoned()
+            )
+            raise
+        if policy.keep(result):
+            self.put(key, tool, result)
+        self._land(key, future, result)
+        return result
+
+    async def acall(
+        self,
+        tool: str,
+        args,
+        policy: CachePolicy,
+        fn: Callable[[], Awaitable[Any]],
+        fresh: bool = False,
+    ):
+        key = cache_key(tool, args)
+        hit, result = self._lookup(key, policy, fresh)
+        if hit:
+            return result
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # shielded, a waiter that is cancelled must not cancel the
+                # call the others are waiting on
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _Abandoned:
+                continue
+        self.misses += 1
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._land(
+                key, future, error=e if isinstance(e, Exception) else _Abandoned()
+            )
+            raise
+        if policy.keep(result):
+            self.put(key, tool, result)
+        self._land(key, future, result)
+        return result
+
+    # ─── introspection ────────────────────────────────────────────────────────
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = (
+                self._db()
+                .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tool_results")
+                .fetchone()
+            )
+        lookups = self.hits + self.misses + self.shared
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "bypassed": self.bypassed,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+@lru_cache(maxsize=None)
+def get_tool_cache() -> ToolCache:
+    return ToolCache()
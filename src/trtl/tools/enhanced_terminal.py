@@ -1,13 +1,29 @@
-import subprocess
+import asyncio
 from typing import Optional, Type
 
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field, PrivateAttr
 
+from trtl.tools import process
+from trtl.tools.path_index import get_path_index
+from trtl.tools.shell_session import get_shell_sessions, thread_id_of
+
 """
 Tool class that allows agent to search for famous command line tools
 stored in a Chroma RAG DB.
 
+The caller always names the tool, so the structured tldr index (built
+    by trtl-ingest) is asked first: a local SQLite lookup of that tool's
+    examples ranked against the task. The vector search is only the
+    fallback for tools the index does not know, and the retriever is not
+    even opened until then.
+
+Inside a conversation the command runs in that thread's shell session
+    (see trtl.tools.shell_session), so it sees the directory and the
+    variables the terminal tool left behind. brew installs always get a
+    fresh process of their own.
+
 TODO: 
 If retriever changes often, or you plan to have tools that hot-swap
 underlying behavior (e.g. different RAGs), then using 
@@ -39,80 +55,207 @@ class EnhancedTerminal(BaseTool):
         "and executes the resulting command. You may craft your own natural language query to help retrieve the correct CLI syntax."
     )
     args_schema: Type[BaseModel] = EnhancedTerminalInput
+    timeout: float = process.DEFAULT_TIMEOUT
+    idle_timeout: float = process.DEFAULT_IDLE_TIMEOUT
+    # brew can sit quietly for a while on a big download or a build
+    install_timeout: float = 900.0
     _retriever: any = PrivateAttr()
+    _retriever_factory: any = PrivateAttr()
+    _index: any = PrivateAttr()
 
-    def __init__(self, retriever, **kwargs):
+    def __init__(self, retriever=None, index=None, retriever_factory=None, **kwargs):
         super().__init__(**kwargs)
         self._retriever = retriever
+        self._retriever_factory = retriever_factory
+        self._index = index
+
+    @property
+    def retriever(self):
+        if self._retriever is None and self._retriever_factory is not None:
+            self._retriever = self._retriever_factory()
+        return self._retriever
+
+    def lookup_command(self, task_description: str, tool_name: str) -> Optional[str]:
+        """
+        the best matching example command from the tldr index, None when
+            the index is missing or has no page for tool_name
+        """
+        if self._index is None:
+            return None
+        examples = self._index.lookup(tool_name, task_description, limit=1)
+        return examples[0][1] if examples else None
+
+    @staticmethod
+    def _pick_command(docs, tool_name: str) -> Optional[str]:
+        for doc in docs:
+            lines = doc.page_content.splitlines()
+            for line in lines:
+                if tool_name in line and line.strip().startswith("`"):
+                    return line.strip("` ")
+        return None
 
     def _run(
-        self, tool_name: str, task_description: str, inputs: Optional[str] = None
+        self,
+        tool_name: str,
+        task_description: str,
+        inputs: Optional[str] = None,
+        config: RunnableConfig = None,
     ) -> str:
         if not self.check_tool_installed(tool_name):
             install_result = self.install_tool(tool_name)
             if "Error" in install_result:
                 return install_result
 
-        command = self.search_command_example(task_description, tool_name)
+        command = self.search_command_example(task_description, tool_name, config)
         if not command:
             return f"Could not find a relevant command for {tool_name} and task '{task_description}'."
 
-        return self.run_command(command)
+        return self.run_command(command, config)
 
-    def check_tool_installed(self, tool_name: str) -> bool:
-        return (
-            subprocess.call(
-                f"which {tool_name}",
-                shell=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-            == 0
+    async def _arun(
+        self,
+        tool_name: str,
+        task_description: str,
+        inputs: Optional[str] = None,
+        config: RunnableConfig = None,
+    ) -> str:
+        """
+        same flow as _run, but the subprocesses and the retrieval are
+        awaited so other tool calls in the step keep running meanwhile
+        """
+        if not await self.acheck_tool_installed(tool_name):
+            install_result = await self.ainstall_tool(tool_name)
+            if "Error" in install_result:
+                return install_result
+
+        command = await self.asearch_command_example(
+            task_description, tool_name, config
         )
+        if not command:
+            return f"Could not find a relevant command for {tool_name} and task '{task_description}'."
+
+        return await self.arun_command(command, config)
+
+    def check_tool_installed(self, tool_name: str) -> bool:
+        # answered from the in process $PATH index, nothing is spawned
+        return get_path_index().exists(tool_name)
 
     def install_tool(self, tool_name: str) -> str:
         """
         install the command line tool if we need it
         """
-        try:
-            result = subprocess.run(
-                f"brew install {tool_name}",
-                shell=True,
-                capture_output=True,
-                text=True,
-                check=True,
+        result = process.run_command(
+            f"brew install {tool_name}",
+            timeout=self.install_timeout,
+            idle_timeout=self.install_timeout,
+            on_output=process.output_writer(self.name),
+        )
+        return self._install_result(tool_name, result)
+
+    def _install_result(self, tool_name: str, result: process.ProcessResult) -> str:
+        if not result.ok:
+            return f"Error installing {tool_name}: " + result.describe(
+                self.install_timeout, self.install_timeout
             )
-            return result.stdout or "Tool installed."
-        except subprocess.CalledProcessError as e:
-            return f"Error installing {tool_name}: {e.stderr}"
+        get_path_index().invalidate()
+        return result.output or "Tool installed."
 
     def search_command_example(
-        self, task_description: str, tool_name: str
+        self, task_description: str, tool_name: str, config: RunnableConfig = None
     ) -> Optional[str]:
         """
-        search out examples of the CLI usage
+        search out examples of the CLI usage, the retriever runs as a child
+            of the tool call when there is a config
         """
+        command = self.lookup_command(task_description, tool_name)
+        if command is not None:
+            return command
         query = f"{task_description} using {tool_name}"
-        docs = self._retriever.get_relevant_documents(query)
-        for doc in docs:
-            lines = doc.page_content.splitlines()
-            for line in lines:
-                if tool_name in line and line.strip().startswith("`"):
-                    return line.strip("` ")
-        return None
+        docs = self.retriever.invoke(query, config)
+        return self._pick_command(docs, tool_name)
 
-    def run_command(self, command: str) -> str:
+    def run_command(self, command: str, config: RunnableConfig = None) -> str:
         """
-        run the program
+        run the program, its output streams to the CLI while it runs and
+            only the last part of it is kept for the model. With a config
+            it runs in the conversation's shell session
 
         TODO: it is possible that we should be just crafting the command
               with this tool class and letting the Shell Tool execute.
         """
+        run = (
+            get_shell_sessions().get(thread_id_of(config)).run
+            if config is not None
+            else process.run_command
+        )
         try:
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
-            if result.returncode == 0:
-                return result.stdout or "Command executed successfully."
-            else:
-                return f"Command failed with error: {result.stderr}"
+            result = run(
+                command,
+                timeout=self.timeout,
+                idle_timeout=self.idle_timeout,
+                on_output=process.output_writer(self.name),
+            )
+        except Exception as e:
+            return f"Execution error: {str(e)}"
+        return self._command_result(result)
+
+    def _command_result(self, result: process.ProcessResult) -> str:
+        output = result.describe(self.timeout, self.idle_timeout)
+        if result.ok:
+            return output or "Command executed successfully."
+        if result.timed_out:
+            return output
+        return f"Command failed with error: {output}"
+
+    # ─── async counterparts ───────────────────────────────────────────────────
+    async def acheck_tool_installed(self, tool_name: str) -> bool:
+        # a few stat calls at most, fine to do on the loop
+        return get_path_index().exists(tool_name)
+
+    async def ainstall_tool(self, tool_name: str) -> str:
+        result = await process.arun_command(
+            f"brew install {tool_name}",
+            timeout=self.install_timeout,
+            idle_timeout=self.install_timeout,
+            on_output=process.output_writer(self.name),
+        )
+        return self._install_result(tool_name, result)
+
+    async def asearch_command_example(
+        self, task_description: str, tool_name: str, config: RunnableConfig = None
+    ) -> Optional[str]:
+        # the index lookup is local and quick, no need to leave the loop
+        command = self.lookup_command(task_description, tool_name)
+        if command is not None:
+            return command
+        query = f"{task_description} using {tool_name}"
+        docs = await self.retriever.ainvoke(query, config)
+        return self._pick_command(docs, tool_name)
+
+    async def arun_command(self, command: str, config: RunnableConfig = None) -> str:
+        if config is not None:
+            session = get_shell_sessions().get(thread_id_of(config))
+            try:
+                result = await asyncio.to_thread(
+                    session.run,
+                    command,
+                    timeout=self.timeout,
+                    idle_timeout=self.idle_timeout,
+                    on_output=process.output_writer(self.name),
+                )
+            except asyncio.CancelledError:
+                session.interrupt()
+                raise
+            except Exception as e:
+                return f"Execution error: {str(e)}"
+            return self._command_result(result)
+        try:
+            result = await process.arun_command(
+                command,
+                timeout=self.timeout,
+                idle_timeout=self.idle_timeout,
+                on_output=process.output_writer(self.name),
+            )
         except Exception as e:
             return f"Execution error: {str(e)}"
+        return self._command_result(result)
@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.prebuilt import ToolNode
+from langgraph.store.base import BaseStore
+
+from trtl.utils import tracing
+
+"""
+Tool step that runs every tool call of one model message concurrently.
+
+LangGraph's ToolNode already fans the calls out (a thread per call on
+    the sync path, asyncio.gather on the async one). This adds the two
+    things it lacks: a cap on how many tools run at once, and a timeout
+    per tool so one hung call cannot hold up the whole step. A timed
+    out call comes back to the model as an error ToolMessage.
+
+A sync tool can not be interrupted, so one that times out keeps its
+    slot until it really returns: the cap counts what is running, not
+    what is being waited on. Waiting for a slot counts towards a call's
+    timeout, so with every slot held by hung tools the next calls time
+    out without starting instead of queueing behind them. On the async
+    path a timed out call is cancelled and gives its slot back, though
+    a tool without its own _arun goes on in langchain's executor thread.
+
+With the network and subprocess bound tools implementing _arun, a step
+    with several tool calls costs roughly the slowest call instead of
+    the sum of them.
+"""
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("TRTL_TOOL_CONCURRENCY", "8"))
+DEFAULT_TIMEOUT = float(os.getenv("TRTL_TOOL_TIMEOUT", "300"))
+
+
+def _timed_out(call, timeout: float, started: bool = True) -> ToolMessage:
+    what = "finish" if started else "start, earlier tool calls are still running,"
+    return ToolMessage(
+        content=f"Error: {call['name']} did not {what} within {timeout:g}s.",
+        name=call["name"],
+        tool_call_id=call["id"],
+        status="error",
+    )
+
+
+class ConcurrentToolNode(ToolNode):
+    def __init__(
+        self,
+        tools: Sequence[BaseTool],
+        *,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        timeouts: Optional[Dict[str, float]] = None,
+        **kwargs,
+    ):
+        super().__init__(tools, **kwargs)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._aslots: Optional[asyncio.Semaphore] = None
+        # sync calls run here so a timeout can stop waiting on them. A
+        # call holds its slot for as long as it runs, so the pool never
+        # has more calls than workers
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="trtl-tool"
+        )
+
+    def timeout_for(self, tool_name: str) -> Optional[float]:
+        return self.timeouts.get(tool_name, self.timeout)
+
+    # the node's entry points, timed as node.tools (see trtl.utils.tracing)
+    def _func(
+        self, input: Any, config: RunnableConfig, *, store: Optional[BaseStore]
+    ) -> Any:
+        with tracing.span("node.tools", tracing.turn_of(config)):
+            return super()._func(input, config, store=store)
+
+    async def _afunc(
+        self, input: Any, config: RunnableConfig, *, store: Optional[BaseStore]
+    ) -> Any:
+        with tracing.span("node.tools", tracing.turn_of(config)):
+            return await super()._afunc(input, config, store=store)
+
+    def _run_one(self, call, input_type, config) -> ToolMessage:
+        timeout = self.timeout_for(call["name"])
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with tracing.span(f"tool.{call['name']}") as span:
+            if not self._slots.acquire(timeout=timeout):
+                # every slot is held by tools that have not returned yet
+                span.set(status="error", started=False)
+                return _timed_out(call, timeout, started=False)
+            # carry the runnable context over to the pool thread
+            context = contextvars.copy_context()
+            try:
+                future = self._pool.submit(
+                    context.run, super()._run_one, call, input_type, config
+                )
+            except BaseException:
+                self._slots.release()
+                raise
+            # the slot goes back when the tool returns, not when we stop
+            # waiting on it
+            future.add_done_callback(lambda _: self._slots.release())
+            remaining = None if deadline is None else deadline - time.monotonic()
+            try:
+                message = future.result(
+                    timeout=None if remaining is None else max(0.0, remaining)
+                )
+            except FutureTimeout:
+                # a sync tool can not be interrupted, it is left to finish
+                # in the background (keeping its slot) while the step
+                # moves on
+                message = _timed_out(call, timeout)
+            span.set(status=getattr(message, "status", None))
+            return message
+
+    async def _arun_one(self, call, input_type, config) -> ToolMessage:
+        if self._aslots is None:
+            self._aslots = asyncio.Semaphore(self.max_concurrency)
+        timeout = self.timeout_for(call["name"])
+        async with self._aslots:
+            with tracing.span(f"tool.{call['name']}") as span:
+                try:
+                    message = await asyncio.wait_for(
+                        super()._arun_one(call, input_type, config), timeout
+                    )
+                except asyncio.TimeoutError:
+                    message = _timed_out(call, timeout)
+                span.set(status=getattr(message, "status", None))
+                return message
@@ -1,20 +1,40 @@
+import asyncio
+import hashlib
+import json
 import os
-from typing import Literal, Optional, Type
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, List, Literal, Type
 
-import openai
 from dotenv import load_dotenv
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field, PrivateAttr
 
+from trtl.config import CACHE_DIR
+from trtl.models.scheduler import TOOL, get_scheduler
+
 # Load environment variables
 load_dotenv()
 
+"""
+Image generation in batches, kept on disk.
 
-class OpenAIImageInput(BaseModel):
+DALL·E 3 makes one image per request and hands back a URL that expires
+    after an hour. The tool takes a list of images instead, generates
+    them concurrently (at most TRTL_IMAGE_CONCURRENCY at a time, the
+    scheduler still keeps us under dall-e's requests per minute) and
+    streams each one into IMAGE_DIR, named by a hash of its prompt,
+    size and quality. It answers with the local paths, and an image
+    that was made before is served from there without a request.
+"""
+
+IMAGE_DIR = CACHE_DIR / "images"
+CONCURRENCY = int(os.getenv("TRTL_IMAGE_CONCURRENCY", "3"))
+MAX_BATCH = 8
+
+
+class ImageSpec(BaseModel):
     prompt: str = Field(..., description="Text prompt to generate an image.")
-    mode: Literal["generate"] = Field(
-        "generate", description="Only 'generate' mode is supported."
-    )
     size: Literal["1024x1024", "1024x1792", "1792x1024"] = Field(
         "1024x1024",
         description=(
@@ -30,43 +50,166 @@ class OpenAIImageInput(BaseModel):
     )
 
 
+class OpenAIImageInput(BaseModel):
+    images: List[ImageSpec] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH,
+        description=(
+            "The images to generate, one entry per image. Ask for all the "
+            "variants you need in one call, they are generated concurrently."
+        ),
+    )
+
+
+def image_key(spec: ImageSpec) -> str:
+    blob = json.dumps([" ".join(spec.prompt.split()), spec.size, spec.quality])
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
 class OpenAIImageTool(BaseTool):
     name: str = "openai_image_tool"
     description: str = (
-        "Generate images using OpenAI's DALL·E 3 API. "
-        "Supports only 'generate' mode with fixed size options: "
-        "'1024x1024', '1024x1792', or '1792x1024'."
+        "Generate images using OpenAI's DALL·E 3 API, several at once. "
+        "Size options are fixed: '1024x1024', '1024x1792', or '1792x1024'. "
+        "Returns the path of each image on the local disk."
     )
     args_schema: Type[BaseModel] = OpenAIImageInput
 
-    _client: openai.OpenAI = PrivateAttr()
+    directory: Path = IMAGE_DIR
+    concurrency: int = CONCURRENCY
+
+    _client: Any = PrivateAttr()
+    _async_client: Any = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # imported here, the openai sdk is slow to import and the tool is
+        # only built once the agent actually asks for an image
+        import openai
+
+        from trtl.models.http import get_async_http_client, get_http_client
 
-    def __init__(self):
-        super().__init__()
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY must be set in environment variables.")
-        self._client = openai.OpenAI(api_key=api_key)
-
-    def _run(
-        self,
-        prompt: str,
-        mode: str = "generate",
-        size: str = "1024x1024",
-        quality: str = "standard",
-    ) -> str:
-        if mode != "generate":
-            return f"Unsupported mode: {mode}. Only 'generate' is available."
+        # retries (and waiting for dall-e's few requests a minute) are
+        # up to the shared scheduler, connections come from the shared pool
+        self._client = openai.OpenAI(
+            api_key=api_key, max_retries=0, http_client=get_http_client()
+        )
+        self._async_client = openai.AsyncOpenAI(
+            api_key=api_key, max_retries=0, http_client=get_async_http_client()
+        )
 
+    # ─── cache ────────────────────────────────────────────────────────────────
+    def _path(self, spec: ImageSpec) -> Path:
+        return Path(self.directory) / f"{image_key(spec)}.png"
+
+    @staticmethod
+    def _partial(path: Path) -> Path:
+        # written next to the final file and renamed over it once complete,
+        # an interrupted download never looks like a cached image
+        return path.with_name(f"{path.name}.{os.getpid()}.part")
+
+    def _download(self, url: str, path: Path):
+        from trtl.models.http import get_http_client
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self._partial(path)
+        try:
+            with get_http_client().stream("GET", url) as response:
+                response.raise_for_status()
+                with open(partial, "wb") as f:
+                    for chunk in response.iter_bytes():
+                        f.write(chunk)
+            os.replace(partial, path)
+        finally:
+            partial.unlink(missing_ok=True)
+
+    async def _adownload(self, url: str, path: Path):
+        from trtl.models.http import get_async_http_client
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self._partial(path)
+        try:
+            async with get_async_http_client().stream("GET", url) as response:
+                response.raise_for_status()
+                with open(partial, "wb") as f:
+                    async for chunk in response.aiter_bytes():
+                        f.write(chunk)
+            os.replace(partial, path)
+        finally:
+            partial.unlink(missing_ok=True)
+
+    # ─── generation ───────────────────────────────────────────────────────────
+    @staticmethod
+    def _request(spec: ImageSpec) -> dict:
+        return {
+            "model": "dall-e-3",
+            "prompt": spec.prompt,
+            "n": 1,
+            "size": spec.size,
+            "quality": spec.quality,
+            "response_format": "url",
+        }
+
+    def _generate(self, spec: ImageSpec) -> str:
+        path = self._path(spec)
+        if path.exists():
+            return f"{path} (cached)"
         try:
-            response = self._client.images.generate(
+            response = get_scheduler().call(
+                lambda: self._client.images.generate(**self._request(spec)),
                 model="dall-e-3",
-                prompt=prompt,
-                n=1,
-                size=size,
-                quality=quality,
-                response_format="url",
+                priority=TOOL,
             )
-            return response.data[0].url
+            self._download(response.data[0].url, path)
+        except Exception as e:
+            return f"failed: {e}"
+        return str(path)
+
+    async def _agenerate(self, spec: ImageSpec, slots: asyncio.Semaphore) -> str:
+        path = self._path(spec)
+        if path.exists():
+            return f"{path} (cached)"
+        try:
+            async with slots:
+                response = await get_scheduler().acall(
+                    lambda: self._async_client.images.generate(**self._request(spec)),
+                    model="dall-e-3",
+                    priority=TOOL,
+                )
+                await self._adownload(response.data[0].url, path)
         except Exception as e:
-            return f"Image generation failed: {e}"
+            return f"failed: {e}"
+        return str(path)
+
+    @staticmethod
+    def _specs(images: List[Any]) -> List[ImageSpec]:
+        return [ImageSpec.model_validate(image) for image in images]
+
+    @staticmethod
+    def _report(specs: List[ImageSpec], results: dict) -> str:
+        return "\n".join(
+            f"{i}. {spec.prompt[:60]!r} {spec.size} {spec.quality}: "
+            f"{results[image_key(spec)]}"
+            for i, spec in enumerate(specs, 1)
+        )
+
+    def _run(self, images: List[Any]) -> str:
+        specs = self._specs(images)
+        # the same image asked for twice is generated once
+        unique = {image_key(spec): spec for spec in specs}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = dict(zip(unique, pool.map(self._generate, unique.values())))
+        return self._report(specs, results)
+
+    async def _arun(self, images: List[Any]) -> str:
+        specs = self._specs(images)
+        unique = {image_key(spec): spec for spec in specs}
+        slots = asyncio.Semaphore(self.concurrency)
+        generated = await asyncio.gather(
+            *(self._agenerate(spec, slots) for spec in unique.values())
+        )
+        return self._report(specs, dict(zip(unique, generated)))
@@ -0,0 +1,111 @@
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+"""
+In process index of the executables on $PATH.
+
+EnhancedTerminal used to spawn `which <tool>` through a shell to find
+    out whether a tool is installed, a fork/exec and a shell startup per
+    question. PathIndex lists every $PATH directory once and answers
+    from memory. Before answering it stats the directories (no process
+    is spawned), and rescans only the ones whose mtime moved, which is
+    what installing or removing a binary does to its directory. A
+    changed $PATH rebuilds the lot, invalidate() forces the same after
+    an install.
+"""
+
+
+def _is_executable(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_file() and os.access(entry.path, os.X_OK)
+    except OSError:
+        return False
+
+
+class PathIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        # dir -> (mtime_ns, {name: full path}) in $PATH order
+        self._dirs: Dict[str, Tuple[int, Dict[str, str]]] = {}
+        self._order: List[str] = []
+        self._merged: Dict[str, str] = {}
+        self.lookups = 0
+        self.hits = 0
+        self.rescans = 0
+
+    # ─── scanning ─────────────────────────────────────────────────────────────
+    @staticmethod
+    def _mtime(directory: str) -> int:
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return -1
+
+    def _scan(self, directory: str, mtime: int) -> Tuple[int, Dict[str, str]]:
+        self.rescans += 1
+        found: Dict[str, str] = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if _is_executable(entry):
+                        found[entry.name] = entry.path
+        except OSError:
+            pass
+        return mtime, found
+
+    def _refresh(self) -> bool:
+        """brings the index up to date, True when nothing had changed"""
+        path = os.environ.get("PATH", os.defpath)
+        if path != self._path:
+            self._path = path
+            self._order = list(dict.fromkeys(d for d in path.split(os.pathsep) if d))
+            self._dirs = {}
+        fresh = True
+        for directory in self._order:
+            mtime = self._mtime(directory)
+            known = self._dirs.get(directory)
+            if known is None or known[0] != mtime:
+                self._dirs[directory] = self._scan(directory, mtime)
+                fresh = False
+        if not fresh:
+            merged: Dict[str, str] = {}
+            # earlier $PATH entries win, like the shell
+            for directory in reversed(self._order):
+                merged.update(self._dirs[directory][1])
+            self._merged = merged
+        return fresh
+
+    def invalidate(self):
+        with self._lock:
+            self._path = None
+
+    # ─── queries ──────────────────────────────────────────────────────────────
+    def which(self, name: str) -> Optional[str]:
+        """full path of the executable name resolves to, like `which`"""
+        if os.sep in name:
+            return name if os.path.isfile(name) and os.access(name, os.X_OK) else None
+        with self._lock:
+            self.lookups += 1
+            if self._refresh():
+                self.hits += 1
+            return self._merged.get(name)
+
+    def exists(self, name: str) -> bool:
+        return self.which(name) is not None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "executables": len(self._merged),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "rescans": self.rescans,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_path_index() -> PathIndex:
+    return PathIndex()
@@ -0,0 +1,334 @@
+import asyncio
+import atexit
+import os
+import selectors
+import signal
+import subprocess
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from trtl.utils import tracing
+
+"""
+Streaming, time bounded execution of shell commands for the tools.
+
+subprocess.run(capture_output=True) keeps every byte a command prints
+    in memory, has no timeout, and a hung command blocks the agent
+    until someone kills it by hand. run_command / arun_command instead:
+
+    - start the command in its own session (process group), so a
+      timeout or a cancel can kill everything it spawned with one killpg
+    - read stdout and stderr (merged, in the order they were written)
+      as it arrives into a RingBuffer that keeps only the last max_bytes
+    - pass every chunk to on_output as it arrives, output_writer hands
+      it to the graph's custom stream so the CLI can show it live
+    - give up after `timeout` seconds in total or `idle_timeout` seconds
+      without any output, SIGTERM first and SIGKILL after a grace period
+    - return as soon as the command itself exits, a background child
+      keeping the pipe open does not hold up the result
+
+A KeyboardInterrupt (sync) or a cancelled task (async) kills the
+    process group before it propagates. kill_all() reaps whatever is
+    still running, the CLI calls it on Ctrl+C and at exit.
+"""
+
+DEFAULT_TIMEOUT = float(os.getenv("TRTL_COMMAND_TIMEOUT", "120"))
+DEFAULT_IDLE_TIMEOUT = float(os.getenv("TRTL_COMMAND_IDLE_TIMEOUT", "60"))
+DEFAULT_MAX_BYTES = 64 * 1024
+KILL_GRACE = 2.0
+READ_SIZE = 64 * 1024
+
+# process groups of the commands that are running right now
+_running: set = set()
+
+
+class RingBuffer:
+    """keeps the last max_bytes written to it, in the chunks they came in"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._chunks: deque = deque()
+        self._size = 0
+        self.dropped = 0
+
+    def write(self, data: bytes):
+        if len(data) > self.max_bytes:
+            self.dropped += len(data) - self.max_bytes
+            data = data[-self.max_bytes :]
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            head = self._chunks[0]
+            excess = self._size - self.max_bytes
+            if len(head) <= excess:
+                self._chunks.popleft()
+                self._size -= len(head)
+                self.dropped += len(head)
+            else:
+                self._chunks[0] = head[excess:]
+                self._size -= excess
+                self.dropped += excess
+
+    def text(self) -> str:
+        text = b"".join(self._chunks).decode(errors="replace")
+        if self.dropped:
+            text = f"…[{self.dropped} bytes of earlier output dropped]\n{text}"
+        return text
+
+
+@dataclass
+class ProcessResult:
+    returncode: Optional[int]
+    output: str
+    timed_out: Optional[str] = None  # "wall" or "idle"
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and self.timed_out is None
+
+    def describe(self, timeout: float, idle_timeout: float) -> str:
+        if self.timed_out == "wall":
+            return (
+                f"Command timed out after {timeout:g}s, output so far:\n{self.output}"
+            )
+        if self.timed_out == "idle":
+            return (
+                f"Command printed nothing for {idle_timeout:g}s and was stopped, "
+                f"output so far:\n{self.output}"
+            )
+        return self.output
+
+
+def _signal_group(pgid: int, sig: int):
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _kill(process: subprocess.Popen):
+    _signal_group(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=KILL_GRACE)
+    except subprocess.TimeoutExpired:
+        _signal_group(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def kill_all():
+    """kills every command that is still running"""
+    for pgid in list(_running):
+        _signal_group(pgid, signal.SIGKILL)
+    _running.clear()
+
+
+atexit.register(kill_all)
+
+
+def output_writer(tool_name: str) -> Optional[Callable[[str], None]]:
+    """
+    an on_output that forwards to the graph's custom stream, None when
+        not running inside a graph
+    """
+    try:
+        from langgraph.config import get_stream_writer
+
+        writer = get_stream_writer()
+    except Exception:
+        return None
+    return lambda text: writer({"tool": tool_name, "output": text})
+
+
+def _traced(result: ProcessResult) -> ProcessResult:
+    # a command that fails is a result for the model, not an error here
+    tracing.record(
+        "subprocess",
+        result.seconds,
+        ok=result.timed_out is None,
+        returncode=result.returncode,
+        timed_out=result.timed_out,
+    )
+    return result
+
+
+# ─── sync ─────────────────────────────────────────────────────────────────────
+def run_command(
+    command: str,
+    timeout: float = DEFAULT_TIMEOUT,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    on_output: Optional[Callable[[str], None]] = None,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> ProcessResult:
+    started = time.monotonic()
+    buffer = RingBuffer(max_bytes)
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    _running.add(process.pid)
+    fd = process.stdout.fileno()
+    os.set_blocking(fd, False)
+    selector = selectors.DefaultSelector()
+    selector.register(fd, selectors.EVENT_READ)
+    last_output = started
+    timed_out = None
+
+    def drain() -> bool:
+        """reads what is there, False once the pipe hit EOF"""
+        nonlocal last_output
+        while True:
+            try:
+                data = os.read(fd, READ_SIZE)
+            except BlockingIOError:
+                return True
+            if not data:
+                return False
+            last_output = time.monotonic()
+            buffer.write(data)
+            if on_output is not None:
+                on_output(data.decode(errors="replace"))
+
+    try:
+        open_pipe = True
+        while process.poll() is None:
+            now = time.monotonic()
+            if now - started >= timeout:
+                timed_out = "wall"
+            elif now - last_output >= idle_timeout:
+                timed_out = "idle"
+            if timed_out:
+                _kill(process)
+                break
+            wait = min(started + timeout, last_output + idle_timeout) - now
+            if open_pipe:
+                # poll() is checked at least every 100ms
+                if selector.select(timeout=min(wait, 0.1)):
+                    open_pipe = drain()
+            else:
+                time.sleep(min(wait, 0.05))
+        if open_pipe:
+            drain()
+    except BaseException:
+        # KeyboardInterrupt lands here, the command must not outlive it
+        _kill(process)
+        raise
+    finally:
+        selector.close()
+        process.stdout.close()
+        _running.discard(process.pid)
+
+    return _traced(
+        ProcessResult(
+            returncode=process.returncode,
+            output=buffer.text(),
+            timed_out=timed_out,
+            seconds=time.monotonic() - started,
+        )
+    )
+
+
+# ─── async ────────────────────────────────────────────────────────────────────
+async def _akill(process: asyncio.subprocess.Process):
+    _signal_group(process.pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), KILL_GRACE)
+    except asyncio.TimeoutError:
+        _signal_group(process.pid, signal.SIGKILL)
+        await process.wait()
+
+
+async def _read_pipe(fd: int):
+    """
+    a StreamReader on the read end of our own pipe and the transport to
+        close it with. Given its own pipes, asyncio's process.wait() would
+        also wait for them to close, which a background child of the
+        command can hold off long after the command is gone
+    """
+    stream = asyncio.StreamReader()
+    transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(stream), os.fdopen(fd, "rb", 0)
+    )
+    return stream, transport
+
+
+async def arun_command(
+    command: str,
+    timeout: float = DEFAULT_TIMEOUT,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    on_output: Optional[Callable[[str], None]] = None,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> ProcessResult:
+    started = time.monotonic()
+    buffer = RingBuffer(max_bytes)
+    read_fd, write_fd = os.pipe()
+    try:
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=write_fd,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
+        )
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        # the command has its copy, only it and its children write
+        os.close(write_fd)
+    _running.add(process.pid)
+    stdout, pipe = await _read_pipe(read_fd)
+    last_output = started
+    timed_out = None
+
+    async def read():
+        nonlocal last_output
+        while data := await stdout.read(READ_SIZE):
+            last_output = time.monotonic()
+            buffer.write(data)
+            if on_output is not None:
+                on_output(data.decode(errors="replace"))
+
+    reader = asyncio.ensure_future(read())
+    # returncode is set the moment the command itself exits
+    exited = asyncio.ensure_future(process.wait())
+    try:
+        while not exited.done():
+            now = time.monotonic()
+            if now - started >= timeout:
+                timed_out = "wall"
+            elif now - last_output >= idle_timeout:
+                timed_out = "idle"
+            if timed_out:
+                await _akill(process)
+                break
+            wait = min(started + timeout, last_output + idle_timeout) - now
+            await asyncio.wait({exited}, timeout=wait)
+        # the command is gone, take what is left in the pipe but do not
+        # wait on children of it that still hold the pipe open
+        await asyncio.wait({reader}, timeout=0.1)
+    except BaseException:
+        # a cancelled tool call (Ctrl+C in the CLI) kills the command
+        await asyncio.shield(_akill(process))
+        raise
+    finally:
+        reader.cancel()
+        # a background child may still hold the pipe, stop listening to it
+        pipe.close()
+        exited.cancel()
+        _running.discard(process.pid)
+
+    return _traced(
+        ProcessResult(
+            returncode=process.returncode,
+            output=buffer.text(),
+            timed_out=timed_out,
+            seconds=time.monotonic() - started,
+        )
+    )
@@ -0,0 +1,145 @@
+import threading
+from functools import partial
+from inspect import signature
+from typing import Any, Callable, Optional, Type
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from pydantic import PrivateAttr
+
+from trtl.tools import cache as tool_cache
+from trtl.tools.cache import CachePolicy, get_tool_cache, with_fresh
+
+"""
+Lazy tool registry.
+
+Listing the tools (splash screen, bind_tools) only needs a name, a
+    description and an args schema. The objects backing a tool
+    (API clients, vector stores, shell processes) are expensive to
+    build, so a LazyTool holds a factory and only calls it the first
+    time the tool is actually invoked.
+
+A LazyTool given a CachePolicy answers repeated calls from the tool
+    result cache (trtl.tools.cache) without building the tool at all.
+"""
+
+
+def _call_kwargs(func: Callable, run_manager, config: Optional[RunnableConfig]):
+    """
+    mirrors how BaseTool.run decides which extras a _run accepts
+    """
+    params = signature(func).parameters
+    kwargs = {}
+    if run_manager is not None and "run_manager" in params:
+        kwargs["run_manager"] = run_manager
+    if config is not None and "config" in params:
+        kwargs["config"] = config
+    return kwargs
+
+
+class LazyTool(BaseTool):
+    """
+    Stand-in for a tool whose backing object is built on first use.
+    """
+
+    _factory: Callable[[], BaseTool] = PrivateAttr()
+    _tool: Optional[BaseTool] = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _cache: Any = PrivateAttr(default=None)
+
+    def __init__(
+        self,
+        factory: Callable[[], BaseTool],
+        cache: Optional[CachePolicy] = None,
+        **kwargs,
+    ):
+        if cache is not None:
+            kwargs["args_schema"] = with_fresh(kwargs["args_schema"])
+        super().__init__(**kwargs)
+        self._factory = factory
+        self._cache = cache
+
+    @classmethod
+    def for_class(
+        cls, tool_cls: Type[BaseTool], factory: Callable[[], BaseTool], **overrides
+    ) -> "LazyTool":
+        """
+        reads name, description and schema off the class defaults so the
+        listing never drifts from the real tool
+        """
+        fields = tool_cls.model_fields
+        spec = {
+            "name": fields["name"].default,
+            "description": fields["description"].default,
+            "args_schema": fields["args_schema"].default,
+            "response_format": fields["response_format"].default,
+        }
+        spec.update(overrides)
+        return cls(factory=factory, **spec)
+
+    @property
+    def is_built(self) -> bool:
+        return self._tool is not None
+
+    def resolve(self) -> BaseTool:
+        """
+        build the backing tool once, even if several calls race for it
+        """
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    self._tool = self._factory()
+        return self._tool
+
+    def _restore(self, result: Any) -> Any:
+        # the cache keeps json, where a (content, artifact) pair is a list
+        if self.response_format == "content_and_artifact" and isinstance(result, list):
+            return tuple(result)
+        return result
+
+    def _run(
+        self, *args, config: RunnableConfig = None, run_manager=None, **kwargs
+    ) -> Any:
+        if self._cache is None:
+            return self._call(*args, config=config, run_manager=run_manager, **kwargs)
+        fresh = kwargs.pop("fresh", False)
+        call = partial(
+            self._call, *args, config=config, run_manager=run_manager, **kwargs
+        )
+        if not tool_cache.ENABLED:
+            return call()
+        return self._restore(
+            get_tool_cache().call(self.name, [args, kwargs], self._cache, call, fresh)
+        )
+
+    async def _arun(
+        self, *args, config: RunnableConfig = None, run_manager=None, **kwargs
+    ) -> Any:
+        if self._cache is None:
+            return await self._acall(
+                *args, config=config, run_manager=run_manager, **kwargs
+            )
+        fresh = kwargs.pop("fresh", False)
+        call = partial(
+            self._acall, *args, config=config, run_manager=run_manager, **kwargs
+        )
+        if not tool_cache.ENABLED:
+            return await call()
+        return self._restore(
+            await get_tool_cache().acall(
+                self.name, [args, kwargs], self._cache, call, fresh
+            )
+        )
+
+    def _call(self, *args, config: RunnableConfig, run_manager, **kwargs) -> Any:
+        tool = self.resolve()
+        extras = _call_kwargs(tool._run, run_manager, config)
+        return tool._run(*args, **kwargs, **extras)
+
+    async def _acall(self, *args, config: RunnableConfig, run_manager, **kwargs) -> Any:
+        tool = self.resolve()
+        # without a native _arun the default one hands everything to _run
+        # in an executor, so _run's signature decides what it accepts
+        native = type(tool)._arun is not BaseTool._arun
+        extras = _call_kwargs(tool._arun if native else tool._run, run_manager, config)
+        return await tool._arun(*args, **kwargs, **extras)
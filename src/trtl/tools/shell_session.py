@@ -0,0 +1,405 @@
+import asyncio
+import os
+import platform
+import re
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Type, Union
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from trtl.tools import process
+from trtl.tools.process import ProcessResult, RingBuffer
+from trtl.utils import tracing
+
+"""
+A long lived shell per conversation thread, driven over a pty.
+
+ShellTool started a fresh shell for every call, so every step paid for
+    a process start and lost `cd`, exported variables and activated
+    virtualenvs, and the model kept re-issuing its setup commands.
+    ShellSession keeps one interactive bash per thread_id instead:
+
+    - a command is written to a file in the session's temp dir and the
+      shell is told to `.` it, followed by a printf of a per session
+      sentinel and $?. Output up to the sentinel is the command's, the
+      number after it its exit code. Sourcing keeps any quoting and
+      multi line command intact, and runs it in the shell itself so
+      its state sticks around for the next one
+    - output streams through the same RingBuffer / on_output / timeout
+      rules as process.run_command. On a timeout the foreground job
+      gets a Ctrl+C over the pty, a shell that does not come back from
+      that is killed. bash drops the rest of the line on a Ctrl+C, so
+      the sentinel is sent again after it. Sentinels carry the
+      command's number, a late one from an earlier command is dropped
+    - a shell that died (crash, `exit`, kill_all) is started again on
+      the next command, the result says that its state was lost
+    - ShellSessions reaps sessions idle for more than TRTL_SHELL_IDLE
+      seconds from a background thread
+"""
+
+IDLE_SECONDS = float(os.getenv("TRTL_SHELL_IDLE", "900"))
+INTERRUPT_GRACE = 2.0
+
+
+class ShellDied(Exception):
+    pass
+
+
+class ShellSession:
+    def __init__(self, cwd: Optional[str] = None):
+        self.cwd = cwd or os.getcwd()
+        self._token = uuid.uuid4().hex[:12]
+        self._sentinel = re.compile(
+            rb"\n?__trtl_%s_(\d+)_(\d+)__\n" % self._token.encode()
+        )
+        self._marker = b"\n__trtl_%s_" % self._token.encode()
+        self._seq = 0
+        self._process: Optional[subprocess.Popen] = None
+        self._master: Optional[int] = None
+        self._dir: Optional[str] = None
+        self._lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.starts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    # ─── lifecycle ────────────────────────────────────────────────────────────
+    def _start(self):
+        import fcntl
+        import pty
+        import termios
+
+        master, slave = pty.openpty()
+        attrs = termios.tcgetattr(slave)
+        # no echo of what we write, and plain \n line endings
+        attrs[1] &= ~termios.ONLCR
+        attrs[3] &= ~(termios.ECHO | termios.ECHONL)
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+
+        def controlling_tty():
+            # the pty becomes the shell's terminal, so a Ctrl+C written to
+            # it reaches the foreground job like it would in a terminal
+            fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+
+        shell = shutil.which("bash") or "/bin/sh"
+        args = [shell, "--noprofile", "--norc", "--noediting", "-i"]
+        if not shell.endswith("bash"):
+            args = [shell, "-i"]
+        env = {**os.environ, "PS1": "", "PS2": "", "TERM": "dumb", "PAGER": "cat"}
+        env.pop("PROMPT_COMMAND", None)
+        self._process = subprocess.Popen(
+            args,
+            stdin=slave,
+            stdout=slave,
+            stderr=slave,
+            cwd=self.cwd,
+            env=env,
+            start_new_session=True,
+            preexec_fn=controlling_tty,
+        )
+        os.close(slave)
+        self._master = master
+        self._dir = tempfile.mkdtemp(prefix="trtl-shell-")
+        process._running.add(self._process.pid)
+        self.starts += 1
+        # swallow the startup noise, the session is ready at the sentinel
+        self._exchange(":", timeout=10, idle_timeout=10, on_output=None)
+
+    def close(self):
+        if self._process is not None:
+            process._signal_group(self._process.pid, signal.SIGKILL)
+            try:
+                self._process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                pass
+            process._running.discard(self._process.pid)
+            self._process = None
+        if self._master is not None:
+            os.close(self._master)
+            self._master = None
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def _mark(self) -> bytes:
+        """the line that makes the shell print the current sentinel"""
+        return (
+            f"printf '\\n__trtl_{self._token}_{self._seq}_%s__\\n' \"$?\"\n"
+        ).encode()
+
+    def interrupt(self):
+        """Ctrl+C for whatever the shell is running right now"""
+        if self._master is not None:
+            try:
+                os.write(self._master, b"\x03" + self._mark())
+            except OSError:
+                pass
+
+    # ─── running commands ─────────────────────────────────────────────────────
+    def _read(self, timeout: float) -> Optional[bytes]:
+        """next output, b"" on timeout, None once the shell is gone"""
+        ready, _, _ = select.select([self._master], [], [], max(timeout, 0))
+        if not ready:
+            return b""
+        try:
+            return os.read(self._master, process.READ_SIZE) or None
+        except OSError:
+            # EIO, the slave side closed because the shell exited
+            return None
+
+    def _held(self, pending: bytes) -> int:
+        """where the part of pending that may be a sentinel starts"""
+        start = pending.rfind(b"\n")
+        if start == -1:
+            return len(pending)
+        tail = pending[start:]
+        if self._marker.startswith(tail):
+            return start
+        if tail.startswith(self._marker) and len(tail) < len(self._marker) + 48:
+            return start
+        return len(pending)
+
+    def _exchange(
+        self,
+        command: str,
+        timeout: float,
+        idle_timeout: float,
+        on_output: Optional[Callable[[str], None]],
+        max_bytes: int = process.DEFAULT_MAX_BYTES,
+    ) -> ProcessResult:
+        started = time.monotonic()
+        script = os.path.join(self._dir, "command.sh")
+        with open(script, "w") as f:
+            f.write(command + "\n")
+        self._seq += 1
+        os.write(self._master, f". '{script}'; ".encode() + self._mark())
+
+        buffer = RingBuffer(max_bytes)
+        # bytes that may be the start of the sentinel, held back until
+        # it is clear they are not
+        pending = b""
+        last_output = started
+        timed_out = None
+        interrupted_at = None
+
+        def emit(data: bytes):
+            if data:
+                buffer.write(data)
+                if on_output is not None:
+                    on_output(data.decode(errors="replace"))
+
+        while True:
+            now = time.monotonic()
+            if interrupted_at is None:
+                if now - started >= timeout:
+                    timed_out = "wall"
+                elif now - last_output >= idle_timeout:
+                    timed_out = "idle"
+                if timed_out:
+                    self.interrupt()
+                    interrupted_at = now
+            elif now - interrupted_at >= INTERRUPT_GRACE:
+                # the job ignores Ctrl+C, the whole shell has to go
+                self.close()
+                emit(pending)
+                return ProcessResult(None, buffer.text(), timed_out, now - started)
+
+            deadline = (
+                interrupted_at + INTERRUPT_GRACE
+                if interrupted_at is not None
+                else min(started + timeout, last_output + idle_timeout)
+            )
+            data = self._read(min(deadline - now, 0.5))
+            if data is None:
+                emit(pending)
+                raise ShellDied(buffer.text())
+            if not data:
+                continue
+            last_output = time.monotonic()
+            pending += data
+            match = self._sentinel.search(pending)
+            while match and int(match.group(1)) != self._seq:
+                pending = pending[: match.start()] + pending[match.end() :]
+                match = self._sentinel.search(pending)
+            if match:
+                emit(pending[: match.start()])
+                return ProcessResult(
+                    returncode=int(match.group(2)),
+                    output=buffer.text(),
+                    timed_out=timed_out,
+                    seconds=time.monotonic() - started,
+                )
+            hold = self._held(pending)
+            emit(pending[:hold])
+            pending = pending[hold:]
+
+    def run(
+        self,
+        command: str,
+        timeout: float = process.DEFAULT_TIMEOUT,
+        idle_timeout: float = process.DEFAULT_IDLE_TIMEOUT,
+        on_output: Optional[Callable[[str], None]] = None,
+    ) -> ProcessResult:
+        with self._lock:
+            self.last_used = time.monotonic()
+            restarted = False
+            if not self.alive:
+                self.close()
+                restarted = self.starts > 0
+                self._start()
+            try:
+                with tracing.span("shell") as span:
+                    result = self._exchange(command, timeout, idle_timeout, on_output)
+                    span.set(returncode=result.returncode, timed_out=result.timed_out)
+            except ShellDied as died:
+                # `exit`, or the shell crashed under the command
+                self.close()
+                result = ProcessResult(
+                    None, f"{str(died).strip()}\n[shell exited]".lstrip()
+                )
+            except BaseException:
+                # KeyboardInterrupt and the like, leave no command running
+                self.close()
+                raise
+            finally:
+                self.last_used = time.monotonic()
+            if restarted:
+                result.output = (
+                    "[shell restarted, earlier cd/exports are gone]\n" + result.output
+                )
+            return result
+
+
+class ShellSessions:
+    """one ShellSession per thread_id, idle ones are closed by a reaper"""
+
+    def __init__(self, idle_seconds: float = IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._sessions: Dict[str, ShellSession] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def get(self, thread_id: str) -> ShellSession:
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            if session is None:
+                session = self._sessions[thread_id] = ShellSession()
+            # not idle from the moment it is handed out, so the reaper
+            # can not close it before the command gets to run
+            session.last_used = time.monotonic()
+            if self._reaper is None:
+                self._reaper = threading.Thread(
+                    target=self._reap, name="trtl-shell-reaper", daemon=True
+                )
+                self._reaper.start()
+            return session
+
+    def _reap(self):
+        while True:
+            time.sleep(min(self.idle_seconds, 60))
+            cutoff = time.monotonic() - self.idle_seconds
+            idle = []
+            with self._lock:
+                for tid, session in list(self._sessions.items()):
+                    # a session still running a command holds its lock, it
+                    # stays (and keeps its shell) until a later round
+                    if session.last_used < cutoff and session._lock.acquire(
+                        blocking=False
+                    ):
+                        del self._sessions[tid]
+                        idle.append(session)
+            for session in idle:
+                try:
+                    session.close()
+                finally:
+                    session._lock.release()
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+
+@lru_cache(maxsize=None)
+def get_shell_sessions() -> ShellSessions:
+    import atexit
+
+    sessions = ShellSessions()
+    atexit.register(sessions.close)
+    return sessions
+
+
+def thread_id_of(config: Optional[RunnableConfig]) -> str:
+    return str(((config or {}).get("configurable") or {}).get("thread_id", "default"))
+
+
+# ─── the terminal tool ────────────────────────────────────────────────────────
+class ShellInput(BaseModel):
+    commands: Union[str, List[str]] = Field(
+        ...,
+        description="List of shell commands to run. Deserialized using json.loads",
+    )
+
+
+_platform = "MacOS" if platform.system() == "Darwin" else platform.system()
+
+
+class PersistentShell(BaseTool):
+    name: str = "terminal"
+    description: str = (
+        f"Run shell commands on this {_platform} machine. The shell stays open "
+        "between calls, so the working directory, exported variables and "
+        "activated virtualenvs carry over to the next command."
+    )
+    args_schema: Type[BaseModel] = ShellInput
+    timeout: float = process.DEFAULT_TIMEOUT
+    idle_timeout: float = process.DEFAULT_IDLE_TIMEOUT
+
+    def _run(
+        self, commands: Union[str, List[str]], config: RunnableConfig = None
+    ) -> str:
+        session = get_shell_sessions().get(thread_id_of(config))
+        on_output = process.output_writer(self.name)
+        if isinstance(commands, str):
+            commands = [commands]
+        outputs = []
+        for command in commands:
+            result = session.run(
+                command,
+                timeout=self.timeout,
+                idle_timeout=self.idle_timeout,
+                on_output=on_output,
+            )
+            output = result.describe(self.timeout, self.idle_timeout).rstrip("\n")
+            if result.returncode not in (0, None) and not result.timed_out:
+                output += f"\n[exit code {result.returncode}]"
+            if output:
+                outputs.append(output)
+            if not result.ok:
+                # the rest most likely depended on this one
+                break
+        return "\n".join(outputs)
+
+    async def _arun(
+        self, commands: Union[str, List[str]], config: RunnableConfig = None
+    ) -> str:
+        try:
+            return await asyncio.to_thread(self._run, commands, config)
+        except asyncio.CancelledError:
+            # the worker thread is waiting on the shell, Ctrl+C the command
+            # so it gives up, the session itself survives
+            get_shell_sessions().get(thread_id_of(config)).interrupt()
+            raise
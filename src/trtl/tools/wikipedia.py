@@ -0,0 +1,97 @@
+from typing import Any, Type
+
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field, PrivateAttr
+
+"""
+Wikipedia search with a real async path.
+
+langchain's WikipediaQueryRun goes through the `wikipedia` package,
+    which is blocking and makes one request for the search plus two
+    for every page it summarizes. This asks the MediaWiki API for the
+    search hits and their intro extracts in a single request, with an
+    httpx client for each of the sync and async paths. The output
+    format is the same one WikipediaAPIWrapper produces.
+"""
+
+API_URL = "https://{lang}.wikipedia.org/w/api.php"
+# wikimedia asks every client to identify itself
+USER_AGENT = "trtl (https://github.com/light-magician/trtl)"
+
+
+class WikipediaInput(BaseModel):
+    query: str = Field(description="query to look up on wikipedia")
+
+
+class WikipediaSearch(BaseTool):
+    name: str = "wikipedia"
+    description: str = (
+        "A wrapper around Wikipedia. "
+        "Useful for when you need to answer general questions about "
+        "people, places, companies, facts, historical events, or other subjects. "
+        "Input should be a search query."
+    )
+    args_schema: Type[BaseModel] = WikipediaInput
+
+    lang: str = "en"
+    top_k_results: int = 3
+    doc_content_chars_max: int = 4000
+    timeout: float = 10.0
+
+    _client: Any = PrivateAttr(default=None)
+    _async_client: Any = PrivateAttr(default=None)
+
+    def _params(self, query: str) -> dict:
+        return {
+            "action": "query",
+            "format": "json",
+            "formatversion": 2,
+            "redirects": 1,
+            "generator": "search",
+            "gsrsearch": query[:300],
+            "gsrlimit": self.top_k_results,
+            "prop": "extracts",
+            "exintro": 1,
+            "explaintext": 1,
+            "exlimit": self.top_k_results,
+        }
+
+    def _format(self, payload: dict) -> str:
+        pages = sorted(
+            payload.get("query", {}).get("pages", []),
+            key=lambda page: page.get("index", 0),
+        )
+        summaries = [
+            f"Page: {page['title']}\nSummary: {page['extract']}"
+            for page in pages
+            if page.get("extract")
+        ]
+        if not summaries:
+            return "No good Wikipedia Search Result was found"
+        return "\n\n".join(summaries)[: self.doc_content_chars_max]
+
+    def _run(self, query: str) -> str:
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.Client(
+                headers={"User-Agent": USER_AGENT}, timeout=self.timeout
+            )
+        response = self._client.get(
+            API_URL.format(lang=self.lang), params=self._params(query)
+        )
+        response.raise_for_status()
+        return self._format(response.json())
+
+    async def _arun(self, query: str) -> str:
+        if self._async_client is None:
+            import httpx
+
+            self._async_client = httpx.AsyncClient(
+                headers={"User-Agent": USER_AGENT}, timeout=self.timeout
+            )
+        response = await self._async_client.get(
+            API_URL.format(lang=self.lang), params=self._params(query)
+        )
+        response.raise_for_status()
+        return self._format(response.json())
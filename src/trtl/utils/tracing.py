@@ -0,0 +1,481 @@
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+from inspect import iscoroutinefunction
+from logging.handlers import QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.callbacks.base import BaseCallbackHandler
+
+from trtl.config import CACHE_DIR
+
+"""
+Timing spans and token counts for where a turn spends its time.
+
+    node.agent, node.tools     the graph's nodes
+    context.fit                fitting the history into the token budget
+    recall                     waiting for the recalled memories
+    recall.search              the memory search itself
+    llm                        one model call, with its token counts and
+                               how long the first token took
+    llm.first_token            that time to first token on its own
+    tool.<name>                one tool call
+    embed.query, embed.documents   embedding calls, cache lookups included
+    tldr.search                a search of the exported tldr vectors
+    subprocess, shell          commands the tools ran
+
+span(stage) times a block, node(name, fn) a graph node, and record()
+    books a duration that was measured anyway. Model calls are timed
+    by a langchain callback (TokenCounter, installed by watch_models),
+    which also adds up prompt, completion and cached prompt tokens per
+    model. Spans inside a graph node carry the turn they belong to.
+
+Every span goes to a JSONL file, written by a background thread and
+    rotated at TRTL_TRACE_FILE_MB (TRTL_TRACE_BACKUPS old files are
+    kept, TRTL_TRACE_FILE= turns the file off), and into per stage
+    totals for the session: stats() has p50/p95 per stage (/stats in
+    the CLI), prometheus() the same as Prometheus text (the daemon's
+    metrics endpoint).
+
+TRTL_TRACE=0 turns all of it off, span() then hands out one shared
+    do-nothing object and node() the function itself.
+"""
+
+ENABLED = os.getenv("TRTL_TRACE", "1") != "0"
+TRACE_FILE = os.getenv("TRTL_TRACE_FILE", str(CACHE_DIR / "trace" / "spans.jsonl"))
+MAX_BYTES = int(float(os.getenv("TRTL_TRACE_FILE_MB", "16")) * 1024 * 1024)
+BACKUPS = int(os.getenv("TRTL_TRACE_BACKUPS", "3"))
+
+# durations kept per stage for the percentiles, the counts and sums
+# cover the whole session
+WINDOW = 2048
+QUANTILES = (0.5, 0.95)
+TOKEN_KINDS = ("calls", "prompt", "completion", "cached")
+
+# the turn the spans of this context belong to, set by node()
+_turn: ContextVar[Optional[str]] = ContextVar("trtl_turn", default=None)
+
+
+def percentile(values, q: float) -> float:
+    """nearest rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+# ─── the session's totals ─────────────────────────────────────────────────────
+class _Stage:
+    __slots__ = ("count", "errors", "total", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=WINDOW)
+
+
+class _JsonLines(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, default=str)
+
+
+class _Writer(QueueListener):
+    # spans queue plain dicts, they become log records (and JSON) on the
+    # writer thread
+    def prepare(self, line: dict) -> logging.LogRecord:
+        return logging.makeLogRecord({"msg": line})
+
+
+class Recorder:
+    """per stage durations and per model tokens, optionally a JSONL file"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: int = MAX_BYTES,
+        backups: int = BACKUPS,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.started = time.time()
+        self._stages: Dict[str, _Stage] = defaultdict(_Stage)
+        self._tokens: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: dict.fromkeys(TOKEN_KINDS, 0)
+        )
+        self._lock = threading.Lock()
+        self._queue: Optional[SimpleQueue] = None
+        self._listener: Optional[QueueListener] = None
+
+    # ─── writing ──────────────────────────────────────────────────────────────
+    def _open(self):
+        # the first span starts the writer thread, the spans only ever
+        # put a dict on its queue
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(
+            self.path,
+            maxBytes=self.max_bytes,
+            backupCount=self.backups,
+            encoding="utf-8",
+            delay=True,
+        )
+        handler.setFormatter(_JsonLines())
+        self._queue = SimpleQueue()
+        self._listener = _Writer(self._queue, handler)
+        self._listener.start()
+        atexit.register(self.close)
+
+    def _write(self, line: dict):
+        if self._queue is None:
+            with self._lock:
+                if self._queue is None:
+                    self._open()
+        self._queue.put(line)
+
+    def close(self):
+        """writes out what is queued and stops the writer thread"""
+        with self._lock:
+            listener, self._listener = self._listener, None
+            self._queue = None
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+
+    # ─── recording ────────────────────────────────────────────────────────────
+    def observe(self, stage: str, seconds: float, ok: bool = True):
+        """counts a duration towards stage without writing a span"""
+        with self._lock:
+            totals = self._stages[stage]
+            totals.count += 1
+            totals.errors += not ok
+            totals.total += seconds
+            totals.recent.append(seconds)
+
+    def record(
+        self,
+        stage: str,
+        seconds: float,
+        ok: bool = True,
+        started: Optional[float] = None,
+        turn: Optional[str] = None,
+        **attrs,
+    ):
+        self.observe(stage, seconds, ok)
+        if self.path:
+            line = {
+                "ts": round(time.time() - seconds if started is None else started, 6),
+                "stage": stage,
+                "ms": round(seconds * 1000, 3),
+                "ok": ok,
+            }
+            if turn is not None:
+                line["turn"] = turn
+            line.update(attrs)
+            self._write(line)
+
+    def count_tokens(self, model: str, prompt: int, completion: int, cached: int):
+        with self._lock:
+            totals = self._tokens[model]
+            totals["calls"] += 1
+            totals["prompt"] += prompt
+            totals["completion"] += completion
+            totals["cached"] += cached
+
+    # ─── reading ──────────────────────────────────────────────────────────────
+    def _copy(self):
+        """the totals as they are now, sorted and summed outside the lock"""
+        with self._lock:
+            stages = {
+                stage: (totals.count, totals.errors, totals.total, list(totals.recent))
+                for stage, totals in self._stages.items()
+            }
+            tokens = {model: dict(totals) for model, totals in self._tokens.items()}
+        return stages, tokens
+
+    def stats(self) -> dict:
+        stages, tokens = self._copy()
+        report = {}
+        for stage, (count, errors, total, recent) in stages.items():
+            recent.sort()
+            report[stage] = {
+                "count": count,
+                "errors": errors,
+                "total_s": round(total, 6),
+                "p50_ms": round(percentile(recent, 0.5) * 1000, 3),
+                "p95_ms": round(percentile(recent, 0.95) * 1000, 3),
+            }
+        return {
+            "enabled": ENABLED,
+            "since": self.started,
+            "stages": report,
+            "tokens": tokens,
+        }
+
+    def prometheus(self) -> str:
+        """the totals in the Prometheus text exposition format"""
+        stages, tokens = self._copy()
+        lines = [
+            "# HELP trtl_stage_seconds time spent per stage",
+            "# TYPE trtl_stage_seconds summary",
+        ]
+        for stage, (count, _, total, recent) in sorted(stages.items()):
+            recent.sort()
+            for q in QUANTILES:
+                lines.append(
+                    f'trtl_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                    f"{percentile(recent, q):.6f}"
+                )
+            lines.append(f'trtl_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'trtl_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines += [
+            "# HELP trtl_stage_errors_total spans that ended in an error",
+            "# TYPE trtl_stage_errors_total counter",
+        ]
+        for stage, (_, errors, _, _) in sorted(stages.items()):
+            lines.append(f'trtl_stage_errors_total{{stage="{stage}"}} {errors}')
+        lines += [
+            "# HELP trtl_llm_calls_total model calls",
+            "# TYPE trtl_llm_calls_total counter",
+        ]
+        for model, totals in sorted(tokens.items()):
+            lines.append(f'trtl_llm_calls_total{{model="{model}"}} {totals["calls"]}')
+        lines += [
+            "# HELP trtl_llm_tokens_total tokens by model and kind, cached is"
+            " the part of prompt the provider had cached",
+            "# TYPE trtl_llm_tokens_total counter",
+        ]
+        for model, totals in sorted(tokens.items()):
+            for kind in TOKEN_KINDS[1:]:
+                lines.append(
+                    f'trtl_llm_tokens_total{{model="{model}",kind="{kind}"}} '
+                    f"{totals[kind]}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=None)
+def get_recorder() -> Recorder:
+    return Recorder(TRACE_FILE or None)
+
+
+def stats() -> dict:
+    return get_recorder().stats()
+
+
+def prometheus() -> str:
+    return get_recorder().prometheus()
+
+
+def record(stage: str, seconds: float, ok: bool = True, **attrs):
+    """books a duration measured elsewhere, e.g. a ProcessResult's"""
+    if ENABLED:
+        get_recorder().record(stage, seconds, ok, turn=_turn.get(), **attrs)
+
+
+# ─── spans ────────────────────────────────────────────────────────────────────
+class Span:
+    __slots__ = ("stage", "attrs", "turn", "_started", "_wall", "_token")
+
+    def __init__(self, stage: str, attrs: dict, turn: Optional[str] = None):
+        self.stage = stage
+        self.attrs = attrs
+        self.turn = turn
+        self._token = None
+
+    def set(self, **attrs):
+        """adds attributes to the span, e.g. a result's size"""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        if self.turn is not None:
+            self._token = _turn.set(self.turn)
+        else:
+            self.turn = _turn.get()
+        self._wall = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, traceback) -> bool:
+        seconds = time.perf_counter() - self._started
+        if self._token is not None:
+            _turn.reset(self._token)
+        if kind is not None:
+            self.attrs["error"] = kind.__name__
+        ok = kind is None and self.attrs.get("status") != "error"
+        get_recorder().record(
+            self.stage, seconds, ok, started=self._wall, turn=self.turn, **self.attrs
+        )
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, kind, error, traceback) -> bool:
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage: str, turn: Optional[str] = None, **attrs):
+    """
+    times the with block as stage. turn makes it (and the spans inside
+        it) part of that turn, the default is the surrounding turn
+    """
+    if not ENABLED:
+        return _NO_SPAN
+    return Span(stage, attrs, turn)
+
+
+def turn_of(config: Optional[dict]) -> Optional[str]:
+    """the turn id Agent puts into a request's config metadata"""
+    return ((config or {}).get("metadata") or {}).get("turn")
+
+
+def node(name: str, func: Callable) -> Callable:
+    """func, a graph node taking (state, config), timed as node.<name>"""
+    if not ENABLED:
+        return func
+    stage = f"node.{name}"
+    if iscoroutinefunction(func):
+
+        @wraps(func)
+        async def traced(state, config):
+            with span(stage, turn_of(config)):
+                return await func(state, config)
+
+    else:
+
+        @wraps(func)
+        def traced(state, config):
+            with span(stage, turn_of(config)):
+                return func(state, config)
+
+    return traced
+
+
+# ─── model calls ──────────────────────────────────────────────────────────────
+def _usage(response) -> Dict[str, int]:
+    """prompt, completion and cached tokens of an LLMResult"""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(
+                getattr(generation, "message", None), "usage_metadata", None
+            )
+            if usage:
+                details = usage.get("input_token_details") or {}
+                return {
+                    "prompt": usage.get("input_tokens", 0),
+                    "completion": usage.get("output_tokens", 0),
+                    "cached": details.get("cache_read", 0) or 0,
+                }
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    return {
+        "prompt": usage.get("prompt_tokens", 0),
+        "completion": usage.get("completion_tokens", 0),
+        "cached": details.get("cached_tokens", 0) or 0,
+    }
+
+
+class TokenCounter(BaseCallbackHandler):
+    """
+    times every model call from langchain's callbacks and counts its
+        tokens, added to every run by watch_models
+    """
+
+    # a few dict operations, not worth a trip through an executor
+    run_inline = True
+
+    def __init__(self, recorder: Recorder):
+        self.recorder = recorder
+        # run_id -> [model, turn, wall start, start, first token]
+        self._runs: Dict[Any, list] = {}
+
+    def _start(self, run_id, kwargs):
+        metadata = kwargs.get("metadata") or {}
+        params = kwargs.get("invocation_params") or {}
+        model = (
+            metadata.get("ls_model_name")
+            or params.get("model")
+            or params.get("model_name")
+            or params.get("_type", "unknown")
+        )
+        self._runs[run_id] = [
+            model,
+            _turn.get(),
+            time.time(),
+            time.perf_counter(),
+            None,
+        ]
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run[4] is None:
+            run[4] = time.perf_counter()
+
+    def _finish(self, run_id, ok: bool, **attrs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        model, turn, wall, started, first = run
+        now = time.perf_counter()
+        if first is not None:
+            attrs["first_token_ms"] = round((first - started) * 1000, 3)
+            self.recorder.observe("llm.first_token", first - started)
+        self.recorder.record(
+            "llm", now - started, ok, started=wall, turn=turn, model=model, **attrs
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        usage = _usage(response)
+        self.recorder.count_tokens(run[0], **usage)
+        self._finish(
+            run_id,
+            True,
+            prompt_tokens=usage["prompt"],
+            completion_tokens=usage["completion"],
+            cached_tokens=usage["cached"],
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, False, error=type(error).__name__)
+
+
+@lru_cache(maxsize=None)
+def watch_models():
+    """adds a TokenCounter to every langchain run from now on"""
+    if not ENABLED:
+        return
+    # langchain's tracers are slow to import, only the agent needs this
+    from langchain_core.tracers.context import register_configure_hook
+
+    counter: ContextVar = ContextVar(
+        "trtl_token_counter", default=TokenCounter(get_recorder())
+    )
+    register_configure_hook(counter, inheritable=True)
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from trtl.memory.checkpoint import DeltaSqliteSaver
+
+"""
+DeltaSqliteSaver under a small graph: a node that echoes the last human
+    message, so every turn adds two messages and a few checkpoints.
+"""
+
+
+def _echo(state: MessagesState):
+    return {"messages": [AIMessage(content=f"echo {state['messages'][-1].content}")]}
+
+
+def _graph(saver: DeltaSqliteSaver):
+    builder = StateGraph(MessagesState)
+    builder.add_node("echo", _echo)
+    builder.add_edge(START, "echo")
+    builder.add_edge("echo", END)
+    return builder.compile(checkpointer=saver)
+
+
+def _config(thread_id: str = "t") -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def _turns(graph, count: int, thread_id: str = "t", start: int = 0):
+    for i in range(start, start + count):
+        graph.invoke({"messages": [HumanMessage(content=f"q{i}")]}, _config(thread_id))
+
+
+def _rows(saver: DeltaSqliteSaver, table: str) -> int:
+    saver.flush()
+    return saver._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def _contents(saver: DeltaSqliteSaver, thread_id: str = "t") -> list:
+    values = saver.get_tuple(_config(thread_id)).checkpoint["channel_values"]
+    return [m.content for m in values["messages"]]
+
+
+@pytest.fixture
+def saver(tmp_path):
+    saver = DeltaSqliteSaver(tmp_path / "checkpoints.sqlite3", compact_every=1000)
+    yield saver
+    saver.close()
+
+
+# ─── round trip ───────────────────────────────────────────────────────────────
+def test_round_trip_keeps_the_history(saver):
+    _turns(_graph(saver), 3)
+    assert _contents(saver) == ["q0", "echo q0", "q1", "echo q1", "q2", "echo q2"]
+
+
+def test_each_message_is_stored_once(saver):
+    _turns(_graph(saver), 5)
+    # many checkpoints, each referencing the whole history
+    assert _rows(saver, "checkpoints") > 5
+    assert _rows(saver, "messages") == 10
+
+
+def test_threads_are_kept_apart(saver):
+    graph = _graph(saver)
+    _turns(graph, 1, thread_id="a")
+    _turns(graph, 2, thread_id="b", start=10)
+    assert _contents(saver, "a") == ["q0", "echo q0"]
+    assert _contents(saver, "b") == ["q10", "echo q10", "q11", "echo q11"]
+
+
+def test_earlier_checkpoints_read_back(saver):
+    _turns(_graph(saver), 2)
+    history = list(saver.list(_config()))
+    assert [t.config for t in history] == sorted(
+        (t.config for t in history),
+        key=lambda c: c["configurable"]["checkpoint_id"],
+        reverse=True,
+    )
+    oldest_with_messages = [
+        t for t in history if t.checkpoint["channel_values"].get("messages")
+    ][-1]
+    assert [
+        m.content for m in oldest_with_messages.checkpoint["channel_values"]["messages"]
+    ] == ["q0"]
+    assert len(list(saver.list(_config(), limit=2))) == 2
+
+
+# ─── compaction ───────────────────────────────────────────────────────────────
+def test_compact_keeps_the_newest_checkpoints(tmp_path):
+    saver = DeltaSqliteSaver(
+        tmp_path / "c.sqlite3", keep_checkpoints=2, compact_every=1000
+    )
+    _turns(_graph(saver), 4)
+    saver.compact()
+    assert _rows(saver, "checkpoints") == 2
+    assert _contents(saver) == [
+        text for i in range(4) for text in (f"q{i}", f"echo q{i}")
+    ]
+    # every blob left belongs to a checkpoint that is left
+    assert _rows(saver, "blobs") <= 2 * 4
+    saver.close()
+
+
+def test_compact_drops_messages_nothing_references(tmp_path):
+    saver = DeltaSqliteSaver(
+        tmp_path / "c.sqlite3", keep_checkpoints=1, compact_every=1000
+    )
+    graph = _graph(saver)
+    _turns(graph, 2)
+    first = saver.get_tuple(_config()).checkpoint["channel_values"]["messages"][0]
+    graph.update_state(_config(), {"messages": [RemoveMessage(id=first.id)]})
+    assert _rows(saver, "messages") == 4
+    saver.compact()
+    assert _rows(saver, "messages") == 3
+    assert _contents(saver) == ["echo q0", "q1", "echo q1"]
+    saver.close()
+
+
+def test_compaction_runs_on_its_own(tmp_path):
+    saver = DeltaSqliteSaver(
+        tmp_path / "c.sqlite3", keep_checkpoints=3, compact_every=4
+    )
+    _turns(_graph(saver), 6)
+    assert _rows(saver, "checkpoints") <= 3 + 4
+    assert len(_contents(saver)) == 12
+    saver.close()
+
+
+# ─── resume ───────────────────────────────────────────────────────────────────
+def test_history_survives_a_restart(tmp_path):
+    path = tmp_path / "c.sqlite3"
+    # commits are batched, close() has to write out what is pending
+    first = DeltaSqliteSaver(path, commit_every=10_000, commit_interval=3600)
+    _turns(_graph(first), 2)
+    first.close()
+
+    second = DeltaSqliteSaver(path)
+    assert _contents(second) == ["q0", "echo q0", "q1", "echo q1"]
+    _turns(_graph(second), 1, start=2)
+    assert _contents(second)[-2:] == ["q2", "echo q2"]
+    assert _rows(second, "messages") == 6
+    second.close()
+
+
+# ─── async ────────────────────────────────────────────────────────────────────
+def test_async_round_trip_runs_off_the_loop(saver):
+    threads = set()
+    put = saver.put
+
+    def recording_put(*args, **kwargs):
+        threads.add(threading.get_ident())
+        return put(*args, **kwargs)
+
+    saver.put = recording_put
+    graph = _graph(saver)
+
+    async def run():
+        for i in range(2):
+            await graph.ainvoke(
+                {"messages": [HumanMessage(content=f"q{i}")]}, _config()
+            )
+        latest = await saver.aget_tuple(_config())
+        listed = [item async for item in saver.alist(_config(), limit=3)]
+        return threading.get_ident(), latest, listed
+
+    loop_thread, latest, listed = asyncio.run(run())
+    assert [m.content for m in latest.checkpoint["channel_values"]["messages"]] == [
+        "q0",
+        "echo q0",
+        "q1",
+        "echo q1",
+    ]
+    assert len(listed) == 3
+    assert listed[0].config == latest.config
+    assert threads and loop_thread not in threads
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+from trtl.agent.events import Done, Token
+from trtl.daemon.protocol import decode, encode
+from trtl.daemon.server import Daemon
+
+"""
+The daemon runs one request at a time per thread_id, and drops a
+    thread's lock once no request holds or waits for it, so a long lived
+    daemon does not keep one for every conversation it ever served.
+"""
+
+
+class EchoAgent:
+    """answers with the prompt, a token at a time"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.running = 0
+        self.most = 0
+
+    async def aevents(self, prompt: str, thread_id: str, user_id: str):
+        self.running += 1
+        self.most = max(self.most, self.running)
+        try:
+            for word in prompt.split():
+                await asyncio.sleep(self.delay)
+                yield Token(word + " ")
+            yield Done(seconds=0.0)
+        finally:
+            self.running -= 1
+
+
+@pytest.fixture
+def daemon():
+    # tmp_path can be longer than a Unix socket path may be
+    with tempfile.TemporaryDirectory() as directory:
+        yield Daemon(path=os.path.join(directory, "t.sock"), metrics_port=0)
+
+
+# ─── per-thread locks ─────────────────────────────────────────────────────────
+def test_turns_on_one_thread_run_one_after_the_other(daemon):
+    order = []
+
+    async def turn(thread_id: str, name: str):
+        async with daemon._turn(thread_id):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.05)
+            order.append(f"{name} end")
+
+    async def run():
+        await asyncio.gather(turn("a", "first"), turn("a", "second"), turn("b", "b"))
+
+    asyncio.run(run())
+    assert order.index("first end") < order.index("second start")
+    # another thread does not wait for them
+    assert order.index("b start") < order.index("first end")
+    assert daemon._threads == {}
+
+
+def test_a_cancelled_waiter_is_pruned_too(daemon):
+
+    async def hold(release: asyncio.Event):
+        async with daemon._turn("a"):
+            await release.wait()
+
+    async def wait():
+        async with daemon._turn("a"):
+            pass
+
+    async def run():
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(hold(release))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(wait())
+        await asyncio.sleep(0.01)
+        assert daemon._threads["a"][1] == 2
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert daemon._threads["a"][1] == 1
+        release.set()
+        await holder
+
+    asyncio.run(run())
+    assert daemon._threads == {}
+
+
+# ─── over the socket ──────────────────────────────────────────────────────────
+async def _ask(path: str, prompt: str, thread_id: str = "t") -> list:
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(encode({"op": "request", "prompt": prompt, "thread_id": thread_id}))
+    await writer.drain()
+    lines = [decode(line) async for line in reader]
+    writer.close()
+    return lines
+
+
+def test_requests_stream_back_and_leave_no_locks(daemon):
+    daemon.agent = EchoAgent(delay=0.01)
+
+    async def run():
+        server = await asyncio.start_unix_server(daemon._handle, path=str(daemon.path))
+        try:
+            answers = await asyncio.gather(
+                *(_ask(str(daemon.path), f"hello from {i}") for i in range(3)),
+                _ask(str(daemon.path), "other thread", thread_id="u"),
+            )
+        finally:
+            server.close()
+        return answers
+
+    answers = asyncio.run(run())
+    for i in range(3):
+        tokens = [e["text"] for e in answers[i] if e["kind"] == "token"]
+        assert "".join(tokens) == f"hello from {i} "
+        assert answers[i][-1]["kind"] == "done"
+    # the three on thread t one at a time, the one on u next to them
+    assert daemon.agent.most == 2
+    assert daemon.requests == 4
+    assert daemon._threads == {}
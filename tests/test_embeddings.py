@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from trtl.models.embeddings import CachedEmbeddings
+
+"""
+CachedEmbeddings: each distinct text goes to the provider once, and
+    the async methods keep the sqlite work off the event loop.
+"""
+
+
+class Counting(DeterministicFakeEmbedding):
+    texts: list = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.texts.append(text)
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = CachedEmbeddings(
+        Counting(size=8, texts=[]), "fake", path=tmp_path / "e.sqlite3"
+    )
+    yield cache
+    cache.close()
+
+
+def test_each_text_is_embedded_once(cache):
+    first = cache.embed_documents(["a", "b", "a"])
+    # cached vectors come back as float32
+    again = cache.embed_documents(["b", "a"])
+    assert again[0] == pytest.approx(first[1], rel=1e-6)
+    assert cache.embed_query("a") == again[1]
+    assert cache.underlying.texts == ["a", "b"]
+    assert cache.stats()["hits"] == 3
+
+
+def test_async_keeps_sqlite_off_the_loop(cache):
+    threads = set()
+    lookup, store = cache._lookup, cache._store
+
+    def recording_lookup(*args):
+        threads.add(threading.get_ident())
+        return lookup(*args)
+
+    def recording_store(*args):
+        threads.add(threading.get_ident())
+        return store(*args)
+
+    cache._lookup, cache._store = recording_lookup, recording_store
+
+    async def run():
+        vectors = await cache.aembed_documents(["a", "b"])
+        query = await cache.aembed_query("a")
+        return threading.get_ident(), vectors, query
+
+    loop_thread, vectors, query = asyncio.run(run())
+    assert query == pytest.approx(vectors[0], rel=1e-6)
+    assert cache.underlying.texts == ["a", "b"]
+    assert threads and loop_thread not in threads
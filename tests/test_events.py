@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from trtl.agent.events import (
+    Done,
+    EventQueue,
+    Token,
+    ToolCallStarted,
+    ToolOutput,
+    aevents,
+    events,
+)
+
+"""
+The bounded EventQueue between the graph and the frontend: tokens merge
+    into the last queued one, within the window, up to max_chars, and
+    without either limit once the queue is full.
+"""
+
+
+def _drain(queue: EventQueue) -> list:
+    queue.close()
+    return list(iter(queue.get, None))
+
+
+def _stream(*texts: str, node: str = "agent"):
+    for text in texts:
+        yield "messages", (AIMessageChunk(content=text), {"langgraph_node": node})
+
+
+# ─── coalescing ───────────────────────────────────────────────────────────────
+def test_tokens_merge_within_the_window():
+    queue = EventQueue(window=10)
+    for text in ("a", "b", "c"):
+        queue.put(Token(text))
+    assert _drain(queue) == [Token("abc")]
+
+
+def test_merged_tokens_stop_at_max_chars():
+    queue = EventQueue(window=10, max_chars=4)
+    for text in ("ab", "cd", "ef"):
+        queue.put(Token(text))
+    assert _drain(queue) == [Token("abcd"), Token("ef")]
+
+
+def test_only_the_same_stream_merges():
+    queue = EventQueue(window=10)
+    queue.put(Token("a"))
+    queue.put(Token("b", node="summarize"))
+    queue.put(ToolOutput("terminal", "x"))
+    queue.put(ToolOutput("terminal", "y"))
+    queue.put(ToolOutput("terminal", "done", final=True))
+    queue.put(ToolOutput("terminal", "z"))
+    assert _drain(queue) == [
+        Token("a"),
+        Token("b", node="summarize"),
+        ToolOutput("terminal", "xy"),
+        ToolOutput("terminal", "done", final=True),
+        ToolOutput("terminal", "z"),
+    ]
+
+
+def test_no_window_no_merging():
+    queue = EventQueue(window=0)
+    queue.put(Token("a"))
+    queue.put(Token("b"))
+    assert _drain(queue) == [Token("a"), Token("b")]
+
+
+# ─── bounds ───────────────────────────────────────────────────────────────────
+def test_a_full_queue_merges_tokens_instead_of_blocking():
+    queue = EventQueue(max_events=2, window=0, max_chars=1)
+    queue.put(ToolCallStarted("c1", "terminal"))
+    for text in ("a", "b", "c"):
+        queue.put(Token(text))
+    assert _drain(queue) == [ToolCallStarted("c1", "terminal"), Token("abc")]
+
+
+def test_a_full_queue_blocks_other_events():
+    queue = EventQueue(max_events=1, window=0)
+    queue.put(ToolCallStarted("c1", "terminal"))
+    put = threading.Thread(target=queue.put, args=(ToolCallStarted("c2", "terminal"),))
+    put.start()
+    put.join(0.2)
+    assert put.is_alive()
+    assert queue.get().call_id == "c1"
+    put.join(1)
+    assert not put.is_alive()
+    assert queue.get().call_id == "c2"
+
+
+def test_cancel_releases_a_blocked_producer():
+    queue = EventQueue(max_events=1, window=0)
+    queue.put(ToolCallStarted("c1", "terminal"))
+    put = threading.Thread(target=queue.put, args=(ToolCallStarted("c2", "terminal"),))
+    put.start()
+    queue.cancel()
+    put.join(1)
+    assert not put.is_alive()
+
+
+# ─── pumps ────────────────────────────────────────────────────────────────────
+def test_a_slow_consumer_gets_bigger_events():
+    texts = [f"w{i} " for i in range(200)]
+    received = []
+    for event in events(_stream(*texts), max_events=4, window=0):
+        received.append(event)
+        time.sleep(0.005)
+    tokens = [e for e in received if isinstance(e, Token)]
+    assert "".join(t.text for t in tokens) == "".join(texts)
+    assert len(tokens) < len(texts) / 2
+    assert isinstance(received[-1], Done)
+
+
+def test_a_failing_stream_still_ends_with_done():
+    def failing():
+        yield from _stream("partial")
+        raise RuntimeError("model went away")
+
+    received = []
+    with pytest.raises(RuntimeError):
+        for event in events(failing()):
+            received.append(event)
+    assert received[0] == Token("partial")
+    assert received[-1].error == "RuntimeError: model went away"
+
+
+def test_async_events():
+    async def stream():
+        for item in _stream("a", "b", "c"):
+            yield item
+
+    async def collect():
+        return [event async for event in aevents(stream(), window=10)]
+
+    received = asyncio.run(collect())
+    assert received[0] == Token("abc")
+    assert isinstance(received[-1], Done)
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from trtl.tools.executor import ConcurrentToolNode
+
+"""
+ConcurrentToolNode on one model message with several tool calls: they
+    run at once up to max_concurrency, and a call that takes too long
+    comes back as an error ToolMessage instead of holding up the step.
+"""
+
+running = {"now": 0, "most": 0}
+_lock = threading.Lock()
+
+
+def _nap(seconds: float) -> str:
+    with _lock:
+        running["now"] += 1
+        running["most"] = max(running["most"], running["now"])
+    time.sleep(seconds)
+    with _lock:
+        running["now"] -= 1
+    return f"slept {seconds}"
+
+
+@tool
+def nap(seconds: float) -> str:
+    """sleeps for a while"""
+    return _nap(seconds)
+
+
+@tool
+async def anap(seconds: float) -> str:
+    """sleeps for a while without blocking the loop"""
+    await asyncio.sleep(seconds)
+    return f"slept {seconds}"
+
+
+def _message(name: str, *seconds: float) -> dict:
+    calls = [
+        {"name": name, "args": {"seconds": s}, "id": f"call{i}", "type": "tool_call"}
+        for i, s in enumerate(seconds)
+    ]
+    return {"messages": [AIMessage(content="", tool_calls=calls)]}
+
+
+def _invoke(node, message):
+    running.update(now=0, most=0)
+    started = time.monotonic()
+    result = node.invoke(message)
+    return result["messages"], time.monotonic() - started
+
+
+def _ainvoke(node, message):
+    started = time.monotonic()
+    result = asyncio.run(node.ainvoke(message))
+    return result["messages"], time.monotonic() - started
+
+
+# ─── concurrency ──────────────────────────────────────────────────────────────
+def test_calls_run_at_once():
+    messages, elapsed = _invoke(
+        ConcurrentToolNode([nap]), _message("nap", 0.3, 0.3, 0.3)
+    )
+    assert [m.content for m in messages] == ["slept 0.3"] * 3
+    assert elapsed < 0.6
+
+
+def test_concurrency_is_capped():
+    node = ConcurrentToolNode([nap], max_concurrency=2)
+    messages, elapsed = _invoke(node, _message("nap", 0.2, 0.2, 0.2, 0.2))
+    assert all(m.status == "success" for m in messages)
+    assert running["most"] == 2
+    assert elapsed >= 0.4
+
+
+def test_async_calls_run_at_once():
+    messages, elapsed = _ainvoke(
+        ConcurrentToolNode([anap]), _message("anap", 0.3, 0.3, 0.3)
+    )
+    assert [m.content for m in messages] == ["slept 0.3"] * 3
+    assert elapsed < 0.6
+
+
+# ─── timeouts ─────────────────────────────────────────────────────────────────
+def test_a_slow_call_times_out():
+    node = ConcurrentToolNode([nap], timeouts={"nap": 0.2})
+    messages, elapsed = _invoke(node, _message("nap", 0.05, 1.0))
+    assert messages[0].content == "slept 0.05"
+    assert messages[1].status == "error"
+    assert messages[1].tool_call_id == "call1"
+    assert "did not finish within 0.2s" in messages[1].content
+    assert elapsed < 0.6
+
+
+def test_hung_calls_keep_their_slots():
+    # the first call is still running when the second one gives up
+    # waiting for its slot
+    node = ConcurrentToolNode([nap], max_concurrency=1, timeout=0.2)
+    messages, elapsed = _invoke(node, _message("nap", 1.0, 0.05))
+    assert "did not finish" in messages[0].content
+    assert "did not start" in messages[1].content
+    assert elapsed < 0.6
+
+
+def test_async_timeout_cancels_the_call():
+    node = ConcurrentToolNode([anap], max_concurrency=1, timeout=0.2)
+    messages, elapsed = _ainvoke(node, _message("anap", 5.0, 0.05))
+    assert "did not finish within 0.2s" in messages[0].content
+    # the cancelled call gave its slot back
+    assert messages[1].content == "slept 0.05"
+    assert elapsed < 0.6
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from trtl.tools.process import RingBuffer, arun_command, run_command
+
+"""
+run_command / arun_command on real shell commands: output, the wall and
+    idle timeouts, and that a kill takes the whole process group along.
+"""
+
+# prints the pid of a background sleep, then waits on it
+SPAWNS_A_CHILD = "sleep 30 & echo $!; wait"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        return False
+    # a killed child nobody reaped yet is a zombie, as good as gone
+    return stat.rsplit(")", 1)[1].split()[0] != "Z"
+
+
+def _gone(pid: int, within: float = 1.0) -> bool:
+    deadline = time.monotonic() + within
+    while _alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return not _alive(pid)
+
+
+def _run(command: str, **kwargs):
+    return run_command(command, **kwargs)
+
+
+def _arun(command: str, **kwargs):
+    return asyncio.run(arun_command(command, **kwargs))
+
+
+both = pytest.mark.parametrize("run", [_run, _arun], ids=["sync", "async"])
+
+
+# ─── output ───────────────────────────────────────────────────────────────────
+@both
+def test_output_and_returncode(run):
+    chunks = []
+    result = run("echo out; echo err >&2; exit 3", on_output=chunks.append)
+    assert result.returncode == 3
+    assert not result.ok
+    assert result.output.split() == ["out", "err"]
+    assert "".join(chunks) == result.output
+
+
+def test_ring_buffer_keeps_the_tail():
+    buffer = RingBuffer(max_bytes=4)
+    for data in (b"abc", b"def", b"g"):
+        buffer.write(data)
+    assert buffer.text() == "…[3 bytes of earlier output dropped]\ndefg"
+
+
+@both
+def test_only_the_last_bytes_are_kept(run):
+    result = run("seq 1 10000", max_bytes=100)
+    assert result.output.endswith("9999\n10000\n")
+    assert "bytes of earlier output dropped" in result.output
+
+
+# ─── timeouts ─────────────────────────────────────────────────────────────────
+@both
+def test_wall_timeout_kills_the_group(run):
+    started = time.monotonic()
+    result = run(SPAWNS_A_CHILD, timeout=0.5, idle_timeout=10)
+    assert time.monotonic() - started < 3
+    assert result.timed_out == "wall"
+    assert "timed out after 0.5s" in result.describe(0.5, 10)
+    assert _gone(int(result.output.split()[0]))
+
+
+@both
+def test_idle_timeout(run):
+    result = run("echo start; sleep 10", timeout=10, idle_timeout=0.5)
+    assert result.timed_out == "idle"
+    assert result.output == "start\n"
+
+
+@both
+def test_a_background_child_does_not_hold_up_the_result(run):
+    # the child keeps the output pipe open after the command exits
+    started = time.monotonic()
+    result = run("sleep 5 & echo done", timeout=10, idle_timeout=10)
+    assert time.monotonic() - started < 2
+    assert result.ok
+    assert result.output == "done\n"
+
+
+def test_a_cancelled_command_is_killed():
+    pids = []
+
+    async def run():
+        task = asyncio.ensure_future(
+            arun_command(SPAWNS_A_CHILD, on_output=lambda text: pids.append(text))
+        )
+        while not pids:
+            await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert _gone(int(pids[0].split()[0]))
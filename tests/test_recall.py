@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from trtl.agent import Agent
+from trtl.memory.recall import Recall
+
+"""
+The async agent node starts the memory search, fits the history and
+    only then waits for the search: both take SLOW seconds here, run
+    one after the other they would take twice that.
+"""
+
+SLOW = 0.3
+
+
+class SlowContext:
+    def __init__(self, times: dict):
+        self.times = times
+
+    def fit(self, messages, reserved: int = 0):
+        self.times["fit_start"] = time.monotonic()
+        time.sleep(SLOW)
+        self.times["fit_end"] = time.monotonic()
+        return messages
+
+    def total(self, messages) -> int:
+        return 10
+
+    def count_text(self, text: str) -> int:
+        return len(text.split())
+
+
+class SlowRecall(Recall):
+    def __init__(self, times: dict, **kwargs):
+        super().__init__(**kwargs)
+        self.times = times
+
+    async def asearch(self, user_id: str, query: str):
+        self.times["search_start"] = time.monotonic()
+        await asyncio.sleep(SLOW)
+        return ["likes green tea"]
+
+
+def _agent(budget_ms: float, times: dict) -> Agent:
+    # only what the agent node touches, no model client or graph
+    agent = Agent.__new__(Agent)
+    agent.context = SlowContext(times)
+    agent.recall = SlowRecall(times, budget_ms=budget_ms)
+    agent._reserved = 0
+    agent._system_tokens = 0
+    agent.model_with_tools = FakeListChatModel(responses=["ok"])
+    return agent
+
+
+def _node(agent: Agent):
+    state = {"messages": [HumanMessage(content="what do I drink?")]}
+    config = {"configurable": {"user_id": "u", "thread_id": "t"}}
+    started = time.monotonic()
+    result = asyncio.run(agent._acreate_agent(state, config))
+    return result, time.monotonic() - started
+
+
+def test_search_runs_while_the_history_is_fitted():
+    times = {}
+    result, elapsed = _node(_agent(budget_ms=2000, times=times))
+    assert result["recall_memories"] == ["likes green tea"]
+    assert times["search_start"] < times["fit_end"]
+    assert elapsed < 1.7 * SLOW
+
+
+def test_a_budget_shorter_than_fit_plus_search_is_enough():
+    # the search had the whole fit to run, what is left of the budget
+    # after the fit covers the rest of it
+    times = {}
+    result, _ = _node(_agent(budget_ms=1.5 * SLOW * 1000, times=times))
+    assert result["recall_memories"] == ["likes green tea"]
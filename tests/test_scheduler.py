@@ -0,0 +1,58 @@
+import time
+
+from trtl.models.scheduler import RequestScheduler
+
+"""
+RequestScheduler's budgets: no token cap until one is configured or
+    learned from OpenAI's rate limit headers.
+"""
+
+
+class _Response:
+    def __init__(self, headers: dict, total_tokens: int = 0):
+        self.response_metadata = {"headers": headers}
+        self.total_tokens = total_tokens
+
+
+def _usage(response: _Response) -> int:
+    return response.total_tokens
+
+
+def test_no_token_cap_by_default():
+    scheduler = RequestScheduler()
+    started = time.monotonic()
+    for _ in range(5):
+        scheduler.call(lambda: None, "gpt-4o", tokens=25_000)
+    assert time.monotonic() - started < 0.5
+    assert scheduler._models["gpt-4o"].tokens.capacity is None
+
+
+def test_limits_are_learned_from_the_headers():
+    scheduler = RequestScheduler()
+    headers = {
+        "x-ratelimit-limit-requests": "10000",
+        "x-ratelimit-limit-tokens": "2000000",
+        "x-ratelimit-remaining-tokens": "1500000",
+    }
+    scheduler.call(lambda: _Response(headers), "gpt-4o", tokens=100)
+    state = scheduler._models["gpt-4o"]
+    assert state.requests.capacity == 10_000
+    assert state.tokens.capacity == 2_000_000
+    assert state.tokens.level <= 1_500_000
+
+
+def test_configured_limits_win_over_the_headers():
+    scheduler = RequestScheduler({"gpt-4o": (60, 1_000)})
+    headers = {"X-RateLimit-Limit-Tokens": "2000000"}
+    scheduler.call(lambda: _Response(headers), "gpt-4o", tokens=10)
+    assert scheduler._models["gpt-4o"].tokens.capacity == 1_000
+
+
+def test_the_real_usage_is_booked():
+    scheduler = RequestScheduler({"gpt-4o": (60, 10_000)})
+    scheduler.call(
+        lambda: _Response({}, total_tokens=3_000), "gpt-4o", tokens=1_000, usage=_usage
+    )
+    # booked at the 1000 token prompt, settled at the 3000 it really used
+    level = scheduler._models["gpt-4o"].tokens.level
+    assert 7_000 <= level < 7_100
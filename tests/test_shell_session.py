@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from trtl.tools.shell_session import ShellSession, ShellSessions
+
+"""
+ShellSession drives a real bash over a pty: the sentinel marks where a
+    command's output ends, and the shell's state carries over from one
+    command to the next.
+"""
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = ShellSession(cwd=str(tmp_path))
+    yield session
+    session.close()
+
+
+# ─── sentinel ─────────────────────────────────────────────────────────────────
+def test_output_and_exit_code(session):
+    result = session.run("echo one; echo two >&2; false")
+    assert result.output == "one\ntwo\n"
+    assert result.returncode == 1
+
+
+def test_output_without_a_trailing_newline(session):
+    assert session.run("printf 'no newline'").output == "no newline"
+    assert session.run("printf '%s\\n' \"it's quoted\"").output == "it's quoted\n"
+
+
+def test_output_that_looks_like_a_sentinel(session):
+    # the sentinel of another session, and a half one of this session
+    text = "__trtl_000000000000_1_0__\n__trtl_" + session._token
+    result = session.run(f"printf '%s\\n' '{text}'; echo after")
+    assert result.output == f"{text}\nafter\n"
+    assert result.returncode == 0
+
+
+# ─── state ────────────────────────────────────────────────────────────────────
+def test_cd_and_exports_carry_over(session):
+    session.run("cd /tmp && export TRTL_TEST_VALUE=kept")
+    assert session.run("pwd").output == "/tmp\n"
+    assert session.run('echo "$TRTL_TEST_VALUE"').output == "kept\n"
+    assert session.starts == 1
+
+
+def test_exit_restarts_the_shell(session):
+    session.run("cd /tmp")
+    result = session.run("exit 3")
+    assert result.output.endswith("[shell exited]")
+    assert not session.alive
+    result = session.run("pwd")
+    assert result.output.startswith("[shell restarted")
+    assert result.output.endswith(f"{session.cwd}\n")
+    assert session.starts == 2
+
+
+def test_timeout_interrupts_the_command(session):
+    started = time.monotonic()
+    result = session.run("echo start; sleep 10", timeout=0.5, idle_timeout=10)
+    assert time.monotonic() - started < 3
+    assert result.timed_out == "wall"
+    assert result.output.startswith("start\n")
+    # Ctrl+C stopped the command, not the shell
+    assert session.alive
+    assert session.run("echo next").output == "next\n"
+
+
+# ─── reaper ───────────────────────────────────────────────────────────────────
+def test_reaper_skips_busy_sessions():
+    sessions = ShellSessions(idle_seconds=0.2)
+    idle = sessions.get("idle")
+    idle.run("true")
+    busy = sessions.get("busy")
+    running = threading.Thread(target=busy.run, args=("sleep 1",))
+    running.start()
+    time.sleep(0.7)
+    # the idle one is gone, the busy one has been idle on paper for as
+    # long but is still running its command
+    assert "idle" not in sessions._sessions
+    assert not idle.alive
+    assert sessions._sessions.get("busy") is busy
+    running.join()
+    assert busy.alive
+    sessions.close()
+    assert not busy.alive
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from trtl.data.tldr_vectors import TldrVectorRetriever, TldrVectors, export
+
+"""
+TldrVectorRetriever.batch() searches all its queries at once, but each
+    query still shows up to the callbacks as a retriever run.
+"""
+
+DIM = 16
+TEXTS = [f"`tool{i} --flag{i}` does thing {i}" for i in range(10)]
+
+
+class Collection:
+    """just enough of a chroma collection for export()"""
+
+    def __init__(self, embeddings):
+        self.rows = {
+            f"id{i:02d}": (embeddings.embed_query(text), text)
+            for i, text in enumerate(TEXTS)
+        }
+
+    def count(self) -> int:
+        return len(self.rows)
+
+    def get(self, include, limit, offset):
+        ids = sorted(self.rows)[offset : offset + limit]
+        return {
+            "ids": ids,
+            "embeddings": [self.rows[i][0] for i in ids],
+            "documents": [self.rows[i][1] for i in ids],
+            "metadatas": [{"source": i} for i in ids],
+        }
+
+
+class Runs(BaseCallbackHandler):
+    def __init__(self):
+        self.events = []
+
+    def on_retriever_start(self, serialized, query, **kwargs):
+        self.events.append(("start", query))
+
+    def on_retriever_end(self, documents, **kwargs):
+        self.events.append(("end", len(documents)))
+
+    def on_retriever_error(self, error, **kwargs):
+        self.events.append(("error", str(error)))
+
+
+class Broken(DeterministicFakeEmbedding):
+    def embed_documents(self, texts):
+        raise RuntimeError("embeddings down")
+
+    async def aembed_documents(self, texts):
+        raise RuntimeError("embeddings down")
+
+
+@pytest.fixture
+def vectors(tmp_path):
+    export(Collection(DeterministicFakeEmbedding(size=DIM)), tmp_path / "v")
+    return TldrVectors.open(tmp_path / "v")
+
+
+def _retriever(vectors, embeddings=None) -> TldrVectorRetriever:
+    return TldrVectorRetriever(
+        vectors=vectors,
+        embeddings=embeddings or DeterministicFakeEmbedding(size=DIM),
+        k=2,
+    )
+
+
+def _ids(results) -> list:
+    # scores differ in the last bits between one query and several
+    return [[doc.id for doc in docs] for docs in results]
+
+
+def test_batch_matches_invoke(vectors):
+    retriever = _retriever(vectors)
+    queries = TEXTS[:3]
+    batched = retriever.batch(queries)
+    assert [docs[0].page_content for docs in batched] == queries
+    assert _ids(batched) == _ids(retriever.invoke(q) for q in queries)
+    assert _ids(asyncio.run(retriever.abatch(queries))) == _ids(batched)
+
+
+def test_batch_reports_a_run_per_query(vectors):
+    runs = Runs()
+    _retriever(vectors).batch(TEXTS[:2], {"callbacks": [runs]})
+    assert runs.events == [
+        ("start", TEXTS[0]),
+        ("start", TEXTS[1]),
+        ("end", 2),
+        ("end", 2),
+    ]
+
+
+def test_batch_errors(vectors):
+    retriever = _retriever(vectors, Broken(size=DIM))
+    runs = Runs()
+    with pytest.raises(RuntimeError):
+        retriever.batch(TEXTS[:2], {"callbacks": [runs]})
+    assert [event for event, _ in runs.events] == ["start", "start", "error", "error"]
+
+    results = retriever.batch(TEXTS[:2], return_exceptions=True)
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    results = asyncio.run(retriever.abatch(TEXTS[:2], return_exceptions=True))
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+import trtl.models
+from trtl.memory import writer as writer_module
+from trtl.memory.writer import MemoryWriter
+
+"""
+MemoryWriter when the embeddings are down: the batch goes back on the
+    queue, the background thread backs off, and a memory is only given
+    up on after MAX_ATTEMPTS, with a warning that names it.
+"""
+
+
+class Down:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(time.monotonic())
+        raise RuntimeError("embeddings down")
+
+
+@pytest.fixture
+def down(monkeypatch):
+    embeddings = Down()
+    monkeypatch.setattr(trtl.models, "get_embeddings", lambda: embeddings)
+    return embeddings
+
+
+def test_memories_are_dropped_loudly(down, monkeypatch):
+    monkeypatch.setattr(writer_module, "MAX_ATTEMPTS", 2)
+    writer = MemoryWriter(flush_interval=3600)
+    writer.submit("u", "likes green tea")
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    assert writer.stats() == {"pending": 1, "written": 0, "skipped": 0, "dropped": 0}
+    with pytest.warns(UserWarning, match="gave up saving 1 memories.*green tea"):
+        with pytest.raises(RuntimeError):
+            writer.flush()
+    assert writer.stats()["dropped"] == 1
+    assert writer.pending() == 0
+
+
+def test_failing_flushes_back_off(down):
+    writer = MemoryWriter(batch_size=1, flush_interval=0.1)
+    with pytest.warns(UserWarning):
+        writer.submit("u", "likes green tea")
+        time.sleep(0.6)
+    writer.close()
+    # batch_size=1 makes the memory due at once, only the backoff keeps
+    # the thread from spinning on it: tries at about 0, 0.1 and 0.3
+    assert len(down.calls) == writer_module.MAX_ATTEMPTS == 3
+    assert down.calls[2] - down.calls[1] >= 0.2
+    assert writer.stats()["dropped"] == 1